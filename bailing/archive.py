@@ -0,0 +1,263 @@
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import wave
+from datetime import datetime
+
+from bailing import metrics
+
+logger = logging.getLogger(__name__)
+
+# 临时目录中需要回收的单句音频文件：ASR 录音、TTS 合成结果、播放器转换的 wav
+LOOSE_FILE_PATTERNS = ("asr-*", "tts-*")
+
+
+class AudioArchive:
+    """
+    音频归档：热路径只把音频放进内存队列，由后台线程追加写入分段文件
+    每个分段是一个 .pcm 文件(多条 int16 PCM 首尾相接)和一个同名 .idx 索引(每行一条 JSON：偏移、长度、采样率等)，
+    分段写满后轮转，按总大小和保留天数删除最旧的分段。
+    临时目录里的单句音频文件在用完后由后台线程删除；开启归档时，遗留的旧文件定期归并进分段后删除，
+    未开启时不做定期清理，只删除调用方通过 discard 交回的文件。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.enabled = config.get("enabled", False)
+        self.path = config.get("path", "tmp/archive")
+        self.kinds = set(config.get("kinds", ["asr", "tts"]))
+        self.segment_bytes = config.get("segment_mb", 64) * 1024 * 1024
+        self.max_total_bytes = config.get("max_total_mb", 2048) * 1024 * 1024
+        self.max_age = config.get("max_age_days", 7) * 86400
+        # 后台来不及写时，积压超过该大小的新音频直接丢弃，热路径永远不等待磁盘
+        self.max_pending_bytes = config.get("max_pending_mb", 64) * 1024 * 1024
+        self.sweep_dirs = config.get("sweep_dirs", ["tmp/"])
+        self.sweep_age = config.get("sweep_age_s", 300)
+        self.sweep_interval = config.get("sweep_interval_s", 60)
+
+        self.queue = queue.Queue()
+        self.pending_bytes = 0
+        self._pending_lock = threading.Lock()
+        self.segment = None
+        self.segment_size = 0
+        self.pcm_file = None
+        self.index_file = None
+        self.records = metrics.counter("archive.records")
+        self.dropped = metrics.counter("archive.dropped")
+        self.written_bytes = metrics.counter("archive.bytes")
+        self.thread = threading.Thread(target=self._run, daemon=True, name="audio-archive")
+        self.thread.start()
+        logger.info(f"音频归档{'已开启' if self.enabled else '未开启'}，目录 {self.path}")
+
+    def accepts(self, kind):
+        """是否归档这一类音频，调用方可据此跳过只为归档做的转换"""
+        return self.enabled and kind in self.kinds
+
+    def submit(self, kind, audio, sample_rate, **meta):
+        """
+        提交一段音频，立即返回记录编号，未开启或积压过多时返回 None
+        :param audio: int16 PCM，bytes / numpy 数组 / 帧列表均可，转换在后台线程完成
+        """
+        if not self.accepts(kind):
+            return None
+        size = self._size(audio)
+        with self._pending_lock:
+            if self.pending_bytes + size > self.max_pending_bytes:
+                self.dropped.inc()
+                return None
+            self.pending_bytes += size
+        record_id = uuid.uuid4().hex
+        meta.update({"id": record_id, "kind": kind, "sample_rate": sample_rate, "time": time.time()})
+        self.queue.put(("audio", (audio, size, meta)))
+        return record_id
+
+    def discard(self, path):
+        """临时文件用完后交给后台线程删除"""
+        if path:
+            self.queue.put(("discard", path))
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "segment": self.segment,
+            "pending_bytes": self.pending_bytes,
+            "backlog": self.queue.qsize(),
+        }
+
+    @staticmethod
+    def _size(audio):
+        if isinstance(audio, (list, tuple)):
+            return sum(len(frame) for frame in audio)
+        return getattr(audio, "nbytes", None) or len(audio)
+
+    @staticmethod
+    def _to_bytes(audio):
+        if isinstance(audio, (list, tuple)):
+            return b"".join(audio)
+        return audio.tobytes() if hasattr(audio, "tobytes") else bytes(audio)
+
+    def _run(self):
+        last_sweep = 0
+        while True:
+            try:
+                item = self.queue.get(timeout=self.sweep_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    action, payload = item
+                    if action == "audio":
+                        self._write(*payload)
+                    else:
+                        self._remove(payload)
+                if self.enabled and time.time() - last_sweep >= self.sweep_interval:
+                    last_sweep = time.time()
+                    self._sweep()
+                    self._enforce_retention()
+            except Exception as e:
+                logger.error(f"音频归档出错: {e}")
+
+    def _open_segment(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.segment = f"audio-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        self.pcm_file = open(os.path.join(self.path, self.segment + ".pcm"), "ab")
+        self.index_file = open(os.path.join(self.path, self.segment + ".idx"), "a", encoding="utf-8")
+        self.segment_size = 0
+
+    def _close_segment(self):
+        if self.pcm_file is not None:
+            self.pcm_file.close()
+            self.index_file.close()
+        self.pcm_file = self.index_file = self.segment = None
+
+    def _write(self, audio, size, meta):
+        try:
+            data = self._to_bytes(audio)
+            if self.pcm_file is None:
+                self._open_segment()
+            meta["offset"] = self.segment_size
+            meta["length"] = len(data)
+            self.pcm_file.write(data)
+            self.index_file.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            self.pcm_file.flush()
+            self.index_file.flush()
+            self.segment_size += len(data)
+            self.records.inc()
+            self.written_bytes.inc(len(data))
+        finally:
+            with self._pending_lock:
+                self.pending_bytes -= size
+        if self.segment_size >= self.segment_bytes:
+            self._close_segment()
+            self._enforce_retention()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # 文件仍被占用(如 pygame 正在播放)，留给定期清理
+            logger.debug(f"删除临时文件失败 {path}: {e}")
+
+    def _sweep(self):
+        """把临时目录里遗留的单句音频归并进分段文件后删除"""
+        now = time.time()
+        for directory in self.sweep_dirs:
+            for pattern in LOOSE_FILE_PATTERNS:
+                for path in glob.glob(os.path.join(directory, pattern)):
+                    try:
+                        if now - os.path.getmtime(path) < self.sweep_age:
+                            continue
+                    except OSError:
+                        continue
+                    kind = os.path.basename(path).split("-", 1)[0]
+                    if kind in self.kinds:
+                        self._compact_file(path, kind)
+                    self._remove(path)
+
+    def _compact_file(self, path, kind):
+        try:
+            with wave.open(path, "rb") as wf:
+                if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+                    return
+                data = wf.readframes(wf.getnframes())
+                sample_rate = wf.getframerate()
+        except Exception:
+            # mp3/aiff 等非 wav 格式不归档，直接删除
+            return
+        meta = {"id": uuid.uuid4().hex, "kind": kind, "sample_rate": sample_rate,
+                "time": os.path.getmtime(path), "source": os.path.basename(path)}
+        self._write(data, 0, meta)
+
+    def segments(self):
+        """按时间从旧到新返回分段名"""
+        return sorted(os.path.basename(p)[:-4] for p in glob.glob(os.path.join(self.path, "audio-*.idx")))
+
+    def _enforce_retention(self):
+        segments = [s for s in self.segments() if s != self.segment]
+        sizes = {}
+        for name in segments:
+            sizes[name] = sum(os.path.getsize(os.path.join(self.path, name + ext))
+                              for ext in (".pcm", ".idx") if os.path.exists(os.path.join(self.path, name + ext)))
+        total = sum(sizes.values()) + self.segment_size
+        now = time.time()
+        for name in segments:
+            expired = now - os.path.getmtime(os.path.join(self.path, name + ".idx")) > self.max_age
+            if not expired and total <= self.max_total_bytes:
+                break
+            for ext in (".pcm", ".idx"):
+                self._remove(os.path.join(self.path, name + ext))
+            total -= sizes[name]
+            logger.info(f"删除归档分段 {name}({'过期' if expired else '超出总大小'})")
+
+
+def iter_records(path, segment):
+    """读取一个分段中的所有记录，返回 (meta, pcm bytes)"""
+    with open(os.path.join(path, segment + ".idx"), encoding="utf-8") as index_file, \
+            open(os.path.join(path, segment + ".pcm"), "rb") as pcm_file:
+        for line in index_file:
+            meta = json.loads(line)
+            pcm_file.seek(meta["offset"])
+            yield meta, pcm_file.read(meta["length"])
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive(config=None):
+    """进程内共享的归档实例，第一次调用时按配置创建，未配置时只负责清理临时文件"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = AudioArchive(config)
+        return _archive
+
+
+if __name__ == "__main__":
+    # 查看归档并导出单条记录：python -m bailing.archive tmp/archive [记录编号 输出.wav]
+    import sys
+
+    archive_path = sys.argv[1] if len(sys.argv) > 1 else "tmp/archive"
+    names = sorted(os.path.basename(p)[:-4] for p in glob.glob(os.path.join(archive_path, "audio-*.idx")))
+    for name in names:
+        for record, pcm in iter_records(archive_path, name):
+            if len(sys.argv) > 3 and record["id"] == sys.argv[2]:
+                with wave.open(sys.argv[3], "wb") as out:
+                    out.setnchannels(1)
+                    out.setsampwidth(2)
+                    out.setframerate(record["sample_rate"])
+                    out.writeframes(pcm)
+                print(f"已导出到 {sys.argv[3]}")
+                sys.exit(0)
+            if len(sys.argv) <= 3:
+                seconds = len(pcm) / 2 / record["sample_rate"]
+                print(f"{name} {record['id']} {record['kind']:4s} "
+                      f"{datetime.fromtimestamp(record['time']):%Y-%m-%d %H:%M:%S} {seconds:.2f}s")
@@ -1,18 +1,34 @@
 import os
+import queue
+import threading
+import time
 import uuid
 import wave
 from abc import ABC, abstractmethod
 import logging
-from datetime import datetime
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
+import numpy as np
 from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 
+from bailing import metrics
+from bailing.archive import get_archive
+from bailing.model_pool import ModelPool
+from bailing.resources import get_resources
 
-logger = logging.getLogger(__name__)
+try:
+    from funasr_onnx import SenseVoiceSmall as SenseVoiceSmallOnnx
+except ImportError:  # 可选依赖：pip install funasr-onnx onnxruntime
+    SenseVoiceSmallOnnx = None
 
+logger = logging.getLogger(__name__)
 
 class ASR(ABC):
+    # 从 ModelPool 获取的模型，会话结束时释放
+    model_keys = ()
+    # 流式识别：边说边喂入 feed()，说完调用 finish() 取最终结果
+    streaming = False
     @staticmethod
     def _save_audio_to_file(audio_data, file_path):
         """将音频数据保存为WAV文件"""
@@ -27,42 +43,308 @@ class ASR(ABC):
             logger.error(f"保存音频文件时发生错误: {e}")
             raise
 
+    @staticmethod
+    def frames_to_array(frames):
+        """
+        int16 PCM 帧列表转成一块连续的 float32 数组(-1~1)
+        预分配目标数组，逐帧转换写入对应位置，不经过 b''.join 的中间拷贝
+        """
+        total = sum(len(frame) for frame in frames) // 2
+        audio = np.empty(total, dtype=np.float32)
+        offset = 0
+        for frame in frames:
+            samples = np.frombuffer(frame, dtype=np.int16)
+            np.multiply(samples, np.float32(1.0 / 32768), out=audio[offset:offset + len(samples)])
+            offset += len(samples)
+        return audio
+
+    @staticmethod
+    def _archive(stream_in_audio):
+        """录音交给后台归档，返回归档记录编号，未开启归档时返回 None"""
+        return get_archive().submit("asr", list(stream_in_audio), 16000)
+
+    def feed(self, frame):
+        """流式识别喂入一帧，识别文本有更新时返回当前的完整文本，否则返回 None"""
+        raise NotImplementedError("ASR does not support streaming")
+
+    def finish(self):
+        """流式识别结束，返回 (最终文本, 录音文件)"""
+        raise NotImplementedError("ASR does not support streaming")
+
     @abstractmethod
     def recognizer(self, stream_in_audio):
         """处理输入音频流并返回识别的文本，子类必须实现"""
         pass
 
+    def close(self):
+        """会话结束时释放共享模型的引用"""
+        pool = ModelPool()
+        for key in self.model_keys:
+            pool.release(key)
+        self.model_keys = ()
+
+
+class ASRBatchService:
+    """
+    跨会话的 ASR 微批处理服务
+    在 window_ms 时间窗口内收集所有会话提交的语音，最多 max_batch_size 条，
+    合并成一次 generate 调用，再把各自的识别文本返回给调用方
+    """
+
+    def __init__(self, model, max_batch_size=8, window_ms=30):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self.request_queue = queue.Queue()
+        # 批次数与条数，两者相除即平均批大小
+        self.batch_calls = metrics.counter("asr.batch.calls")
+        self.batch_items = metrics.counter("asr.batch.items")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"ASR 微批处理服务已启动，max_batch_size={max_batch_size}, window_ms={window_ms}")
+
+    def submit(self, audio_input) -> Future:
+        future = Future()
+        self.request_queue.put((audio_input, future))
+        return future
+
+    def _collect_batch(self):
+        batch = [self.request_queue.get()]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            inputs = [audio_input for audio_input, _ in batch]
+            try:
+                with get_resources().slot("FunASR"):
+                    res = self.model.generate(
+                        input=inputs,
+                        cache={},
+                        language="auto",
+                        use_itn=True,
+                        batch_size=len(inputs),
+                    )
+                self.batch_calls.inc()
+                self.batch_items.inc(len(inputs))
+                if len(res) != len(batch):
+                    raise RuntimeError(f"识别结果数量 {len(res)} 与输入数量 {len(batch)} 不一致")
+                for (_, future), r in zip(batch, res):
+                    # 调用方等待超时后会取消 future
+                    if not future.done():
+                        future.set_result(rich_transcription_postprocess(r["text"]))
+            except Exception as e:
+                logger.error(f"ASR 批量识别出错: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
 
 class FunASR(ASR):
     def __init__(self, config):
         self.model_dir = config.get("model_dir")
         self.output_dir = config.get("output_file")
 
-        self.model = AutoModel(
+        # 模型进程内共享，多个会话只加载一次
+        self.model_key = ("FunASR", self.model_dir)
+        self.model = ModelPool().get(self.model_key, lambda: AutoModel(
             model=self.model_dir,
             vad_kwargs={"max_single_segment_time": 30000},
             disable_update=True,
             hub="hf"
             # device="cuda:0",  # 如果有GPU，可以解开这行并指定设备
-        )
+        ))
+        self.model_keys = [self.model_key]
 
-    def recognizer(self, stream_in_audio):
-        try:
-            tmpfile = os.path.join(self.output_dir, f"asr-{datetime.now().date()}@{uuid.uuid4().hex}.wav")
-            self._save_audio_to_file(stream_in_audio, tmpfile)
+        # 跨会话微批处理，默认关闭
+        batch_config = config.get("batch") or {}
+        self.batch_service = None
+        if batch_config.get("enabled", False):
+            self.batch_service = ModelPool().get(("FunASRBatch", self.model_dir), lambda: ASRBatchService(
+                self.model,
+                max_batch_size=batch_config.get("max_batch_size", 8),
+                window_ms=batch_config.get("window_ms", 30),
+            ))
+            self.model_keys.append(("FunASRBatch", self.model_dir))
+        # 等待批量识别结果的超时，避免服务异常时会话一直阻塞
+        self.batch_timeout = batch_config.get("timeout_s", 30)
+        self.latency = metrics.latency("asr.batch" if self.batch_service else "asr.single")
 
+    def _generate(self, audio_input):
+        if self.batch_service is not None:
+            future = self.batch_service.submit(audio_input)
+            try:
+                return future.result(timeout=self.batch_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise RuntimeError(f"等待批量识别结果超过 {self.batch_timeout} 秒")
+        with get_resources().slot("FunASR"):
             res = self.model.generate(
-                input=tmpfile,
+                input=audio_input,
                 cache={},
                 language="auto",  # 语言选项: "zn", "en", "yue", "ja", "ko", "nospeech"
                 use_itn=True,
                 batch_size_s=60,
             )
+        return rich_transcription_postprocess(res[0]["text"])
 
-            text = rich_transcription_postprocess(res[0]["text"])
+    def recognizer(self, stream_in_audio):
+        try:
+            start_time = time.time()
+            # 直接把内存中的音频交给模型，不再写临时 wav 再读回
+            text = self._generate(self.frames_to_array(stream_in_audio))
+            self.latency.add(time.time() - start_time)
+            logger.info(f"识别文本: {text}")
+            return text, self._archive(stream_in_audio)
+
+        except Exception as e:
+            logger.error(f"ASR识别过程中发生错误: {e}")
+            return None, None
+
+
+class FunASRStreaming(ASR):
+    """
+    流式识别(paraformer-zh-streaming)：用户说话时每凑满一个 chunk(默认 600ms)就识别一次，
+    中间结果通过回调推给前端；说完只需识别最后不足一个 chunk 的尾巴，几乎不增加等待时间。
+    模型进程内共享，流式 cache 每个会话一份
+    """
+    streaming = True
+
+    def __init__(self, config):
+        self.model_dir = config.get("model_dir", "paraformer-zh-streaming")
+        self.output_dir = config.get("output_file")
+        # [0, 10, 5]：每块 10 * 60ms = 600ms，向后看 5 * 60ms
+        self.chunk_size = config.get("chunk_size", [0, 10, 5])
+        self.encoder_chunk_look_back = config.get("encoder_chunk_look_back", 4)
+        self.decoder_chunk_look_back = config.get("decoder_chunk_look_back", 1)
+        self.chunk_stride = self.chunk_size[1] * 960
+
+        self.model_key = ("FunASRStreaming", self.model_dir)
+        pool = ModelPool()
+        self.model = pool.get(self.model_key, lambda: AutoModel(model=self.model_dir, disable_update=True))
+        self.lock = pool.infer_lock(self.model_key)
+        self.model_keys = [self.model_key]
+        self.latency = metrics.latency("asr.stream.final")
+        self.chunk_latency = metrics.latency("asr.stream.chunk")
+
+        # 当前 chunk 的音频直接写入预分配的缓冲区
+        self.buffer = np.empty(self.chunk_stride, dtype=np.float32)
+        self.reset_stream()
+
+    def reset_stream(self):
+        self.cache = {}
+        self.filled = 0
+        self.text = ""
+        self.frames = []
+
+    def _decode(self, chunk, is_final):
+        start_time = time.time()
+        with get_resources().slot("FunASRStreaming"), self.lock:
+            res = self.model.generate(
+                input=chunk,
+                cache=self.cache,
+                is_final=is_final,
+                chunk_size=self.chunk_size,
+                encoder_chunk_look_back=self.encoder_chunk_look_back,
+                decoder_chunk_look_back=self.decoder_chunk_look_back,
+            )
+        self.chunk_latency.add(time.time() - start_time)
+        text = res[0]["text"] if res else ""
+        self.text += text
+        return bool(text)
+
+    def feed(self, frame):
+        self.frames.append(frame)
+        samples = np.frombuffer(frame, dtype=np.int16)
+        updated = False
+        while len(samples):
+            n = min(len(samples), self.chunk_stride - self.filled)
+            np.multiply(samples[:n], np.float32(1.0 / 32768), out=self.buffer[self.filled:self.filled + n])
+            self.filled += n
+            samples = samples[n:]
+            if self.filled == self.chunk_stride:
+                updated = self._decode(self.buffer, is_final=False) or updated
+                self.filled = 0
+        return self.text if updated else None
+
+    def finish(self):
+        start_time = time.time()
+        try:
+            self._decode(self.buffer[:self.filled], is_final=True)
+            text = self.text
+            tmpfile = self._archive(self.frames)
+            self.latency.add(time.time() - start_time)
             logger.info(f"识别文本: {text}")
             return text, tmpfile
+        except Exception as e:
+            logger.error(f"ASR识别过程中发生错误: {e}")
+            return None, None
+        finally:
+            self.reset_stream()
+
+    def recognizer(self, stream_in_audio):
+        """整句识别，兼容非流式的调用方式"""
+        self.reset_stream()
+        try:
+            for frame in stream_in_audio:
+                self.feed(frame)
+        except Exception as e:
+            logger.error(f"ASR识别过程中发生错误: {e}")
+            self.reset_stream()
+            return None, None
+        return self.finish()
+
+
+class SenseVoiceOnnxASR(ASR):
+    """
+    SenseVoiceSmall 的 ONNX 版本，用 onnxruntime 在 CPU 上推理，可选 int8 量化模型(model_quant.onnx)，
+    没有 GPU 时比 PyTorch 版本快，输出同样经过 rich_transcription_postprocess
+    """
+
+    def __init__(self, config):
+        if SenseVoiceSmallOnnx is None:
+            raise RuntimeError("SenseVoiceOnnxASR 需要安装 funasr-onnx 和 onnxruntime")
+        self.model_dir = config.get("model_dir", "iic/SenseVoiceSmall")
+        self.output_dir = config.get("output_file")
+        self.quantize = config.get("quantize", True)
+        # onnxruntime 单次推理使用的线程数，多会话并发时调小，避免线程争抢
+        self.intra_op_num_threads = config.get("intra_op_num_threads") or \
+            get_resources().threads("SenseVoiceOnnxASR", 4)
+        self.language = config.get("language", "auto")
+        self.use_itn = config.get("use_itn", True)
 
+        self.model_key = ("SenseVoiceOnnx", self.model_dir, self.quantize, self.intra_op_num_threads)
+        self.model = ModelPool().get(self.model_key, lambda: SenseVoiceSmallOnnx(
+            self.model_dir,
+            batch_size=1,
+            quantize=self.quantize,
+            intra_op_num_threads=self.intra_op_num_threads,
+        ))
+        self.model_keys = [self.model_key]
+        self.latency = metrics.latency("asr.onnx")
+
+    def _generate(self, audio_input):
+        # onnxruntime 的 session.run 是线程安全的，不需要推理锁
+        with get_resources().slot("SenseVoiceOnnxASR"):
+            res = self.model(audio_input, language=self.language, use_itn=self.use_itn)
+        return rich_transcription_postprocess(res[0])
+
+    def recognizer(self, stream_in_audio):
+        try:
+            start_time = time.time()
+            text = self._generate(self.frames_to_array(stream_in_audio))
+            self.latency.add(time.time() - start_time)
+            logger.info(f"识别文本: {text}")
+            return text, self._archive(stream_in_audio)
         except Exception as e:
             logger.error(f"ASR识别过程中发生错误: {e}")
             return None, None
@@ -75,4 +357,102 @@ def create_instance(class_name, *args, **kwargs):
         # 创建并返回实例
         return cls(*args, **kwargs)
     else:
-        raise ValueError(f"Class {class_name} not found")
\ No newline at end of file
+        raise ValueError(f"Class {class_name} not found")
+
+
+def _edit_distance(ref, hyp):
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def benchmark_onnx(fixture_dir, threads=4):
+    """
+    在同一批 wav 上对比 PyTorch 与 ONNX(int8) 后端的实时率和字错率
+    wav 同名的 .txt 为参考文本，没有参考文本时以 PyTorch 版本的结果为参考
+    """
+    import re
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.endswith(".wav"):
+            continue
+        with wave.open(os.path.join(fixture_dir, name), "rb") as wf:
+            pcm = wf.readframes(wf.getnframes())
+        ref_file = os.path.join(fixture_dir, name[:-4] + ".txt")
+        ref = open(ref_file, encoding="utf-8").read().strip() if os.path.exists(ref_file) else None
+        fixtures.append((name, [pcm[i:i + 1024] for i in range(0, len(pcm), 1024)], len(pcm) / 2 / 16000, ref))
+
+    def normalize(text):
+        return re.sub(r"[^\w]", "", text or "").lower()
+
+    backends = {
+        "pytorch": FunASR({"model_dir": "FunAudioLLM/SenseVoiceSmall", "output_file": "tmp/"}),
+        "onnx-int8": SenseVoiceOnnxASR({"model_dir": "iic/SenseVoiceSmall", "output_file": "tmp/",
+                                        "quantize": True, "intra_op_num_threads": threads}),
+    }
+    results = {}
+    for backend_name, backend in backends.items():
+        backend.recognizer(fixtures[0][1])  # 预热
+        cost, audio_seconds, texts = 0.0, 0.0, {}
+        for name, frames, seconds, _ in fixtures:
+            start = time.time()
+            texts[name], _ = backend.recognizer(frames)
+            cost += time.time() - start
+            audio_seconds += seconds
+        results[backend_name] = texts
+        print(f"{backend_name:10s} RTF {cost / audio_seconds:.3f}")
+    for backend_name, texts in results.items():
+        errors, total = 0, 0
+        for name, _, _, ref in fixtures:
+            ref = normalize(ref if ref is not None else results["pytorch"][name])
+            errors += _edit_distance(ref, normalize(texts[name]))
+            total += max(1, len(ref))
+        print(f"{backend_name:10s} CER {errors / total:.2%}")
+
+
+if __name__ == "__main__":
+    # 对比临时文件/内存识别，以及逐条识别与微批处理：python -m bailing.asr test.wav 16
+    # 对比 PyTorch 与 ONNX 后端：python -m bailing.asr onnx tests/fixtures/ 4
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    if sys.argv[1] == "onnx":
+        benchmark_onnx(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 4)
+        sys.exit(0)
+
+    wav_file = sys.argv[1]
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with wave.open(wav_file, "rb") as wf:
+        pcm_data = wf.readframes(wf.getnframes())
+    # 按 512 采样点切帧，和 VAD 输出的语音帧一致
+    frames = [pcm_data[i:i + 1024] for i in range(0, len(pcm_data), 1024)]
+
+    asr = FunASR({"model_dir": "FunAudioLLM/SenseVoiceSmall", "output_file": "tmp/"})
+    asr._generate(asr.frames_to_array(frames))  # 预热
+    for name in ("file", "memory"):
+        costs = []
+        for _ in range(20):
+            start = time.time()
+            if name == "file":
+                path = os.path.join("tmp", f"asr-bench-{uuid.uuid4().hex}.wav")
+                asr._save_audio_to_file(frames, path)
+                asr._generate(path)
+                os.remove(path)
+            else:
+                asr._generate(asr.frames_to_array(frames))
+            costs.append(time.time() - start)
+        costs.sort()
+        print(f"{name:6s} 每句平均 {sum(costs) / len(costs) * 1000:.1f} ms, p50 {costs[len(costs) // 2] * 1000:.1f} ms")
+
+    for enabled in (False, True):
+        asr = FunASR({"model_dir": "FunAudioLLM/SenseVoiceSmall", "output_file": "tmp/",
+                      "batch": {"enabled": enabled, "max_batch_size": concurrency, "window_ms": 30}})
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: asr.recognizer(frames), range(concurrency * 4)))
+        print(f"batch={enabled}, 总耗时 {time.time() - start:.2f} 秒")
+    print(metrics.snapshot())
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bailing.bounded_queue import create_queue
+from bailing.dialogue import Message
+from bailing.robot import Robot
+from bailing.vad import drain_queue
+from bailing.utils import SentenceSegmenter
+
+logger = logging.getLogger(__name__)
+
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor(max_workers=4):
+    """所有 AsyncRobot 共享的模型推理线程池"""
+    global _cpu_executor
+    with _cpu_executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bailing-cpu")
+        return _cpu_executor
+
+
+class AsyncRobot(Robot):
+    """
+    asyncio 运行模式，用于 WebSocket 服务
+    VAD、ASR、LLM 流式输出、TTS 和音频发送都是服务端事件循环上的协程，
+    只有模型推理等 CPU 密集的调用放到进程共享的线程池中执行，会话本身不再创建线程，
+    工具调用和上下文摘要也使用这个共享线程池
+    """
+    shared_executor = True
+
+    def __init__(self, config_file, websocket=None, loop=None):
+        super().__init__(config_file, websocket, loop)
+        self.cpu_executor = self.executor
+        # 以下配置只在线程模式下生效，这里明确关闭，避免看起来开启了却没有效果
+        if self.speculative:
+            logger.warning("asyncio 模式不支持推测执行，已关闭 Speculative")
+            self.speculative = False
+        if getattr(self.vad, "scheduler", None) is not None:
+            logger.warning("asyncio 模式下 VAD 在各会话的协程中按批处理，忽略 VAD batch 配置")
+            self.vad.scheduler = None
+        self.websocket = websocket
+        self.audio_queue = create_queue("audio", self.queue_config, use_asyncio=True)
+        # 按顺序保存 TTS 任务，保证播放顺序
+        self.tts_queue = create_queue("tts", self.queue_config, use_asyncio=True)
+        self.loop = loop
+        self.run_task = None
+        self.sender_task = None
+        self.chat_task = None
+        self.close_task = None
+
+    def _create_executor(self):
+        runtime_config = self.config.get("AsyncRuntime") or {}
+        return get_cpu_executor(runtime_config.get("cpu_workers", 4))
+
+    async def _run_cpu(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.cpu_executor, func, *args)
+
+    def start(self):
+        """在当前事件循环中启动会话"""
+        self.run_task = asyncio.create_task(self.run())
+        return self.run_task
+
+    async def run(self):
+        self.recorder.start_recording(self.audio_queue)
+        self.sender_task = asyncio.create_task(self._tts_sender())
+        logger.info("AsyncRobot started.")
+        try:
+            while not self.stop_event.is_set():
+                # 有积压时一次取出多帧批量处理，尽快追上实时
+                frames = drain_queue(self.audio_queue, await self.audio_queue.get(), self.vad_max_drain)
+                vad_results = await self._run_cpu(self.vad.is_vad_batch, frames)
+                for data, vad_statue in zip(frames, vad_results):
+                    await self._duplex_async({"voice": data, "vad_statue": vad_statue})
+        except asyncio.CancelledError:
+            logger.info("AsyncRobot cancelled.")
+        finally:
+            # 这里只取消协程，会阻塞的资源释放由 aclose() 在线程池中完成
+            self._cancel_tasks()
+
+    def queue_stats(self):
+        stages = {"audio": self.audio_queue, "tts": self.tts_queue}
+        return {name: q.stats() for name, q in stages.items() if hasattr(q, "stats")}
+
+    def interrupt_playback(self):
+        """中断当前的语音播放，同时丢弃还未发送的 TTS 结果"""
+        while not self.tts_queue.empty():
+            self.tts_queue.get_nowait()[1].cancel()
+        super().interrupt_playback()
+
+    def attach_websocket(self, websocket, loop):
+        self.websocket = websocket
+        super().attach_websocket(websocket, loop)
+
+    def _cancel_tasks(self):
+        current = asyncio.current_task()
+        for task in (self.run_task, self.sender_task, self.chat_task):
+            if task is not None and task is not current and not task.done():
+                task.cancel()
+
+    def shutdown(self):
+        """
+        可在任意线程调用：事件循环线程中转交 aclose() 异步完成，不阻塞事件循环；
+        其他线程中先在事件循环上取消协程，再直接释放资源
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None:
+            if self.close_task is None:
+                self.close_task = running.create_task(self.aclose())
+            return
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._cancel_tasks)
+        super().shutdown()
+
+    async def aclose(self):
+        """在事件循环中取消会话协程，会阻塞的资源释放放到线程池中执行"""
+        self._cancel_tasks()
+        await asyncio.get_running_loop().run_in_executor(None, super().shutdown)
+
+    async def _duplex_async(self, data):
+        # 识别到vad开始
+        if self.vad_start:
+            await self._append_speech_async(data)
+        vad_status = data.get("vad_statue")
+        # 空闲的时候，取出耗时任务进行播放
+        if not self.task_queue.empty() and not self.vad_start and vad_status is None \
+                and not self.player.get_playing_status() and self.chat_lock is False:
+            result = self.task_queue.get()
+            self._new_turn()
+            await self._speak_async(result.response)
+
+        if vad_status is None:
+            return
+        if "start" in vad_status:
+            if self.player.get_playing_status() or self.chat_lock is True:  # 正在播放，打断场景
+                if self.INTERRUPT and self._awake():
+                    self.chat_lock = False
+                    self.interrupt_playback()
+                    self.vad_start = True
+                    await self._append_speech_async(data)
+                else:
+                    return
+            else:  # 没有播放，正常
+                self.vad_start = True
+                await self._append_speech_async(data)
+        elif "end" in vad_status and len(self.speech) > 0:
+            passed, streamed = self._end_segment()
+            if not passed:
+                return
+            logger.debug(f"语音包的长度：{len(self.speech)}")
+            self.vad_start = False
+            voice_data = [d["voice"] for d in self.speech]
+            self.speech = []
+            try:
+                if self.asr.streaming and streamed:
+                    text, tmpfile = await self._run_cpu(self.asr.finish)
+                else:
+                    text, tmpfile = await self._run_cpu(self.asr.recognizer, voice_data)
+            except Exception as e:
+                logger.error(f"ASR识别出错: {e}")
+                return
+            if not text or not text.strip():
+                logger.debug("识别结果为空，跳过处理。")
+                return
+
+            logger.debug(f"ASR识别结果: {text}")
+            if self.callback:
+                self.callback({"role": "user", "content": str(text)})
+            self.chat_task = asyncio.create_task(self.chat_async(text))
+
+    async def _append_speech_async(self, data):
+        self.speech.append(data)
+        if self.wake_gate is not None and self.wake_gate.listening():
+            await self._run_cpu(self.wake_gate.feed, data["voice"])
+            return
+        if self.asr.streaming:
+            self._push_partial(await self._run_cpu(self.asr.feed, data["voice"]))
+
+    def _synthesize(self, text):
+        """在线程池中执行：TTS 并读出 wav 数据，流式下行时直接返回 PCM"""
+        tts_file = self.speak_and_play(text)
+        if not tts_file or isinstance(tts_file, tuple):
+            return tts_file
+        wav_file = self.player.to_wav(tts_file)
+        with open(wav_file, "rb") as f:
+            wav_data = f.read()
+        self.archive.discard(wav_file)
+        return wav_data
+
+    async def _speak_async(self, text):
+        future = asyncio.ensure_future(self._run_cpu(self._synthesize, text))
+        item = (self.turn_id, future)
+        if getattr(self.tts_queue, "policy", "block") == "block":
+            # 阻塞策略：等待发送协程腾出位置，不丢弃句子
+            await self.tts_queue.put(item)
+        else:
+            # 其他策略由队列自己决定丢弃哪一项，并取消被丢弃的任务
+            self.tts_queue.put_nowait(item)
+
+    async def _tts_sender(self):
+        while not self.stop_event.is_set():
+            turn_id, future = await self.tts_queue.get()
+            try:
+                wav_data = await asyncio.wait_for(future, timeout=10)
+            except asyncio.TimeoutError:
+                logger.error("TTS 任务超时")
+                continue
+            except asyncio.CancelledError:
+                if self.stop_event.is_set():
+                    raise
+                continue
+            except Exception as e:
+                logger.error(f"TTS 任务出错: {e}")
+                continue
+            if wav_data is None or len(wav_data) == 0:
+                continue
+            try:
+                if isinstance(wav_data, tuple):
+                    await self._send_pcm(turn_id, *wav_data)
+                else:
+                    logger.info(f"websocket 发送音频：{len(wav_data)} 字节")
+                    await self.websocket.send_bytes(wav_data)
+            except Exception as e:
+                logger.error(f"发送音频失败: {e}")
+
+    async def _send_pcm(self, turn_id, pcm, sample_rate):
+        for seq, frame in self.player.make_chunks(pcm, sample_rate, turn_id):
+            # 打断后本轮剩余的块直接丢弃
+            if turn_id != self.player.active_turn:
+                self.player.dropped_chunks += 1
+                continue
+            await self.websocket.send_bytes(frame)
+
+    async def chat_tool_async(self, query):
+        segmenter = SentenceSegmenter(self.segmenter_config)
+        tool_call_flag = False
+        response_message = []
+        # tool call 参数
+        function_name = None
+        function_id = None
+        function_arguments = ""
+        content_arguments = ""
+        try:
+            llm_responses = self.llm.aresponse_call(self.dialogue.get_llm_dialogue(),
+                                                    self.task_manager.get_functions(), self.cpu_executor)
+            async for content, tools_call in llm_responses:
+                if content is not None and len(content) > 0:
+                    if len(response_message) <= 0 and content == "```":
+                        tool_call_flag = True
+                if tools_call is not None:
+                    tool_call_flag = True
+                    if tools_call[0].id is not None:
+                        function_id = tools_call[0].id
+                    if tools_call[0].function.name is not None:
+                        function_name = tools_call[0].function.name
+                    if tools_call[0].function.arguments is not None:
+                        function_arguments += tools_call[0].function.arguments
+                if content is not None and len(content) > 0:
+                    if tool_call_flag:
+                        content_arguments += content
+                    else:
+                        response_message.append(content)
+                        segment_text = segmenter.push(content)
+                        if segment_text:
+                            await self._speak_async(segment_text)
+        except Exception as e:
+            logger.error(f"LLM 处理出错 {query}: {e}")
+            return []
+
+        if not tool_call_flag:
+            segment_text = segmenter.flush()
+            if segment_text:
+                await self._speak_async(segment_text)
+            return response_message
+
+        # 工具可能是网络请求等阻塞调用，放到线程池中执行
+        speak_text, call_again = await self._run_cpu(
+            self._handle_tool_call, function_name, function_id, function_arguments, content_arguments)
+        if speak_text is not None:
+            await self._speak_async(speak_text)
+            return [speak_text]
+        if call_again:
+            return await self.chat_tool_async(query)
+        return []
+
+    async def chat_async(self, query):
+        self._new_turn()
+        self.dialogue.put(Message(role="user", content=query))
+        response_message = []
+        self.chat_lock = True
+        try:
+            if self.start_task_mode:
+                response_message = await self.chat_tool_async(query)
+            else:
+                segmenter = SentenceSegmenter(self.segmenter_config)
+                async for content in self.llm.aresponse(self.dialogue.get_llm_dialogue(), self.cpu_executor):
+                    if not content:
+                        continue
+                    response_message.append(content)
+                    segment_text = segmenter.push(content)
+                    if segment_text:
+                        await self._speak_async(segment_text)
+                # 处理剩余的响应
+                segment_text = segmenter.flush()
+                if segment_text:
+                    await self._speak_async(segment_text)
+        except Exception as e:
+            logger.error(f"LLM 处理出错 {query}: {e}")
+        finally:
+            self.chat_lock = False
+        # 更新对话
+        if self.callback:
+            self.callback({"role": "assistant", "content": "".join(response_message)})
+        self.dialogue.put(Message(role="assistant", content="".join(response_message)))
+        # 只是把新消息放入后台写入队列，不阻塞事件循环
+        self.dialogue.dump_dialogue()
+        return True
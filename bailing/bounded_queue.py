@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import queue
+
+import numpy as np
+
+from bailing import metrics
+
+logger = logging.getLogger(__name__)
+
+# 队列满时的处理策略
+#   block:       阻塞等待（queue.Queue 默认行为），asyncio 队列则抛 QueueFull
+#   drop_oldest: 丢弃最旧的一项
+#   drop_newest: 丢弃新来的一项
+#   drop_silent: 优先丢弃最旧的静音帧，没有静音帧时丢弃最旧的一项
+#   skip_ahead:  清空积压，直接跳到最新的实时音频
+# 各策略都只丢弃普通音频帧：VAD 的 start/end 事件、唤醒线程用的 None，
+# 以及队列的 protect 判定为需要保留的项(如正在播放的这一轮的 PCM 块)一定保留，
+# 全是这类项时允许暂时超过 maxsize；被丢弃的项中带有 future 的(TTS 任务)会被取消
+POLICIES = ("block", "drop_oldest", "drop_newest", "drop_silent", "skip_ahead")
+
+
+def _frame_data(item):
+    """vad 队列的项是 {"voice": ..., "vad_statue": ...}，其他队列直接是 PCM"""
+    if isinstance(item, dict):
+        return item.get("voice")
+    return item
+
+
+def is_droppable(item):
+    """None（唤醒信号）和 vad_statue 不为 None 的 VAD 事件不能丢"""
+    if item is None:
+        return False
+    if isinstance(item, dict) and item.get("vad_statue") is not None:
+        return False
+    return True
+
+
+def _cancel_futures(item):
+    """TTS 队列的项是 (turn_id, future)，丢弃时取消 future，不再合成或等待"""
+    parts = item if isinstance(item, tuple) else (item,)
+    for part in parts:
+        if hasattr(part, "cancel") and hasattr(part, "done"):
+            part.cancel()
+
+
+def is_silent_frame(data, threshold=500):
+    """int16 PCM 帧的均方根能量低于阈值视为静音"""
+    data = _frame_data(data)
+    if not isinstance(data, (bytes, bytearray)) or len(data) < 2:
+        return False
+    samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) < threshold
+
+
+class _OverflowPolicy:
+    def _init_policy(self, name, policy, silence_threshold=500):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的队列策略 {policy}，可选：{POLICIES}")
+        self.name = name
+        self.policy = policy
+        self.silence_threshold = silence_threshold
+        self.drops = 0
+        self._logged_drops = 0
+        self.high_watermark = 0
+        self.drop_counter = metrics.counter(f"queue.{name}.drops")
+        # protect(item) 返回 True 的项不丢弃，由使用方设置
+        self.protect = None
+
+    def _drop(self, n=1):
+        self.drops += n
+        self.drop_counter.inc(n)
+        # 避免刷屏，每丢弃 100 项打印一次
+        if self._logged_drops == 0 or self.drops - self._logged_drops >= 100:
+            self._logged_drops = self.drops
+            logger.warning(f"队列 {self.name} 已满，策略 {self.policy}，累计丢弃 {self.drops} 项")
+
+    def _droppable(self, item):
+        return is_droppable(item) and not (self.protect is not None and self.protect(item))
+
+    def _drop_first(self, items, match):
+        for i, queued in enumerate(items):
+            if match(queued):
+                del items[i]
+                _cancel_futures(queued)
+                self._drop()
+                return True
+        return False
+
+    def _make_room(self, items, item):
+        """
+        队列已满时按策略腾出空间，返回新数据是否还需要入队；
+        没有可以丢弃的项时不腾空间，新数据照常入队
+        """
+        if self.policy == "drop_newest":
+            if self._droppable(item):
+                _cancel_futures(item)
+                self._drop()
+                return False
+            self._drop_first(items, self._droppable)
+            return True
+        if self.policy == "skip_ahead":
+            kept = []
+            for queued in items:
+                if self._droppable(queued):
+                    _cancel_futures(queued)
+                else:
+                    kept.append(queued)
+            n = len(items) - len(kept)
+            if n:
+                items.clear()
+                items.extend(kept)
+                self._drop(n)
+            return True
+        if self.policy == "drop_silent":
+            if self._drop_first(items, lambda queued: self._droppable(queued)
+                                and is_silent_frame(queued, self.silence_threshold)):
+                return True
+        self._drop_first(items, self._droppable)
+        return True
+
+    def _watermark(self, depth):
+        if depth > self.high_watermark:
+            self.high_watermark = depth
+
+    def stats(self):
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "drops": self.drops,
+            "high_watermark": self.high_watermark,
+        }
+
+
+class BoundedQueue(_OverflowPolicy, queue.Queue):
+    """带溢出策略和统计的线程队列"""
+
+    def __init__(self, name, maxsize=0, policy="block", silence_threshold=500):
+        queue.Queue.__init__(self, maxsize)
+        self._init_policy(name, policy, silence_threshold)
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize <= 0 or self.policy == "block":
+            super().put(item, block, timeout)
+            self._watermark(self.qsize())
+            return
+        with self.not_full:
+            if self._qsize() >= self.maxsize:
+                before = self._qsize()
+                keep = self._make_room(self.queue, item)
+                self.unfinished_tasks -= before - self._qsize()
+                if self.unfinished_tasks <= 0:
+                    self.unfinished_tasks = 0
+                    self.all_tasks_done.notify_all()
+                if not keep:
+                    return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self._watermark(self._qsize())
+            self.not_empty.notify()
+
+
+class AsyncBoundedQueue(_OverflowPolicy, asyncio.Queue):
+    """带溢出策略和统计的 asyncio 队列"""
+
+    def __init__(self, name, maxsize=0, policy="block", silence_threshold=500):
+        asyncio.Queue.__init__(self, maxsize)
+        self._init_policy(name, policy, silence_threshold)
+
+    def put_nowait(self, item):
+        if self.maxsize > 0 and self.policy != "block" and self.full():
+            before = self.qsize()
+            keep = self._make_room(self._queue, item)
+            for _ in range(before - self.qsize()):
+                self.task_done()
+            if not keep:
+                return
+            if self.full():
+                # 只剩不能丢的项，越过 maxsize 入队，与 asyncio.Queue.put_nowait 相同
+                self._put(item)
+                self._unfinished_tasks += 1
+                self._finished.clear()
+                self._wakeup_next(self._getters)
+                self._watermark(self.qsize())
+                return
+        super().put_nowait(item)
+        self._watermark(self.qsize())
+
+
+def create_queue(name, config, use_asyncio=False):
+    """
+    按配置创建某一阶段的队列，未配置时与原来一样是无界队列
+
+    :param name: 阶段名，audio / vad / tts / play
+    :param config: Queues 配置段
+    """
+    stage_config = (config or {}).get(name) or {}
+    cls = AsyncBoundedQueue if use_asyncio else BoundedQueue
+    return cls(name,
+               maxsize=stage_config.get("maxsize", 0),
+               policy=stage_config.get("policy", "block"),
+               silence_threshold=stage_config.get("silence_threshold", 500))
@@ -0,0 +1,191 @@
+import logging
+import struct
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import opuslib
+except ImportError:  # 可选依赖：pip install opuslib（需要系统安装 libopus）
+    opuslib = None
+
+# 下行 PCM 块帧头里的编码编号
+CODEC_IDS = {"pcm": 0, "mulaw8": 1, "opus": 2}
+
+# 流式下行音频帧头：magic, turn_id, seq, sample_rate, flags, codec，共 20 字节，后接按 codec 编码的音频
+# 服务端和压测客户端共用，放在这里避免客户端导入播放器的依赖
+PCM_CHUNK_HEADER = struct.Struct("<4sIIIHH")
+PCM_CHUNK_MAGIC = b"BLPC"
+PCM_FLAG_END = 1  # 一句话的最后一块
+
+OPUS_FRAME_MS = 20
+
+
+class AudioCodec(ABC):
+    """
+    WebSocket 上下行音频编解码，每个会话每个方向一个实例（Opus 编解码器有状态）
+    输入输出的 PCM 都是 int16 单声道字节流
+    """
+    name = None
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    @abstractmethod
+    def encode(self, pcm: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> bytes:
+        pass
+
+
+class PCMCodec(AudioCodec):
+    """不压缩，原始 int16 PCM"""
+    name = "pcm"
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+class MuLaw8Codec(AudioCodec):
+    """
+    自定义的 8 bit 压扩编码，码率减半，无需任何依赖，numpy 向量化计算
+    y = sign(x) * ln(1 + μ|x|) / ln(1 + μ)，直接量化为有符号 int8；
+    不是 G.711 μ-law（没有分段和取反），标准 μ-law 解码器不能解这个格式
+    """
+    name = "mulaw8"
+    MU = 255.0
+
+    def encode(self, pcm: bytes) -> bytes:
+        x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        y = np.sign(x) * np.log1p(self.MU * np.abs(x)) / np.log1p(self.MU)
+        return np.round(y * 127).astype(np.int8).tobytes()
+
+    def decode(self, data: bytes) -> bytes:
+        y = np.frombuffer(data, dtype=np.int8).astype(np.float32) / 127.0
+        x = np.sign(y) * np.expm1(np.abs(y) * np.log1p(self.MU)) / self.MU
+        return (np.clip(x, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+class OpusCodec(AudioCodec):
+    """
+    Opus 编码，需要 opuslib；按 frame_ms 分帧编码，
+    一条 WebSocket 消息里可以有多个包，每个包前面加 2 字节长度
+    """
+    name = "opus"
+    LENGTH = struct.Struct("<H")
+
+    def __init__(self, sample_rate, frame_ms=OPUS_FRAME_MS, bitrate=24000):
+        super().__init__(sample_rate)
+        if opuslib is None:
+            raise RuntimeError("Opus 编码需要安装 opuslib")
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+        self._pending = b""
+
+    def encode(self, pcm: bytes) -> bytes:
+        """不足一帧的尾部补零，调用方按句子发送，句尾补零不影响听感"""
+        frame_bytes = self.frame_size * 2
+        data = pcm
+        if len(data) % frame_bytes:
+            data += b"\x00" * (frame_bytes - len(data) % frame_bytes)
+        packets = []
+        for offset in range(0, len(data), frame_bytes):
+            packet = self.encoder.encode(data[offset:offset + frame_bytes], self.frame_size)
+            packets.append(self.LENGTH.pack(len(packet)) + packet)
+        return b"".join(packets)
+
+    def decode(self, data: bytes) -> bytes:
+        pcm = []
+        buffer = self._pending + data
+        offset = 0
+        while offset + self.LENGTH.size <= len(buffer):
+            (length,) = self.LENGTH.unpack_from(buffer, offset)
+            if offset + self.LENGTH.size + length > len(buffer):
+                break
+            packet = buffer[offset + self.LENGTH.size:offset + self.LENGTH.size + length]
+            # 最长 120ms 一包
+            pcm.append(self.decoder.decode(packet, self.sample_rate * 120 // 1000))
+            offset += self.LENGTH.size + length
+        self._pending = buffer[offset:]
+        return b"".join(pcm)
+
+
+CODECS = {"pcm": PCMCodec, "mulaw8": MuLaw8Codec, "opus": OpusCodec}
+
+
+def available_codecs():
+    return [name for name in CODECS if name != "opus" or opuslib is not None]
+
+
+def negotiate(requested, allowed=None):
+    """前端请求的编码不在允许列表或依赖不可用时，回退到 pcm"""
+    allowed = allowed or ["pcm"]
+    if requested in allowed and requested in available_codecs():
+        return requested
+    if requested and requested != "pcm":
+        logger.warning(f"不支持的音频编码 {requested}，回退到 pcm")
+    return "pcm"
+
+
+def create_codec(name, sample_rate):
+    return CODECS[name](sample_rate)
+
+
+def payload_duration(codec_id, payload, sample_rate):
+    """一块下行音频(不含帧头)的播放时长，单位秒"""
+    if codec_id == CODEC_IDS["opus"]:
+        # 每个包前面 2 字节长度，每包 OPUS_FRAME_MS
+        packets, offset = 0, 0
+        while offset + OpusCodec.LENGTH.size <= len(payload):
+            (length,) = OpusCodec.LENGTH.unpack_from(payload, offset)
+            offset += OpusCodec.LENGTH.size + length
+            packets += 1
+        return packets * OPUS_FRAME_MS / 1000.0
+    bytes_per_sample = 1 if codec_id == CODEC_IDS["mulaw8"] else 2
+    return len(payload) / bytes_per_sample / sample_rate
+
+
+if __name__ == "__main__":
+    # 带宽/CPU 对比：python -m bailing.codec [16k 单声道 wav]
+    import sys
+    import wave
+
+    if len(sys.argv) > 1:
+        with wave.open(sys.argv[1], "rb") as wf:
+            rate = wf.getframerate()
+            pcm_data = wf.readframes(wf.getnframes())
+    else:
+        rate = 16000
+        t = np.arange(rate * 10) / rate
+        signal = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2
+        pcm_data = (signal * 32767).astype(np.int16).tobytes()
+    seconds = len(pcm_data) / 2 / rate
+    chunk = rate // 10 * 2  # 100ms 一块，模拟流式
+
+    for codec_name in available_codecs():
+        enc = create_codec(codec_name, rate)
+        dec = create_codec(codec_name, rate)
+        encoded_bytes = 0
+        start = time.process_time()
+        decoded = []
+        for i in range(0, len(pcm_data), chunk):
+            payload = enc.encode(pcm_data[i:i + chunk])
+            encoded_bytes += len(payload)
+            decoded.append(dec.decode(payload))
+        cpu = time.process_time() - start
+        ref = np.frombuffer(pcm_data, dtype=np.int16).astype(np.float32)
+        out = np.frombuffer(b"".join(decoded), dtype=np.int16).astype(np.float32)[:len(ref)]
+        noise = np.mean((ref[:len(out)] - out) ** 2) + 1e-9
+        snr = 10 * np.log10(np.mean(ref[:len(out)] ** 2) / noise)
+        print(f"{codec_name:5s} 码率 {encoded_bytes * 8 / seconds / 1000:7.1f} kbit/s, "
+              f"编解码 CPU {cpu / seconds * 1000:6.2f} ms/每秒音频, SNR {snr:5.1f} dB")
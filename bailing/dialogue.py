@@ -1,11 +1,46 @@
+import json
+import logging
+import glob
 import os.path
+import queue
+import re
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 from datetime import datetime
+
+from bailing import metrics
+from bailing.prompt import context_summary_prompt_template
 from bailing.utils import write_json_file
 
+logger = logging.getLogger(__name__)
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文字符和全角标点约 1 个 token，其余约 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message):
+    """一条 LLM 消息的 token 估算，包含角色等固定开销"""
+    tokens = 4 + estimate_tokens(message.get("content"))
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(json.dumps(message["tool_calls"], ensure_ascii=False))
+    return tokens
+
 
 class Message:
+    """对话中的一条消息，放入 Dialogue 之后不再修改"""
+    __slots__ = ("uniq_id", "role", "content", "start_time", "end_time", "audio_file", "tts_file",
+                 "vad_status", "tool_calls", "tool_call_id")
+
     def __init__(self, role: str, content: str = None, uniq_id: str = None, start_time: datetime = None, end_time: datetime = None,
                  audio_file: str = None, tts_file: str = None, vad_status: list = None, tool_calls = None, tool_call_id=None):
         self.uniq_id = uniq_id if uniq_id is not None else str(uuid.uuid4())
@@ -19,38 +54,388 @@ class Message:
         self.tool_calls = tool_calls
         self.tool_call_id = tool_call_id
 
+    def to_llm(self) -> Dict[str, str]:
+        """发送给 LLM 的格式"""
+        if self.tool_calls is not None:
+            return {"role": self.role, "tool_calls": self.tool_calls}
+        if self.role == "tool":
+            return {"role": self.role, "tool_call_id": self.tool_call_id, "content": self.content}
+        return {"role": self.role, "content": self.content}
+
+
+class ContextWindow:
+    """
+    按 token 预算裁剪发送给 LLM 的上下文：开头的系统提示词和最近的几轮对话原样保留，
+    更早的对话(包括工具调用和插入的系统提示)在后台线程里合并进一段滚动摘要，不占用当前轮的时间。
+    摘要完成之前，超出预算的旧对话仍然原样发送，不会丢失上下文。
+    """
+
+    def __init__(self, config, summarize, executor=None):
+        """
+        :param summarize: summarize(prompt) -> str，在后台线程中调用 LLM 生成摘要
+        :param executor: 执行摘要的线程池，由会话传入时不单独创建线程，关闭时也不关闭它
+        """
+        self.max_tokens = config.get("max_tokens", 3000)
+        self.keep_turns = max(1, config.get("keep_turns", 4))
+        # 超出预算后一次合并到预算的 fold_ratio，避免每轮都触发摘要
+        self.fold_ratio = config.get("fold_ratio", 0.6)
+        self.summary_max_chars = config.get("summary_max_chars", 500)
+        self.summarize = summarize
+        self.summary = ""
+        # 已合并进摘要的消息数(完整对话中的下标)
+        self.folded = 0
+        # 每条消息的 token 估算，随对话增量追加
+        self._tokens = []
+        self._lock = threading.Lock()
+        self._pending = False
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+        self.last_saved = 0
+        self.sent_tokens = metrics.counter("context.tokens.sent")
+        self.saved_tokens = metrics.counter("context.tokens.saved")
+        self.summary_latency = metrics.latency("context.summary")
+
+    def apply(self, messages):
+        """messages 为完整的对话(get_llm_dialogue 的格式)，返回实际发送给 LLM 的消息"""
+        for message in messages[len(self._tokens):]:
+            self._tokens.append(message_tokens(message))
+        head = 0
+        while head < len(messages) and messages[head]["role"] == "system":
+            head += 1
+        with self._lock:
+            folded, summary = max(self.folded, head), self.summary
+
+        window = list(messages[:head])
+        if summary:
+            window.append({"role": "system", "content": f"以下是更早对话的摘要：\n{summary}"})
+        window.extend(messages[folded:])
+
+        full_tokens = sum(self._tokens)
+        sent = sum(self._tokens[:head]) + sum(self._tokens[folded:])
+        if summary:
+            sent += message_tokens(window[head])
+        if sent > self.max_tokens:
+            self._schedule(messages, head, folded, sent - sum(self._tokens[folded:]))
+        self.last_saved = max(0, full_tokens - sent)
+        self.sent_tokens.inc(sent)
+        self.saved_tokens.inc(self.last_saved)
+        logger.debug(f"上下文约 {sent} tokens，完整对话约 {full_tokens} tokens，节省 {self.last_saved}")
+        return window
+
+    def _schedule(self, messages, head, folded, fixed_tokens):
+        """从最新一轮往前保留，放不下的旧轮次交给后台合并进摘要"""
+        if self._pending:
+            return
+        # 每条 user 消息开始新的一轮，工具调用和结果跟随所在的轮次
+        starts = [i for i in range(folded + 1, len(messages)) if messages[i]["role"] == "user"]
+        budget = self.max_tokens * self.fold_ratio - fixed_tokens
+        keep_from, used = len(messages), 0
+        for turn, start in enumerate(reversed(starts)):
+            used += sum(self._tokens[start:keep_from])
+            if turn >= self.keep_turns and used > budget:
+                break
+            keep_from = start
+        if keep_from <= folded or keep_from == len(messages):
+            return
+        self._pending = True
+        self._executor.submit(self._fold, messages[folded:keep_from], keep_from)
+
+    @staticmethod
+    def _format(messages):
+        lines = []
+        for message in messages:
+            if message.get("tool_calls"):
+                calls = ", ".join(f"{c['function']['name']}({c['function']['arguments']})"
+                                  for c in message["tool_calls"])
+                lines.append(f"{message['role']}: 调用工具 {calls}")
+            else:
+                lines.append(f"{message['role']}: {message.get('content') or ''}")
+        return "\n".join(lines)
+
+    def _fold(self, messages, end):
+        start_time = time.time()
+        try:
+            prompt = context_summary_prompt_template.replace("${summary}", self.summary or "无") \
+                .replace("${dialogue}", self._format(messages)) \
+                .replace("${max_chars}", str(self.summary_max_chars)).strip()
+            summary = self.summarize(prompt)
+            if summary and summary.strip():
+                with self._lock:
+                    self.summary = summary.strip()
+                    self.folded = end
+                self.summary_latency.add(time.time() - start_time)
+                logger.info(f"{len(messages)} 条旧消息已合并进摘要，耗时 {time.time() - start_time:.2f} 秒")
+        except Exception as e:
+            logger.error(f"生成对话摘要出错: {e}")
+        finally:
+            self._pending = False
+
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JournalWriter:
+    """
+    对话日志的后台写入线程，进程内所有会话共享
+    每个会话一个只追加的 dialogue-<时间>-<会话>.jsonl 文件，每行一条消息；
+    调用方只把新消息放入队列，写入线程批量追加，fsync 按 fsync_interval_ms 合并，
+    每轮的写入量只和这一轮的新消息有关，与会话长度无关
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.fsync_interval = config.get("fsync_interval_ms", 1000) / 1000.0
+        self.max_open_files = config.get("max_open_files", 64)
+        self.queue = queue.Queue()
+        # path -> 文件对象，按最近写入排序，超过 max_open_files 时关闭最久未写的
+        self.files = {}
+        self.dirty = set()
+        self.last_fsync = time.time()
+        self.records = metrics.counter("journal.records")
+        self.fsyncs = metrics.counter("journal.fsync")
+        self.write_latency = metrics.latency("journal.write")
+        self.thread = threading.Thread(target=self._run, daemon=True, name="dialogue-journal")
+        self.thread.start()
+
+    def append(self, path, messages):
+        """追加消息，立即返回"""
+        if messages:
+            self.queue.put((path, messages))
+
+    def flush(self, timeout=5):
+        """等待队列中的消息写入并 fsync，会话结束和压缩前调用"""
+        done = threading.Event()
+        self.queue.put((None, done))
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                items = [self.queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                items = []
+            # 一次取出所有积压的写入请求
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = []
+            start_time = time.time()
+            try:
+                for path, payload in items:
+                    if path is None:
+                        waiters.append(payload)
+                        continue
+                    f = self._open(path)
+                    f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in payload))
+                    self.dirty.add(path)
+                    self.records.inc(len(payload))
+                for f in self.files.values():
+                    f.flush()
+                if self.dirty and (waiters or time.time() - self.last_fsync >= self.fsync_interval):
+                    self._fsync()
+                if items:
+                    self.write_latency.add(time.time() - start_time)
+            except Exception as e:
+                logger.error(f"写入对话日志出错: {e}")
+            finally:
+                for done in waiters:
+                    done.set()
+
+    def _open(self, path):
+        f = self.files.pop(path, None)
+        if f is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            f = open(path, "a", encoding="utf-8")
+            if len(self.files) >= self.max_open_files:
+                oldest = next(iter(self.files))
+                self._close(oldest)
+        self.files[path] = f
+        return f
+
+    def _close(self, path):
+        f = self.files.pop(path)
+        f.flush()
+        if path in self.dirty:
+            os.fsync(f.fileno())
+            self.dirty.discard(path)
+        f.close()
+
+    def _fsync(self):
+        for path in list(self.dirty):
+            f = self.files.get(path)
+            if f is not None:
+                os.fsync(f.fileno())
+        self.fsyncs.inc()
+        self.dirty.clear()
+        self.last_fsync = time.time()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal(config=None):
+    """进程内共享的对话日志写入器，第一次调用时按配置创建"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = JournalWriter(config)
+        return _journal
+
+
+def read_journal(path):
+    """读取 jsonl 对话日志，忽略最后一行写了一半的记录"""
+    dialogues = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                dialogues.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"{path} 中有不完整的记录，已跳过")
+    return dialogues
+
+
+def compact_journal(path, remove=True):
+    """
+    把 jsonl 对话日志转换成 json 格式，返回生成的文件；
+    记忆索引按条数记录整理进度，压缩前没整理完的部分之后仍会从 json 中整理
+    """
+    json_path = path[:-len(".jsonl")] + ".json"
+    write_json_file(json_path, read_journal(path))
+    if remove:
+        os.remove(path)
+    return json_path
+
 
 class Dialogue:
-    def __init__(self, dialogue_history_path):
+    def __init__(self, dialogue_history_path, context: ContextWindow = None, journal: JournalWriter = None):
         self.dialogue_history_path = dialogue_history_path
+        # 未配置时发送完整对话
+        self.context = context
+        self.journal = journal if journal is not None else get_journal()
         self.dialogue: List[Message] = []
+        # 发送给 LLM 的消息，put 时增量追加，每条消息只转换一次
+        self._payload: List[Dict[str, str]] = []
+        # 已写入日志的消息数，每次只追加之后的新消息
+        self.journaled = 0
         # 获取当前时间
         self.current_time  = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 同一秒开始的会话不能写到同一个日志里，文件名带上会话编号
+        self.session_id = uuid.uuid4().hex[:8]
+        self.journal_file = os.path.join(self.dialogue_history_path,
+                                         f"dialogue-{self.current_time}-{self.session_id}.jsonl")
 
     def put(self, message: Message):
         self.dialogue.append(message)
+        self._payload.append(message.to_llm())
+
+    def get_full_dialogue(self) -> List[Dict[str, str]]:
+        # 浅拷贝列表，调用方追加消息不影响缓存；消息字典共享，不要修改
+        return list(self._payload)
 
     def get_llm_dialogue(self) -> List[Dict[str, str]]:
-        dialogue = []
-        for m in self.dialogue:
-            if m.tool_calls is not None:
-                dialogue.append({"role": m.role, "tool_calls": m.tool_calls})
-            elif m.role == "tool":
-                dialogue.append({"role": m.role, "tool_call_id": m.tool_call_id, "content": m.content})
-            else:
-                dialogue.append({"role": m.role, "content": m.content})
+        """发送给 LLM 的对话，配置了上下文预算时旧对话替换为摘要"""
+        dialogue = self.get_full_dialogue()
+        if self.context is not None:
+            return self.context.apply(dialogue)
         return dialogue
 
+    def close(self):
+        if self.context is not None:
+            self.context.close()
+        self.journal.flush()
+
     def dump_dialogue(self):
-        dialogue = []
-        for d in self.get_llm_dialogue():
-            if d["role"] not in ("user", "assistant"):
-                continue
-            dialogue.append(d)
-        file_name = os.path.join(self.dialogue_history_path, f"dialogue-{self.current_time}.json")
-        write_json_file(file_name, dialogue)
+        """把上次之后的新消息(只保留 user/assistant)交给后台追加到 jsonl 日志"""
+        messages = self._payload[self.journaled:]
+        self.journaled += len(messages)
+        self.journal.append(self.journal_file, [m for m in messages if m["role"] in ("user", "assistant")])
+
+    def compact(self, remove=True):
+        """按需生成 json 格式的对话文件"""
+        self.journal.flush()
+        if not os.path.exists(self.journal_file):
+            return None
+        return compact_journal(self.journal_file, remove)
+
 
 if __name__ == "__main__":
-    d = Dialogue("../tmp/")
-    d.put(Message(role="user", content="你好"))
-    d.dump_dialogue()
\ No newline at end of file
+    # 每轮写入耗时对比：python -m bailing.dialogue bench [轮数]
+    # 每条消息内存和每轮构造 LLM 消息的耗时：python -m bailing.dialogue message [轮数]
+    # 把目录中的 jsonl 日志转换成 json：python -m bailing.dialogue compact tmp/
+    import sys
+    import tempfile
+    import tracemalloc
+
+    if len(sys.argv) > 2 and sys.argv[1] == "compact":
+        for journal_path in sorted(glob.glob(os.path.join(sys.argv[2], "dialogue-*.jsonl"))):
+            print(f"{journal_path} -> {compact_journal(journal_path)}")
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "message":
+        turns = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+        class PlainMessage:
+            """原来没有 __slots__ 的 Message"""
+            def __init__(self, role, content=None):
+                self.uniq_id = str(uuid.uuid4())
+                self.role, self.content = role, content
+                self.start_time = self.end_time = self.audio_file = self.tts_file = None
+                self.vad_status = self.tool_calls = self.tool_call_id = None
+
+        for cls in (PlainMessage, Message):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            kept = [cls(role="user", content=None) for _ in range(10000)]
+            per_message = (tracemalloc.get_traced_memory()[0] - before) / len(kept)
+            tracemalloc.stop()
+            # uuid 字符串两者相同，差别在实例本身
+            print(f"{cls.__name__:12s} 每条消息约 {per_message:.0f} 字节")
+
+        d = Dialogue(tempfile.gettempdir(), journal=JournalWriter())
+        d.put(Message(role="system", content="你是百聆"))
+        rebuild_costs, cached_costs = [], []
+        for turn in range(turns):
+            d.put(Message(role="user", content=f"第{turn}轮，今天天气怎么样？"))
+            start_time = time.perf_counter()
+            [m.to_llm() for m in d.dialogue]  # 原来每次调用都重新构造全部消息
+            rebuild_costs.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            d.get_llm_dialogue()
+            cached_costs.append(time.perf_counter() - start_time)
+            d.put(Message(role="assistant", content="今天北京天气晴朗，适合出门散步。"))
+        for name, costs in (("每次重建", rebuild_costs), ("增量缓存", cached_costs)):
+            print(f"{name}: 第 1 轮 {costs[0] * 1e6:.1f} us，第 {turns} 轮 {costs[-1] * 1e6:.1f} us，"
+                  f"平均 {sum(costs) / len(costs) * 1e6:.1f} us/轮(每轮原来调用 3 次，现在 1 次)")
+        sys.exit(0)
+
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        d = Dialogue(tmp_dir)
+        d.put(Message(role="system", content="你是百聆"))
+        legacy_file = os.path.join(tmp_dir, "legacy.json")
+        legacy_costs, journal_costs = [], []
+        for turn in range(turns):
+            d.put(Message(role="user", content=f"第{turn}轮，今天天气怎么样？"))
+            d.put(Message(role="assistant", content="今天北京天气晴朗，最高气温二十五度，适合出门散步。" * 3))
+            # 原来的方式：整段对话重新序列化并覆盖写入
+            start_time = time.perf_counter()
+            write_json_file(legacy_file, [m for m in d.get_full_dialogue() if m["role"] in ("user", "assistant")])
+            legacy_costs.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            d.dump_dialogue()
+            journal_costs.append(time.perf_counter() - start_time)
+        d.close()
+        for name, costs in (("整体重写", legacy_costs), ("追加日志", journal_costs)):
+            print(f"{name}: 前 10 轮平均 {sum(costs[:10]) / 10 * 1000:.3f} ms/轮，"
+                  f"最后 10 轮平均 {sum(costs[-10:]) / 10 * 1000:.3f} ms/轮")
+        compacted = d.compact()
+        with open(compacted, encoding="utf-8") as f:
+            assert json.load(f) == json.load(open(legacy_file, encoding="utf-8"))
+        print(f"压缩后与原格式一致：{os.path.basename(compacted)}")
\ No newline at end of file
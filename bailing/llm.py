@@ -1,3 +1,5 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 import openai
 import requests
@@ -12,6 +14,26 @@ class LLM(ABC):
     def response(self, dialogue):
         pass
 
+    @staticmethod
+    async def _iterate_in_executor(generator, executor=None):
+        """在线程池中逐个取同步生成器的结果，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        sentinel = object()
+        while True:
+            chunk = await loop.run_in_executor(executor, next, generator, sentinel)
+            if chunk is sentinel:
+                break
+            yield chunk
+
+    async def aresponse(self, dialogue, executor=None):
+        """异步流式返回，子类可以用原生异步客户端覆盖"""
+        async for chunk in self._iterate_in_executor(self.response(dialogue), executor):
+            yield chunk
+
+    async def aresponse_call(self, dialogue, functions_call, executor=None):
+        async for chunk in self._iterate_in_executor(self.response_call(dialogue, functions_call), executor):
+            yield chunk
+
 
 class OpenAILLM(LLM):
     def __init__(self, config):
@@ -19,6 +41,7 @@ class OpenAILLM(LLM):
         self.api_key = config.get("api_key")
         self.base_url = config.get("url")
         self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.async_client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
 
     def response(self, dialogue):
         try:
@@ -48,6 +71,32 @@ class OpenAILLM(LLM):
             logger.error(f"Error in response generation: {e}")
 
 
+    async def aresponse(self, dialogue, executor=None):
+        try:
+            responses = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True
+            )
+            async for chunk in responses:
+                yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"Error in response generation: {e}")
+
+    async def aresponse_call(self, dialogue, functions_call, executor=None):
+        try:
+            responses = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                tools=functions_call
+            )
+            async for chunk in responses:
+                yield chunk.choices[0].delta.content, chunk.choices[0].delta.tool_calls
+        except Exception as e:
+            logger.error(f"Error in response generation: {e}")
+
+
 class OllamaLLM(LLM):
     def __init__(self, config):
         self.model_name = config.get("model_name", "qwen2.5")
@@ -98,6 +147,28 @@ class OllamaLLM(LLM):
             logger.error(f"OllamaLLM tool-call error: {e}")
 
 
+class MockLLM(LLM):
+    """
+    本地替身，不访问网络，按固定节奏流式返回预设回复，用于离线压测
+    """
+    def __init__(self, config):
+        self.reply = config.get("reply", "好的，我听到了。今天天气不错，我们可以出去走走，你觉得怎么样？")
+        self.first_token_ms = config.get("first_token_ms", 300)
+        self.token_interval_ms = config.get("token_interval_ms", 30)
+        self.token_size = config.get("token_size", 2)
+
+    def response(self, dialogue):
+        time.sleep(self.first_token_ms / 1000)
+        for i in range(0, len(self.reply), self.token_size):
+            if i > 0:
+                time.sleep(self.token_interval_ms / 1000)
+            yield self.reply[i:i + self.token_size]
+
+    def response_call(self, dialogue, functions_call):
+        for content in self.response(dialogue):
+            yield content, None
+
+
 def create_instance(class_name, *args, **kwargs):
     # 获取类对象
     cls = globals().get(class_name)
@@ -1,53 +1,246 @@
 import json
 import os
-import glob
+import fnmatch
 import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import openai
 
+from bailing import metrics
+from bailing.dialogue import read_journal, estimate_tokens
 from bailing.utils import read_json_file, write_json_file
 from bailing.prompt import memory_prompt_template
 
 logger = logging.getLogger(__name__)
 
-class Memory:
+# 所有用户共享的整理线程，每个用户(记忆文件)同一时间最多一个任务
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-consolidate")
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class MemoryStore:
+    """
+    一个用户(一个记忆文件)的长期记忆，进程内共享，同一用户的多个会话看到同一份记忆。
+    记忆文件中的 index 记录每段对话已经整理到的位置：records 为已整理的消息条数，
+    jsonl 日志另外记录字节偏移 offset，只读取上次之后追加的部分；
+    日志压缩成 json 后按 records 接着整理剩下的消息；json 另外记录 size 和 mtime_ns，
+    整理完且没有变化的文件只比较 stat，不再打开读取。
+    """
+
     def __init__(self, config):
-        file_path = config.get("dialogue_history_path")
+        self.dialogue_history_path = config.get("dialogue_history_path")
         self.memory_file = config.get("memory_file")
-        if os.path.isfile(self.memory_file):
-            self.memory = read_json_file(self.memory_file)
-        else:
-            self.memory = {"history_memory_file":[], "memory":""}
-
         self.model_name = config.get("model_name")
         self.api_key = config.get("api_key")
         self.base_url = config.get("url")
-        self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+        # 一次整理调用最多打包多少 token 的对话
+        self.max_batch_tokens = config.get("max_batch_tokens", 6000)
+        # 修改时间在这之内的 json 文件可能还在写，下次再整理
+        self.min_file_age = config.get("min_file_age_s", 60)
+        self.client = None
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.memory = self._load()
+        self.latency = metrics.latency("memory.consolidate")
+        self.calls = metrics.counter("memory.calls")
+        self.files = metrics.counter("memory.files")
 
-        self.read_dialogues_in_order(file_path)
+    def _load(self):
+        memory = read_json_file(self.memory_file) if os.path.isfile(self.memory_file) else None
+        memory = memory or {}
+        memory.setdefault("memory", "")
+        memory.setdefault("history_memory_file", [])
+        index = memory.setdefault("index", {})
+        # 旧版本只记录了文件名列表，视为已经整理完
+        for file_path in memory["history_memory_file"]:
+            index.setdefault(self._key(file_path), {"offset": -1})
+        return memory
 
-        write_json_file(self.memory_file, self.memory)
+    @staticmethod
+    def _key(file_path):
+        # 日志压缩前后(.jsonl / .json)是同一段对话
+        return os.path.splitext(os.path.basename(file_path))[0]
 
+    def schedule(self):
+        """提交后台整理任务，已有任务在排队或执行时不重复提交"""
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        _executor.submit(self.consolidate)
 
-    def get_memory(self):
-        return self.memory["memory"]
+    def consolidate(self):
+        """整理还没有形成记忆的对话，多个文件打包成一次 LLM 调用"""
+        try:
+            batch, batch_tokens = [], 0
+            for file_path, entry, dialogues in self._pending_files():
+                text = Memory.dialogues_history(dialogues)
+                tokens = estimate_tokens(text)
+                if tokens > self.max_batch_tokens:
+                    # 单个文件超出限制时只保留最近的部分
+                    text = text[-self.max_batch_tokens:]
+                    tokens = estimate_tokens(text)
+                if batch and batch_tokens + tokens > self.max_batch_tokens:
+                    if not self._summarize(batch):
+                        return
+                    batch, batch_tokens = [], 0
+                batch.append((file_path, entry, text))
+                batch_tokens += tokens
+            if batch:
+                self._summarize(batch)
+        except Exception as e:
+            logger.error(f"整理记忆出错: {e}")
+        finally:
+            with self.lock:
+                self.scheduled = False
+
+    def _pending_files(self):
+        """按时间顺序返回还没整理的对话：(文件, 整理后的索引项, 对话列表)"""
+        # 一次 scandir 拿到文件名和 stat，没有变化的文件不打开
+        files = {}
+        try:
+            with os.scandir(self.dialogue_history_path) as it:
+                for dir_entry in it:
+                    if fnmatch.fnmatch(dir_entry.name, "dialogue-*-*-*.json") \
+                            or fnmatch.fnmatch(dir_entry.name, "dialogue-*-*-*.jsonl"):
+                        try:
+                            files[dir_entry.path] = dir_entry.stat()
+                        except OSError:
+                            continue
+        except OSError:
+            return
+        # 日志还在时以日志为准，同名的 json 等日志删除后再整理
+        journals = {self._key(f) for f in files if f.endswith(".jsonl")}
+        index = self.memory["index"]
+        now = time.time()
+        for file_path in sorted(files, key=lambda x: Memory.extract_time_from_filename(os.path.basename(x))):
+            st = files[file_path]
+            key = self._key(file_path)
+            entry = index.get(key) or {"offset": 0, "records": 0}
+            # 旧版本的记录没有 records，视为已经整理完
+            if "records" not in entry:
+                continue
+            if file_path.endswith(".jsonl"):
+                offset = entry.get("offset", 0)
+                if offset >= st.st_size:
+                    continue
+                dialogues, offset = self._read_journal_tail(file_path, offset)
+                new_entry = {"offset": offset, "records": entry["records"] + len(dialogues)}
+            else:
+                if key in journals or now - st.st_mtime < self.min_file_age:
+                    continue
+                # 整理过且大小、修改时间都没变
+                if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+                    continue
+                dialogues = Memory.read_dialogue_file(file_path)
+                new_entry = {"records": len(dialogues), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+                if len(dialogues) <= entry["records"]:
+                    # 日志已经整理完后压缩成的 json，记下 stat 以后不再读取
+                    self._update_index(key, new_entry)
+                    continue
+                logger.info(f"正在处理: {file_path}")
+                dialogues = dialogues[entry["records"]:]
+            if dialogues:
+                yield file_path, new_entry, dialogues
+
+    def _update_index(self, key, entry):
+        with self.lock:
+            self.memory["index"][key] = entry
+            self._save()
+
+    @staticmethod
+    def _read_journal_tail(file_path, offset):
+        """只读取 offset 之后完整的行，返回 (对话列表, 新的偏移)"""
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        dialogues = []
+        for line in data[:end].decode("utf-8").splitlines():
+            if line.strip():
+                try:
+                    dialogues.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"{file_path} 中有不完整的记录，已跳过")
+        return dialogues, offset + end
 
-    def update_memory(self, file_name, dialogue_history):
-        memory_prompt = memory_prompt_template.replace("${dialogue_abstract}", self.memory["memory"])\
+    def _summarize(self, batch):
+        """多段对话合并成一次 LLM 调用，成功后更新记忆和索引并写回文件"""
+        start_time = time.time()
+        dialogue_history = "\n\n".join(
+            f"## {Memory.extract_time_from_filename(os.path.basename(file_path))}\n{text}"
+            for file_path, _, text in batch)
+        with self.lock:
+            current = self.memory["memory"]
+        memory_prompt = memory_prompt_template.replace("${dialogue_abstract}", current) \
             .replace("${dialogue_history}", dialogue_history).strip()
         new_memory = None
         try:
+            if self.client is None:
+                self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
             responses = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[{"role":"user", "content":memory_prompt}],
+                messages=[{"role": "user", "content": memory_prompt}],
                 stream=False
             )
             new_memory = responses.choices[0].message.content
         except Exception as e:
             logger.error(f"Error in response generation: {e}")
-        if new_memory is not None:
-            self.memory["history_memory_file"].append(file_name)
+        self.calls.inc()
+        if new_memory is None:
+            return False
+        with self.lock:
             self.memory["memory"] = new_memory
+            for file_path, entry, _ in batch:
+                self.memory["index"][self._key(file_path)] = entry
+                if file_path not in self.memory["history_memory_file"]:
+                    self.memory["history_memory_file"].append(file_path)
+            self._save()
+        self.files.inc(len(batch))
+        self.latency.add(time.time() - start_time)
+        logger.info(f"{len(batch)} 个对话文件已整理进记忆，耗时 {time.time() - start_time:.2f} 秒")
+        return True
+
+    def _save(self):
+        # 先写临时文件再替换，进程中途退出也不会留下半个记忆文件
+        os.makedirs(os.path.dirname(self.memory_file) or ".", exist_ok=True)
+        tmp_file = self.memory_file + ".tmp"
+        write_json_file(tmp_file, self.memory)
+        os.replace(tmp_file, self.memory_file)
+
+
+def get_store(config):
+    """按记忆文件获取进程内共享的 MemoryStore"""
+    memory_file = config.get("memory_file")
+    with _stores_lock:
+        store = _stores.get(memory_file)
+        if store is None:
+            store = MemoryStore(config)
+            _stores[memory_file] = store
+        return store
+
+
+class Memory:
+    """
+    会话使用的长期记忆：创建时只取进程内共享的记忆，整理历史对话交给后台线程，
+    会话启动耗时与历史对话多少无关；新整理出的记忆在之后创建的会话中生效
+    """
+
+    def __init__(self, config):
+        self.store = get_store(config)
+        self.store.schedule()
+
+    @property
+    def memory(self):
+        return self.store.memory
+
+    def get_memory(self):
+        with self.store.lock:
+            return self.store.memory["memory"]
 
     @staticmethod
     def extract_time_from_filename(filename):
@@ -59,7 +252,9 @@ class Memory:
 
     @staticmethod
     def read_dialogue_file(file_path):
-        """读取 JSON 对话文件并返回对话列表"""
+        """读取 JSON 对话文件或 jsonl 对话日志并返回对话列表"""
+        if file_path.endswith(".jsonl"):
+            return read_journal(file_path)
         with open(file_path, 'r', encoding='utf-8') as file:
             try:
                 dialogues = json.load(file)
@@ -74,27 +269,13 @@ class Memory:
         dialogues_str = list()
         for dialogue in dialogues:
             role = dialogue.get('role', '未知角色')
-            content = dialogue.get('content', '')
+            content = dialogue.get('content') or ''
             logger.debug(f"{role}: {content}")
             dialogues_str.append(role +": " + content)
         return "\n".join(dialogues_str)
 
-    def read_dialogues_in_order(self, directory):
-        """读取指定目录下的所有对话文件，按时间顺序排列"""
-        # 获取所有符合命名规则的文件路径
-        pattern = os.path.join(directory, 'dialogue-*-*-*.json')
-        files = glob.glob(pattern)
-
-        # 按时间排序
-        #files.sort(key=lambda x: x.split('-')[1:4])  # 根据时间部分进行排序
-        files.sort(key=lambda x: self.extract_time_from_filename(os.path.basename(x)))
-
-        # 读取并打印所有对话
-        for file_path in files:
-            if file_path in self.memory["history_memory_file"]:
-                logger.info(f"{file_path} 对话历史已经形成memory")
-                continue
-            logger.info(f"正在处理: {file_path}")
-            dialogues = self.read_dialogue_file(file_path)
-            dialogue_history = self.dialogues_history(dialogues)
-            self.update_memory(file_path, dialogue_history)
+    def read_dialogues_in_order(self, directory=None):
+        """在当前线程中整理指定目录下还没有形成记忆的对话，按时间顺序"""
+        if directory is not None:
+            self.store.dialogue_history_path = directory
+        self.store.consolidate()
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import deque
+
+
+class LatencyStats:
+    """线程安全的耗时统计，保留最近 window 个样本计算分位数"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._first_time = None
+        self._last_time = None
+
+    def add(self, seconds):
+        now = time.time()
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+            if self._first_time is None:
+                self._first_time = now
+            self._last_time = now
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            count = self._count
+            elapsed = (self._last_time - self._first_time) if count > 1 else 0.0
+        return {
+            "count": count,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "throughput": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class Counter:
+    """线程安全计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def snapshot(self):
+        return self.value
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def latency(name):
+    """按名称获取(或创建)进程级耗时统计"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LatencyStats()
+        return _registry[name]
+
+
+def counter(name):
+    """按名称获取(或创建)进程级计数器"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Counter()
+        return _registry[name]
+
+
+def snapshot():
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: item.snapshot() for name, item in items}
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+
+from bailing.utils import get_rss_mb
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPool:
+    """
+    进程内共享的模型池：同一个模型每个进程只加载一次，
+    各个会话(Robot)只持有轻量的句柄和自己的状态
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ModelPool, cls).__new__(cls)
+                cls._instance.init()
+        return cls._instance
+
+    def init(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+
+    def get(self, key, loader):
+        """
+        获取共享模型，不存在时调用 loader() 加载
+
+        :param key: 模型唯一标识，如 ("FunASR", model_dir)
+        :param loader: 无参加载函数，返回模型对象
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 每个模型单独一把锁，加载大模型时不阻塞其他模型
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                start_time = time.time()
+                rss_before = get_rss_mb()
+                model = loader()
+                entry = {
+                    "model": model,
+                    "refs": 0,
+                    "load_time": time.time() - start_time,
+                    "rss_mb": get_rss_mb() - rss_before,
+                    # 有状态/非线程安全的模型推理时使用
+                    "infer_lock": threading.Lock(),
+                }
+                self._entries[key] = entry
+                logger.info(f"模型 {key} 加载完成，耗时 {entry['load_time']:.2f} 秒，内存增加 {entry['rss_mb']:.1f} MB")
+            else:
+                logger.debug(f"模型 {key} 已加载，直接复用")
+            entry["refs"] += 1
+            return entry["model"]
+
+    def infer_lock(self, key):
+        """返回模型对应的推理锁"""
+        return self._entries[key]["infer_lock"]
+
+    def release(self, key):
+        """会话释放模型引用，模型本身常驻进程，供后续会话复用"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["refs"] > 0:
+                entry["refs"] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                str(key): {
+                    "refs": entry["refs"],
+                    "load_time": round(entry["load_time"], 3),
+                    "rss_mb": round(entry["rss_mb"], 1),
+                }
+                for key, entry in self._entries.items()
+            }
@@ -13,28 +13,73 @@ import numpy as np
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import asyncio
 
+from bailing.archive import get_archive
+from bailing.codec import CODEC_IDS, PCM_CHUNK_HEADER, PCM_CHUNK_MAGIC, PCM_FLAG_END, create_codec, negotiate
+
 logger = logging.getLogger(__name__)
 
 
+def pack_pcm_chunks(pcm, sample_rate, turn_id, seq_start=0, chunk_ms=100, codec=None):
+    """
+    把一句话的 int16 PCM 切成固定时长的块，每块带上帧头
+    :param codec: bailing.codec.AudioCodec，为空时发送原始 PCM
+    :return: [(seq, frame_bytes)]
+    """
+    pcm_bytes = pcm.tobytes() if hasattr(pcm, "tobytes") else bytes(pcm)
+    chunk_bytes = max(2, int(sample_rate * chunk_ms / 1000) * 2)
+    chunks = []
+    total = len(pcm_bytes)
+    for i, offset in enumerate(range(0, total, chunk_bytes)):
+        flags = PCM_FLAG_END if offset + chunk_bytes >= total else 0
+        payload = pcm_bytes[offset:offset + chunk_bytes]
+        codec_id = 0
+        if codec is not None:
+            payload = codec.encode(payload)
+            codec_id = CODEC_IDS[codec.name]
+        header = PCM_CHUNK_HEADER.pack(PCM_CHUNK_MAGIC, turn_id, seq_start + i, sample_rate, flags, codec_id)
+        chunks.append((seq_start + i, header + payload))
+    return chunks
+
+
 class AbstractPlayer(object):
     def __init__(self, *args, **kwargs):
         super(AbstractPlayer, self).__init__()
         self.is_playing = False
-        self.play_queue = queue.Queue()
+        # 可以传入有界队列，默认无界
+        play_queue = kwargs.get("play_queue")
+        self.play_queue = play_queue if play_queue is not None else queue.Queue()
         self._stop_event = threading.Event()
-        self.consumer_thread = threading.Thread(target=self._playing)
-        self.consumer_thread.start()
+        # 播放队列满时每隔 put_timeout 秒检查一次播放器是否已关闭、轮次是否已失效
+        self.put_timeout = 0.5
+        # 首次播放时才启动消费线程，asyncio 模式下不走播放队列，就不会创建线程
+        self.consumer_thread = None
+        self._consumer_lock = threading.Lock()
+
+    def _ensure_consumer(self):
+        with self._consumer_lock:
+            if self.consumer_thread is None:
+                self.consumer_thread = threading.Thread(target=self._playing, daemon=True)
+                self.consumer_thread.start()
 
     @staticmethod
     def to_wav(audio_file):
         tmp_file = audio_file + ".wav"
         wav_file = AudioSegment.from_file(audio_file)
         wav_file.export(tmp_file, format="wav")
+        # 开启归档时解码后的音频顺便归档，未开启时不做转换；原始的 TTS 文件不再需要
+        archive = get_archive()
+        if archive.accepts("tts"):
+            mono = wav_file.set_channels(1).set_sample_width(2)
+            archive.submit("tts", mono.raw_data, mono.frame_rate, source=audio_file)
+        archive.discard(audio_file)
         return tmp_file
 
     def _playing(self):
         while not self._stop_event.is_set():
             data = self.play_queue.get()
+            if data is None:  # shutdown 唤醒
+                self.play_queue.task_done()
+                break
             self.is_playing = True
             try:
                 self.do_playing(data)
@@ -43,28 +88,71 @@ class AbstractPlayer(object):
             finally:
                 self.play_queue.task_done()
                 self.is_playing = False
+                # 播放完的临时文件交给后台删除
+                if isinstance(data, str):
+                    get_archive().discard(data)
 
     def play(self, data):
         logger.info(f"play file {data}")
+        self._ensure_consumer()
         audio_file = self.to_wav(data)
-        self.play_queue.put(audio_file)
+        if not self._put(audio_file):
+            get_archive().discard(audio_file)
+
+    def _turn_expired(self, turn_id):
+        """支持轮次的播放器在打断后返回 True"""
+        return False
+
+    def _put(self, item, turn_id=None):
+        """
+        放入播放队列，队列满时不无限等待：播放器关闭或轮次失效后放弃，返回是否已放入
+        """
+        while True:
+            if self._stop_event.is_set() or (turn_id is not None and self._turn_expired(turn_id)):
+                return False
+            try:
+                self.play_queue.put(item, timeout=self.put_timeout)
+                return True
+            except queue.Full:
+                continue
+
+    def play_pcm(self, pcm, sample_rate, turn_id):
+        """流式播放 PCM，只有支持流式的播放器需要实现"""
+        raise NotImplementedError("Player does not support pcm streaming")
+
+    def start_turn(self, turn_id):
+        """开始新一轮回复"""
+        pass
 
     def stop(self):
         self._clear_queue()
 
     def shutdown(self):
-        self._clear_queue()
+        # 先置位，阻塞在 _put 上的生产者下一次检查时退出
         self._stop_event.set()
-        if self.consumer_thread.is_alive():
-            self.consumer_thread.join()
+        self._clear_queue()
+        if self.consumer_thread is not None and self.consumer_thread.is_alive():
+            # 消费线程阻塞在 play_queue.get() 上，放入 None 唤醒
+            try:
+                self.play_queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self.consumer_thread.join(timeout=5)
 
     def get_playing_status(self):
         """正在播放和队列非空，为正在播放状态"""
         return self.is_playing or (not self.play_queue.empty())
 
     def _clear_queue(self):
-        with self.play_queue.mutex:
-            self.play_queue.queue.clear()
+        """逐项取出清空，每次取出都会唤醒等待 put 的生产者，未播放的临时文件交给后台删除"""
+        while True:
+            try:
+                data = self.play_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.play_queue.task_done()
+            if isinstance(data, str):
+                get_archive().discard(data)
 
     def do_playing(self, audio_file):
         """播放音频的具体实现，由子类实现"""
@@ -162,8 +250,11 @@ class PygameSoundPlayer(AbstractPlayer):
 
     def play(self, data):
         logger.info(f"play file {data}")
+        self._ensure_consumer()
         audio_file = self.to_wav(data)
         sound = pygame.mixer.Sound(audio_file)
+        # Sound 已经读入内存
+        get_archive().discard(audio_file)
         self.play_queue.put(sound)
 
     def stop(self):
@@ -190,16 +281,73 @@ class WebSocketPlayer(AbstractPlayer):
 
     def __init__(self, *args, **kwargs):
         super(WebSocketPlayer, self).__init__(*args, **kwargs)
+        config = (args[0] if args else None) or {}
 
         self.websocket = None
         self.loop = None
         self.playing_status = False
         self.lock = threading.Lock()  # 添加线程锁
 
+        # 流式下行：按固定时长切块发送 PCM，需要前端在连接时声明支持(stream=1)
+        self.stream_enabled = config.get("stream", False)
+        self.chunk_ms = config.get("chunk_ms", 100)
+        self.streaming = False
+        # 流式下行可用的压缩编码，前端在连接时通过 codec 参数选择
+        self.allowed_codecs = config.get("codecs", ["pcm"])
+        self.codec_name = "pcm"
+        self.codecs = {}
+        # 当前有效的轮次，打断后置空，旧轮次未发送的块直接丢弃
+        self.active_turn = None
+        self.seq = 0
+        self.dropped_chunks = 0
+        # 有界播放队列溢出时不丢正在播放的这一轮的 PCM 块，避免一句话中间被截掉
+        if hasattr(self.play_queue, "protect"):
+            self.play_queue.protect = lambda item: isinstance(item, tuple) and item[0] == self.active_turn
+
     def init(self, websocket: WebSocket, loop):
         self.websocket = websocket
         self.loop = loop
 
+    def negotiate(self, stream=False, codec="pcm"):
+        """根据前端声明的能力决定下行格式和编码"""
+        self.streaming = bool(self.stream_enabled and stream)
+        self.codec_name = negotiate(codec, self.allowed_codecs) if self.streaming else "pcm"
+        self.codecs = {}
+        logger.info(f"WebSocketPlayer 下行格式：{'PCM 流式' if self.streaming else 'WAV 整句'}，编码 {self.codec_name}")
+        return self.codec_name
+
+    def _get_codec(self, sample_rate):
+        if self.codec_name == "pcm":
+            return None
+        # 编码器有状态，按采样率各建一个
+        if sample_rate not in self.codecs:
+            self.codecs[sample_rate] = create_codec(self.codec_name, sample_rate)
+        return self.codecs[sample_rate]
+
+    def start_turn(self, turn_id):
+        self.active_turn = turn_id
+        self.seq = 0
+
+    def make_chunks(self, pcm, sample_rate, turn_id):
+        """切块并分配本轮递增的序号"""
+        chunks = pack_pcm_chunks(pcm, sample_rate, turn_id, self.seq, self.chunk_ms, self._get_codec(sample_rate))
+        self.seq += len(chunks)
+        return chunks
+
+    def _turn_expired(self, turn_id):
+        return turn_id != self.active_turn
+
+    def play_pcm(self, pcm, sample_rate, turn_id):
+        if turn_id != self.active_turn:
+            logger.debug(f"轮次 {turn_id} 已失效，丢弃音频")
+            return
+        self._ensure_consumer()
+        # 每块单独入队，队列满时带超时等待，打断或关闭后剩余的块不再入队
+        for seq, frame in self.make_chunks(pcm, sample_rate, turn_id):
+            if not self._put((turn_id, seq, frame), turn_id):
+                logger.debug(f"轮次 {turn_id} 已失效或播放器已关闭，丢弃剩余的音频块")
+                return
+
     def get_playing_status(self):
         """正在播放和队列非空，为正在播放状态"""
         return self.playing_status
@@ -209,6 +357,9 @@ class WebSocketPlayer(AbstractPlayer):
         self.playing_status = status
 
     def do_playing(self, audio_file):
+        if isinstance(audio_file, tuple):
+            self._send_chunk(*audio_file)
+            return
         try:
             with open(audio_file, "rb") as f:
                 wav_data = f.read()
@@ -222,6 +373,19 @@ class WebSocketPlayer(AbstractPlayer):
         except Exception as e:
             logger.error(f"播放音频失败: {e}")
 
+    def _send_chunk(self, turn_id, seq, frame):
+        if turn_id != self.active_turn:
+            self.dropped_chunks += 1
+            return
+        try:
+            # 等待发送完成，保证块的顺序，也避免积压在事件循环里
+            asyncio.run_coroutine_threadsafe(
+                self.websocket.send_bytes(frame),
+                self.loop
+            ).result(timeout=5)
+        except Exception as e:
+            logger.error(f"发送音频块失败 turn={turn_id} seq={seq}: {e}")
+
     def interrupt(self):
         """异步发送中断命令"""
         try:
@@ -255,6 +419,9 @@ class WebSocketPlayer(AbstractPlayer):
 
     def stop(self):
         """停止播放器"""
+        # 丢弃还没发出去的音频，打断前的轮次不再发送
+        self.active_turn = None
+        self._clear_queue()
         try:
             if self.websocket and self.websocket.client_state.value == 1:  # 1 = CONNECTED
                 asyncio.run_coroutine_threadsafe(
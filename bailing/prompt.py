@@ -25,4 +25,18 @@ ${dialogue_history}
 - 确保提取的信息具有实际价值，并能帮助理解用户的需求和背景。
 - 摘要应清晰、简洁，便于后续参考和分析。
 - 输出对话摘要，用户对话偏好，用户对话风格，以及下次应该采取的对话策略
-"""
\ No newline at end of file
+"""
+
+context_summary_prompt_template = """
+你负责压缩一段正在进行的对话，供助手继续对话时参考。请把已有摘要和新的对话记录合并成一段新的摘要，不超过${max_chars}个字。
+
+# 已有摘要
+${summary}
+
+# 新的对话记录
+${dialogue}
+
+# 输出要求
+- 保留用户的需求、偏好、提到的事实(人名、时间、地点、数字)和尚未完成的事项，以及工具调用得到的关键结果。
+- 省略寒暄和重复内容，直接输出摘要正文。
+"""
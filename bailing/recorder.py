@@ -1,3 +1,4 @@
+import asyncio
 import time
 from abc import ABC, abstractmethod
 import threading
@@ -6,6 +7,8 @@ import logging
 import pyaudio
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
+from bailing.codec import create_codec, negotiate
+
 logger = logging.getLogger(__name__)
 
 
@@ -85,6 +88,15 @@ class WebSocketRecorder(AbstractRecorder):
         self.audio_queue: queue.Queue = None
         self._buffer = bytearray()
         self._frame_size_bytes = 512 * 2  # 512 samples × 2 bytes/sample for 16kHz Int16 PCM
+        # 上行压缩编码，前端在连接时通过 codec 参数选择
+        self.allowed_codecs = (config or {}).get("codecs", ["pcm"])
+        self.codec = None
+
+    def set_codec(self, codec="pcm"):
+        codec_name = negotiate(codec, self.allowed_codecs)
+        self.codec = None if codec_name == "pcm" else create_codec(codec_name, 16000)
+        logger.info(f"WebSocketRecorder 上行编码：{codec_name}")
+        return codec_name
 
     def start_recording(self, audio_queue: queue.Queue):
         self.audio_queue = audio_queue
@@ -95,6 +107,9 @@ class WebSocketRecorder(AbstractRecorder):
         if not self.running:
             logger.info(f"录音已暂停，丢弃数据")
             return
+        # 流式解码，不落盘
+        if self.codec is not None:
+            data = self.codec.decode(data)
         # 累积数据
         self._buffer.extend(data)
 
@@ -102,9 +117,10 @@ class WebSocketRecorder(AbstractRecorder):
         while len(self._buffer) >= self._frame_size_bytes:
             chunk = bytes(self._buffer[:self._frame_size_bytes])
             # 放入队列
+            # audio_queue 可能是 queue.Queue，也可能是 asyncio 模式下的 asyncio.Queue
             try:
-                self.audio_queue.put(chunk, block=False)
-            except queue.Full:
+                self.audio_queue.put_nowait(chunk)
+            except (queue.Full, asyncio.QueueFull):
                 logger.warning("audio_queue 已满，丢弃一帧音频")
             # 移除已用数据
             del self._buffer[:self._frame_size_bytes]
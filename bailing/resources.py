@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from bailing import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpus(spec):
+    """'0-3,8' -> {0, 1, 2, 3, 8}，列表原样转成集合"""
+    if spec is None or spec == "":
+        return None
+    if isinstance(spec, (list, tuple, set)):
+        return {int(c) for c in spec}
+    cpus = set()
+    for part in str(spec).split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+class ModelBudget:
+    """单个模型类型的配额：推理线程数、同时推理数、可选的 CPU 集合"""
+
+    def __init__(self, name, threads, concurrency, cpus=None):
+        self.name = name
+        self.threads = threads
+        self.concurrency = concurrency
+        self.cpus = cpus
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self.wait_latency = metrics.latency(f"resource.{name}.wait")
+        self.infer_latency = metrics.latency(f"resource.{name}.infer")
+
+    def stats(self):
+        return {"threads": self.threads, "concurrency": self.concurrency, "active": self.active,
+                "waiting": self.waiting, "cpus": sorted(self.cpus) if self.cpus else None}
+
+
+class ResourceManager:
+    """
+    进程内的 CPU 预算：各模型(FunASR、Silero、Kokoro、ChatTTS 等)各自的 torch 线程数、
+    同时推理的数量上限(信号量)和可选的 CPU 绑定。
+    torch 的 intra-op 线程数按线程生效，进入推理时按模型类型设置；
+    onnxruntime 的线程数在创建会话时确定，通过 threads() 读取。
+    未开启时 slot() 直接返回空上下文，不改变原有行为。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.enabled = config.get("enabled", False)
+        default = config.get("default") or {}
+        self.default_threads = default.get("threads", 2)
+        self.default_concurrency = default.get("concurrency", 4)
+        self.default_cpus = parse_cpus(default.get("cpus"))
+        self.model_config = config.get("models") or {}
+        self.budgets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.pin_supported = hasattr(os, "sched_setaffinity")
+        if self.enabled:
+            self._set_interop_threads(config.get("interop_threads", 1))
+        logger.info(f"CPU 资源预算{'已开启' if self.enabled else '未开启'}")
+
+    @staticmethod
+    def _set_interop_threads(threads):
+        # 只能在第一次并行计算之前设置一次
+        try:
+            import torch
+            torch.set_interop_threads(threads)
+        except ImportError:
+            pass
+        except RuntimeError as e:
+            logger.warning(f"设置 torch inter-op 线程数失败: {e}")
+
+    def budget(self, name):
+        budget = self.budgets.get(name)
+        if budget is None:
+            with self._lock:
+                budget = self.budgets.get(name)
+                if budget is None:
+                    model_config = self.model_config.get(name) or {}
+                    cpus = parse_cpus(model_config.get("cpus")) or self.default_cpus
+                    budget = ModelBudget(name,
+                                         threads=model_config.get("threads", self.default_threads),
+                                         concurrency=model_config.get("concurrency", self.default_concurrency),
+                                         cpus=cpus)
+                    self.budgets[name] = budget
+        return budget
+
+    def threads(self, name, default=1):
+        """onnxruntime 等在创建会话时需要的线程数，未开启时返回 default"""
+        if not self.enabled:
+            return default
+        return self.budget(name).threads
+
+    def slot(self, name):
+        """
+        一次推理的配额：with resources.slot("FunASR"): model.generate(...)
+        超过同时推理数时排队等待，等待时间记录在 resource.<name>.wait
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._slot(self.budget(name))
+
+    @contextmanager
+    def _slot(self, budget):
+        wait_start = time.time()
+        with budget._lock:
+            budget.waiting += 1
+        budget.semaphore.acquire()
+        with budget._lock:
+            budget.waiting -= 1
+            budget.active += 1
+        start_time = time.time()
+        budget.wait_latency.add(start_time - wait_start)
+        previous_cpus = self._pin(budget.cpus)
+        try:
+            self._set_threads(budget.threads)
+            yield
+        finally:
+            if previous_cpus is not None:
+                self._unpin(previous_cpus)
+            budget.infer_latency.add(time.time() - start_time)
+            with budget._lock:
+                budget.active -= 1
+            budget.semaphore.release()
+
+    def _set_threads(self, threads):
+        # 同一线程连续推理同一类模型时不重复设置
+        if getattr(self._local, "threads", None) == threads:
+            return
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            return
+        self._local.threads = threads
+
+    def _pin(self, cpus):
+        """把当前线程绑定到 cpus，返回原来的 CPU 集合，不绑定时返回 None"""
+        if not cpus or not self.pin_supported:
+            return None
+        try:
+            previous = os.sched_getaffinity(0)
+            if previous == cpus:
+                return None
+            os.sched_setaffinity(0, cpus)
+            return previous
+        except OSError as e:
+            logger.warning(f"绑定 CPU {sorted(cpus)} 失败: {e}")
+            return None
+
+    def _unpin(self, cpus):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            budgets = list(self.budgets.values())
+        return {"enabled": self.enabled, "models": {b.name: b.stats() for b in budgets}}
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def get_resources(config=None):
+    """进程内共享的资源管理器，第一次调用时按配置创建"""
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = ResourceManager(config)
+        return _resources
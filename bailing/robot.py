@@ -15,11 +15,16 @@ from bailing import (
     llm,
     tts,
     vad,
-    memory
+    memory,
+    wakeword
 )
-from bailing.dialogue import Message, Dialogue
-from bailing.utils import is_interrupt, read_config, is_segment, extract_json_from_string, is_segment_sentence
+from bailing.archive import get_archive
+from bailing.resources import get_resources
+from bailing.bounded_queue import create_queue
+from bailing.dialogue import Message, Dialogue, ContextWindow, get_journal
+from bailing.utils import is_interrupt, read_config, is_segment, extract_json_from_string, SentenceSegmenter, get_rss_mb
 from bailing.prompt import sys_prompt
+from bailing.speculative import Speculation, SpeculationStats, CANCELLED, COMMITTED
 
 from plugins.registry import Action
 from plugins.task_manager import TaskManager
@@ -28,9 +33,21 @@ logger = logging.getLogger(__name__)
 
 
 class Robot(ABC):
+    # 为 True 时 self.executor 是进程共享的线程池，会话关闭时不关闭
+    shared_executor = False
+
     def __init__(self, config_file, websocket = None, loop = None):
+        init_start_time = time.time()
+        rss_before = get_rss_mb()
         config = read_config(config_file)
-        self.audio_queue = queue.Queue()
+        self.config = config
+        # 进程共享的音频归档，第一个会话按配置创建
+        self.archive = get_archive(config.get("Archive"))
+        # 进程共享的 CPU 预算，需要在创建模型之前配置
+        get_resources(config.get("Resources"))
+        # 各阶段队列容量和溢出策略
+        self.queue_config = config.get("Queues") or {}
+        self.audio_queue = create_queue("audio", self.queue_config)
 
         self.recorder = recorder.create_instance(
             config["selected_module"]["Recorder"],
@@ -60,20 +77,27 @@ class Robot(ABC):
 
         self.player = player.create_instance(
             config["selected_module"]["Player"],
-            config["Player"][config["selected_module"]["Player"]]
+            config["Player"][config["selected_module"]["Player"]],
+            play_queue=create_queue("play", self.queue_config)
         )
 
         self.memory = memory.Memory(config.get("Memory"))
         self.prompt = sys_prompt.replace("{memory}", self.memory.get_memory()).strip()
 
-        self.vad_queue = queue.Queue()
-        self.dialogue = Dialogue(config["Memory"]["dialogue_history_path"])
+        self.vad_queue = create_queue("vad", self.queue_config)
+        self.vad_max_drain = getattr(self.vad, "max_drain", 32)
+        # 会话的 LLM、TTS、工具调用和上下文摘要都提交到这个线程池
+        self.executor = self._create_executor()
+        # 上下文 token 预算：旧对话在后台合并成摘要
+        context_config = config.get("Context") or {}
+        context = ContextWindow(context_config, self._summarize, self.executor) \
+            if context_config.get("enabled", False) else None
+        self.dialogue = Dialogue(config["Memory"]["dialogue_history_path"], context=context,
+                                 journal=get_journal(config["Memory"].get("journal")))
         self.dialogue.put(Message(role="system", content=self.prompt))
 
         # 保证tts是顺序的
-        self.tts_queue = queue.Queue()
-        # 初始化线程池
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        self.tts_queue = create_queue("tts", self.queue_config)
 
         self.vad_start = True
 
@@ -86,32 +110,77 @@ class Robot(ABC):
 
         # 事件用于控制程序退出
         self.stop_event = threading.Event()
+        self._closed = False
+        self._shutdown_lock = threading.Lock()
 
         self.callback = None
 
         self.speech = []
 
+        # 每轮回复的编号，打断后旧轮次的音频不再发送
+        self.turn_id = 0
+
+        # 推测执行：VAD 的 end 视为暂定停顿，提前开始 ASR 和 LLM，再静音 confirm_ms 才确认说完
+        speculative_config = config.get("Speculative") or {}
+        self.speculative = speculative_config.get("enabled", False)
+        if self.speculative and self.asr.streaming:
+            logger.warning("流式 ASR 不支持推测执行，已关闭")
+            self.speculative = False
+        self.confirm_frames = max(1, int(speculative_config.get("confirm_ms", 300) / 32))  # 每帧 32ms
+        self.speculation = None
+        self.speculation_stats = SpeculationStats()
+
+        # 流式分句策略：首段尽快送 TTS，之后合并成更长的分段
+        self.segmenter_config = config.get("Segmenter") or {}
+
+        # 唤醒词门限：未唤醒时只做关键词检测，不做 ASR、不调用 LLM
+        self.wake_gate = wakeword.create_gate(config)
+
         # 初始化单例
         #rag.Rag(config["Rag"])  # 第一次初始化
 
         self.task_queue = queue.Queue()
-        self.task_manager = TaskManager(config.get("TaskManager"), self.task_queue)
+        self.task_manager = TaskManager(config.get("TaskManager"), self.task_queue, self.executor)
         self.start_task_mode = config.get("StartTaskMode")
 
         if config["selected_module"]["Player"].lower().find("websocket") > -1:
             self.player.init(websocket, loop)
             self.listen_dialogue(self.player.send_messages)
 
+        # 会话初始化耗时和内存增量，用于确认模型共享的效果
+        self.init_time = time.time() - init_start_time
+        self.init_rss_mb = get_rss_mb() - rss_before
+        logger.info(f"Robot 初始化完成，耗时 {self.init_time:.2f} 秒，内存增加 {self.init_rss_mb:.1f} MB，"
+                    f"当前进程内存 {get_rss_mb():.1f} MB")
+
+    def _create_executor(self):
+        """线程模式每个会话一个线程池，线程在第一次提交任务时才创建"""
+        return ThreadPoolExecutor(max_workers=10)
+
+    def queue_stats(self):
+        """各阶段队列的深度和丢弃统计"""
+        stages = {"audio": self.audio_queue, "vad": self.vad_queue,
+                  "tts": self.tts_queue, "play": self.player.play_queue}
+        return {name: q.stats() for name, q in stages.items() if hasattr(q, "stats")}
+
     def listen_dialogue(self, callback):
         self.callback = callback
 
     def _stream_vad(self):
+        # 开启批量 VAD 时由共享调度器处理，不再单独起线程
+        if self.vad.start_stream(self.audio_queue, self.vad_queue):
+            logger.info("VAD 已交由共享调度器批量处理")
+            return
+
         def vad_thread():
             while not self.stop_event.is_set():
                 try:
-                    data = self.audio_queue.get()
-                    vad_statue = self.vad.is_vad(data)
-                    self.vad_queue.put({"voice": data, "vad_statue": vad_statue})
+                    # 有积压时一次取出多帧批量处理，尽快追上实时
+                    frames = vad.drain_queue(self.audio_queue, self.audio_queue.get(), self.vad_max_drain)
+                    if None in frames:  # shutdown 唤醒
+                        break
+                    for data, vad_statue in zip(frames, self.vad.is_vad_batch(frames)):
+                        self.vad_queue.put({"voice": data, "vad_statue": vad_statue})
                 except Exception as e:
                     logger.error(f"VAD 处理出错: {e}")
         consumer_audio = threading.Thread(target=vad_thread, daemon=True)
@@ -121,7 +190,10 @@ class Robot(ABC):
         def priority_thread():
             while not self.stop_event.is_set():
                 try:
-                    future = self.tts_queue.get()
+                    item = self.tts_queue.get()
+                    if item is None:  # shutdown 唤醒
+                        break
+                    turn_id, future = item
                     try:
                         tts_file = future.result(timeout=10)
                     except TimeoutError:
@@ -132,7 +204,11 @@ class Robot(ABC):
                         continue
                     if tts_file is None:
                         continue
-                    self.player.play(tts_file)
+                    if isinstance(tts_file, tuple):
+                        pcm, sample_rate = tts_file
+                        self.player.play_pcm(pcm, sample_rate, turn_id)
+                    else:
+                        self.player.play(tts_file)
                 except Exception as e:
                     logger.error(f"tts_priority priority_thread: {e}")
         tts_priority = threading.Thread(target=priority_thread, daemon=True)
@@ -143,13 +219,44 @@ class Robot(ABC):
         logger.info("Interrupting current playback.")
         self.player.stop()
 
+    def attach_websocket(self, websocket, loop):
+        """同一用户重连后切换到新的 websocket，继续使用原会话"""
+        self.player.init(websocket, loop)
+        self.recorder.start_recording(self.audio_queue)
+
+    @staticmethod
+    def _wake(q):
+        """放入 None 唤醒阻塞在 get() 上的线程，队列已满时消费者没有阻塞，无需唤醒"""
+        if isinstance(q, queue.Queue):
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+
     def shutdown(self):
-        """关闭所有资源，确保程序安全退出"""
+        """关闭所有资源，确保程序安全退出，可重复调用"""
+        with self._shutdown_lock:
+            if self._closed:
+                return
+            self._closed = True
         logger.info("Shutting down Robot...")
         self.stop_event.set()
-        self.executor.shutdown(wait=True)
+        if self.speculation is not None:
+            self.speculation.cancel()
+        self.vad.stop_stream()
         self.recorder.stop_recording()
+        for q in (self.audio_queue, self.vad_queue, self.tts_queue):
+            self._wake(q)
+        # 不等待进行中的 LLM 请求，排队的任务直接取消
+        if not self.shared_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.task_manager.shutdown()
+        self.dialogue.close()
         self.player.shutdown()
+        # 释放共享模型的引用
+        for module in (self.asr, self.vad, self.tts, self.wake_gate):
+            if module is not None:
+                module.close()
         logger.info("Shutdown complete.")
 
     def start_recording_and_vad(self):
@@ -164,51 +271,67 @@ class Robot(ABC):
     def _duplex(self):
         # 处理识别结果
         data = self.vad_queue.get()
+        if data is None:  # shutdown 唤醒
+            return
         # 识别到vad开始
         if self.vad_start:
-            self.speech.append(data)
+            self._append_speech(data)
         vad_status = data.get("vad_statue")
         # 空闲的时候，取出耗时任务进行播放
         if not self.task_queue.empty() and  not self.vad_start and vad_status is None \
-                and not self.player.get_playing_status() and self.chat_lock is False:
+                and not self.player.get_playing_status() and self.chat_lock is False and self.speculation is None:
             result = self.task_queue.get()
-            future = self.executor.submit(self.speak_and_play, result.response)
-            self.tts_queue.put(future)
+            self._new_turn()
+            self._speak(result.response)
 
-        """ 语音唤醒
-        if time.time() - self.start_time>=60:
-            self.silence_status = True
+        if self.speculation is not None:
+            if vad_status is not None and "start" in vad_status:
+                # 暂定停顿后用户继续说话：取消推测，接着累积这一句
+                self._cancel_speculation()
+                self.vad_start = True
+                self._append_speech(data)
+                return True
+            if self.speculation.tick():
+                self._commit_speculation()
 
-        if self.silence_status:
-            return
-        """
         if vad_status is None:
             return
         if "start" in vad_status:
             if self.player.get_playing_status() or self.chat_lock is True:  # 正在播放，打断场景
-                if self.INTERRUPT:
+                if self.INTERRUPT and self._awake():
                     self.chat_lock = False
                     self.interrupt_playback()
                     self.vad_start = True
-                    self.speech.append(data)
+                    self._append_speech(data)
                 else:
                     return
             else:  # 没有播放，正常
                 self.vad_start = True
-                self.speech.append(data)
+                self._append_speech(data)
         elif "end" in vad_status and len(self.speech) > 0:
+            passed, streamed = self._end_segment()
+            if not passed:
+                return True
+            if self.speculative:
+                self.vad_start = False
+                self._start_speculation()
+                return True
             try:
                 logger.debug(f"语音包的长度：{len(self.speech)}")
                 self.vad_start = False
-                voice_data = [d["voice"] for d in self.speech]
-                text, tmpfile = self.asr.recognizer(voice_data)
+                if self.asr.streaming and streamed:
+                    # 流式识别已经处理了说话期间的音频，这里只识别剩余的尾巴
+                    text, tmpfile = self.asr.finish()
+                else:
+                    voice_data = [d["voice"] for d in self.speech]
+                    text, tmpfile = self.asr.recognizer(voice_data)
                 self.speech = []
             except Exception as e:
                 self.vad_start = False
                 self.speech = []
                 logger.error(f"ASR识别出错: {e}")
                 return
-            if not text.strip():
+            if not text or not text.strip():
                 logger.debug("识别结果为空，跳过处理。")
                 return
 
@@ -218,6 +341,36 @@ class Robot(ABC):
             self.executor.submit(self.chat, text)
         return True
 
+    def _awake(self):
+        return self.wake_gate is None or self.wake_gate.is_awake()
+
+    def _end_segment(self):
+        """
+        一段语音结束时经过唤醒词门限，返回 (是否继续识别, 流式 ASR 是否收到了整段音频)
+        未唤醒且没有唤醒词的语音直接丢弃
+        """
+        if self.wake_gate is None:
+            return True, True
+        passed, streamed = self.wake_gate.end_segment()
+        if not passed:
+            logger.debug(f"未唤醒，丢弃语音包，长度：{len(self.speech)}")
+            self.vad_start = False
+            self.speech = []
+        return passed, streamed
+
+    def _append_speech(self, data):
+        self.speech.append(data)
+        if self.wake_gate is not None and self.wake_gate.listening():
+            self.wake_gate.feed(data["voice"])
+            return
+        if self.asr.streaming:
+            self._push_partial(self.asr.feed(data["voice"]))
+
+    def _push_partial(self, partial):
+        """流式识别的中间结果推给前端"""
+        if partial and self.callback:
+            self.callback({"role": "user", "content": partial, "partial": True})
+
     def run(self):
         try:
             self.start_recording_and_vad()  # 监听语音流
@@ -228,10 +381,116 @@ class Robot(ABC):
         finally:
             self.shutdown()
 
+    def _start_speculation(self):
+        logger.debug(f"暂定停顿，开始推测执行，语音包的长度：{len(self.speech)}")
+        # 预留下一轮的编号，确认后才切换播放器的轮次，取消时上一轮还在播放的音频不受影响
+        self.speculation = Speculation(self.turn_id + 1, self.confirm_frames)
+        # 保留 self.speech，用户继续说话时整句重新识别
+        voice_data = [d["voice"] for d in self.speech]
+        self.executor.submit(self._speculative_chat, self.speculation, voice_data)
+
+    def _cancel_speculation(self):
+        self.speculation.cancel()
+        self.speculation = None
+        self.speculation_stats.record_miss()
+
+    def _commit_speculation(self):
+        spec = self.speculation
+        self.speculation = None
+        self.speech = []
+        self.turn_id = max(self.turn_id, spec.turn_id)
+        self.player.start_turn(self.turn_id)
+        with spec.lock:
+            # LLM 还在输出时和正常对话一样，用户再说话即打断
+            if not spec.done:
+                self.chat_lock = True
+            saved = spec.commit(self.tts_queue)
+        self.speculation_stats.record_hit(saved)
+
+    def _finish_speculation(self, spec):
+        with spec.lock:
+            spec.done = True
+            if spec.state == COMMITTED:
+                self.chat_lock = False
+
+    def _speculative_chat(self, spec, voice_data):
+        """推测线程：识别并请求 LLM，合成的音频在确认前只暂存，对话记录在确认后才写入"""
+        text = None
+        response_message = []
+        response_message_concat = ""
+        segmenter = SentenceSegmenter(self.segmenter_config)
+        # 识别和取对话快照也在 try 中，任何一步出错都会结束推测，确认方不会一直等待
+        try:
+            text, tmpfile = self.asr.recognizer(voice_data)
+            if not text or not text.strip():
+                return
+            dialogue = self.dialogue.get_llm_dialogue() + [{"role": "user", "content": text}]
+            if self.start_task_mode:
+                llm_responses = self.llm.response_call(dialogue, functions_call=self.task_manager.get_functions())
+            else:
+                llm_responses = ((content, None) for content in self.llm.response(dialogue))
+            for content, tools_call in llm_responses:
+                if spec.state == CANCELLED:
+                    break
+                # 工具调用可能有副作用，不推测执行，确认后走正常流程
+                if tools_call is not None or (not response_message and content == "```"):
+                    spec.fallback = True
+                    break
+                if not content:
+                    continue
+                response_message.append(content)
+                segment_text = segmenter.push(content)
+                if segment_text:
+                    spec.hold(self.executor.submit(self.speak_and_play, segment_text), self.tts_queue)
+            response_message_concat = "".join(response_message)
+            segment_text = segmenter.flush()
+            if not spec.fallback and segment_text:
+                spec.hold(self.executor.submit(self.speak_and_play, segment_text), self.tts_queue)
+        except Exception as e:
+            logger.error(f"推测执行出错 {text}: {e}")
+            if text is None:
+                return
+        finally:
+            self._finish_speculation(spec)
+
+        if not spec.wait(self.stop_event):
+            return
+        if self.callback:
+            self.callback({"role": "user", "content": str(text)})
+        if spec.fallback:
+            self.chat(text)
+            return
+        self.dialogue.put(Message(role="user", content=text))
+        if self.callback:
+            self.callback({"role": "assistant", "content": response_message_concat})
+        self.dialogue.put(Message(role="assistant", content=response_message_concat))
+        self.dialogue.dump_dialogue()
+
+    def _summarize(self, prompt):
+        """在 ContextWindow 的后台线程中调用，生成对话摘要"""
+        return "".join(content for content in self.llm.response([{"role": "user", "content": prompt}]) if content)
+
+    def _new_turn(self):
+        self.turn_id += 1
+        self.player.start_turn(self.turn_id)
+
+    def _speak(self, text):
+        """提交 TTS 任务，按提交顺序播放"""
+        future = self.executor.submit(self.speak_and_play, text)
+        self.tts_queue.put((self.turn_id, future))
+
     def speak_and_play(self, text):
         if text is None or len(text)<=0:
             logger.info(f"无需tts转换，query为空，{text}")
             return None
+        if getattr(self.player, "streaming", False):
+            # 流式下行直接返回 PCM，不落盘
+            pcm, sample_rate = self.tts.to_pcm(text)
+            if pcm is None:
+                logger.error(f"tts转换失败，{text}")
+                return None
+            self.archive.submit("tts", pcm, sample_rate, text=text)
+            return pcm, sample_rate
         tts_file = self.tts.to_tts(text)
         if tts_file is None:
             logger.error(f"tts转换失败，{text}")
@@ -246,7 +505,7 @@ class Robot(ABC):
 
     def chat_tool(self, query):
         # 打印逐步生成的响应内容
-        start = 0
+        segmenter = SentenceSegmenter(self.segmenter_config)
         try:
             start_time = time.time()  # 记录开始时间
             llm_responses = self.llm.response_call(self.dialogue.get_llm_dialogue(), functions_call=self.task_manager.get_functions())
@@ -280,86 +539,85 @@ class Robot(ABC):
                     content_arguments+=content
                 else:
                     response_message.append(content)
-                    response_message_concat = "".join(response_message)
                     end_time = time.time()  # 记录结束时间
                     logger.debug(f"大模型返回时间时间tool: {end_time - start_time} 秒, 生成token={content}")
-                    flag_segment, index_segment = is_segment_sentence(response_message_concat, start)
-                    logger.debug(
-                        f"大模型返回时间时间tool: flag_segment={flag_segment} 秒, index_segment={index_segment}")
-
-                    if flag_segment:
-                        segment_text = response_message_concat[start:index_segment + 1]
-                        # 为了保证语音的连贯，至少2个字才转tts
-
-                        if len(segment_text) <= 2: #max(2, start):
-                            continue
-                        future = self.executor.submit(self.speak_and_play, segment_text)
-                        self.tts_queue.put(future)
-                        # futures.append(future)
-                        start = index_segment + 1  # len(response_message)
+                    segment_text = segmenter.push(content)
+                    if segment_text:
+                        self._speak(segment_text)
 
         if not tool_call_flag:
-            response_message_concat = "".join(response_message)
-            if start < len(response_message_concat):
-                segment_text = response_message_concat[start:]
-                future = self.executor.submit(self.speak_and_play, segment_text)
-                self.tts_queue.put(future)
+            segment_text = segmenter.flush()
+            if segment_text:
+                self._speak(segment_text)
         else:
             # 处理函数调用
-            if function_id is None:
-                a = extract_json_from_string(content_arguments)
-                if a is not None:
-                    content_arguments_json = json.loads(a)
-                    function_name = content_arguments_json["function_name"]
-                    function_arguments = json.dumps(content_arguments_json["args"], ensure_ascii=False)
-                    function_id = str(uuid.uuid4().hex)
-                else:
-                    return []
-                function_arguments = json.loads(function_arguments)
-            logger.info(f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}")
-            # 调用工具
-            result = self.task_manager.tool_call(function_name, function_arguments)
-            if result.action == Action.NOTFOUND: # = (0, "没有找到函数")
-                logger.error(f"没有找到函数{function_name}")
-                return []
-            elif result.action == Action.NONE: # = (1,  "啥也不干")
-                return []
-            elif result.action == Action.RESPONSE: # = (2, "直接回复")
-                future = self.executor.submit(self.speak_and_play, result.response)
-                self.tts_queue.put(future)
-                return [result.response]
-            elif result.action == Action.REQLLM: # = (3, "调用函数后再请求llm生成回复")
-                # 添加工具内容
-                self.dialogue.put(Message(role='assistant',
-                                          tool_calls=[{"id": function_id, "function": {"arguments": json.dumps(function_arguments ,ensure_ascii=False),
-                                                                                       "name": function_name},
-                                                       "type": 'function', "index": 0}]))
-
-                self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.result))
-                self.chat_tool(query)
-            elif result.action == Action.ADDSYSTEM: # = (4, "添加系统prompt到对话中去")
-                self.dialogue.put(Message(**result.result))
-                return []
-            elif result.action == Action.ADDSYSTEMSPEAK: # = (5, "添加系统prompt到对话中去&主动说话")
-                self.dialogue.put(Message(role='assistant',
-                                          tool_calls=[{"id": function_id, "function": {
-                                              "arguments": json.dumps(function_arguments, ensure_ascii=False),
-                                              "name": function_name},
-                                                       "type": 'function', "index": 0}]))
-
-                self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.response))
-                self.dialogue.put(Message(**result.result))
-                self.dialogue.put(Message(role="user", content="ok"))
+            speak_text, call_again = self._handle_tool_call(function_name, function_id, function_arguments, content_arguments)
+            if speak_text is not None:
+                self._speak(speak_text)
+                return [speak_text]
+            if call_again:
                 return self.chat_tool(query)
-            else:
-                logger.error(f"not found action type: {result.action}")
+            return []
         return response_message
 
+    def _handle_tool_call(self, function_name, function_id, function_arguments, content_arguments):
+        """
+        执行工具调用并按动作类型更新对话
+        :return: (需要直接播报的文本, 是否需要再次请求llm)
+        """
+        if function_id is None:
+            a = extract_json_from_string(content_arguments)
+            if a is not None:
+                content_arguments_json = json.loads(a)
+                function_name = content_arguments_json["function_name"]
+                function_arguments = json.dumps(content_arguments_json["args"], ensure_ascii=False)
+                function_id = str(uuid.uuid4().hex)
+            else:
+                return None, False
+            function_arguments = json.loads(function_arguments)
+        logger.info(f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}")
+        # 调用工具
+        result = self.task_manager.tool_call(function_name, function_arguments)
+        if result.action == Action.NOTFOUND: # = (0, "没有找到函数")
+            logger.error(f"没有找到函数{function_name}")
+            return None, False
+        elif result.action == Action.NONE: # = (1,  "啥也不干")
+            return None, False
+        elif result.action == Action.RESPONSE: # = (2, "直接回复")
+            return result.response, False
+        elif result.action == Action.REQLLM: # = (3, "调用函数后再请求llm生成回复")
+            # 添加工具内容
+            self.dialogue.put(Message(role='assistant',
+                                      tool_calls=[{"id": function_id, "function": {"arguments": json.dumps(function_arguments ,ensure_ascii=False),
+                                                                                   "name": function_name},
+                                                   "type": 'function', "index": 0}]))
+
+            self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.result))
+            return None, True
+        elif result.action == Action.ADDSYSTEM: # = (4, "添加系统prompt到对话中去")
+            self.dialogue.put(Message(**result.result))
+            return None, False
+        elif result.action == Action.ADDSYSTEMSPEAK: # = (5, "添加系统prompt到对话中去&主动说话")
+            self.dialogue.put(Message(role='assistant',
+                                      tool_calls=[{"id": function_id, "function": {
+                                          "arguments": json.dumps(function_arguments, ensure_ascii=False),
+                                          "name": function_name},
+                                                   "type": 'function', "index": 0}]))
+
+            self.dialogue.put(Message(role="tool", tool_call_id=function_id, content=result.response))
+            self.dialogue.put(Message(**result.result))
+            self.dialogue.put(Message(role="user", content="ok"))
+            return None, True
+        else:
+            logger.error(f"not found action type: {result.action}")
+        return None, False
+
     def chat(self, query):
+        self._new_turn()
         self.dialogue.put(Message(role="user", content=query))
         response_message = []
         # futures = []
-        start = 0
+        segmenter = SentenceSegmenter(self.segmenter_config)
         self.chat_lock = True
         if self.start_task_mode:
             response_message = self.chat_tool(query)
@@ -375,29 +633,16 @@ class Robot(ABC):
             # 提交 TTS 任务到线程池
             for content in llm_responses:
                 response_message.append(content)
-                response_message_concat = "".join(response_message)
                 end_time = time.time()  # 记录结束时间
                 logger.debug(f"大模型返回时间时间tool: {end_time - start_time} 秒, 生成token={content}")
-                flag_segment, index_segment = is_segment_sentence(response_message_concat, start)
-                logger.debug(
-                    f"大模型返回时间时间tool: flag_segment={flag_segment} 秒, index_segment={index_segment}")
-                if flag_segment:
-                    segment_text = response_message_concat[start:index_segment + 1]
-                    # 为了保证语音的连贯，至少2个字才转tts
-
-                    if len(segment_text) <= 2: #max(2, start):
-                        continue
-                    future = self.executor.submit(self.speak_and_play, segment_text)
-                    self.tts_queue.put(future)
-                    # futures.append(future)
-                    start = index_segment + 1  # len(response_message)
+                segment_text = segmenter.push(content)
+                if segment_text:
+                    self._speak(segment_text)
 
             # 处理剩余的响应
-            response_message_concat = "".join(response_message)
-            if start < len(response_message_concat):
-                segment_text = response_message_concat[start:]
-                future = self.executor.submit(self.speak_and_play, segment_text)
-                self.tts_queue.put(future)
+            segment_text = segmenter.flush()
+            if segment_text:
+                self._speak(segment_text)
             # 等待所有 TTS 任务完成
             """
             for future in futures:
@@ -414,7 +659,6 @@ class Robot(ABC):
             self.callback({"role": "assistant", "content": "".join(response_message)})
         self.dialogue.put(Message(role="assistant", content="".join(response_message)))
         self.dialogue.dump_dialogue()
-        logger.debug(json.dumps(self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False))
         return True
 
 
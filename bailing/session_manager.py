@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from bailing import metrics
+from bailing.utils import get_rss_mb
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """一个用户的会话：robot 实例、最后活跃时间、当前连接编号"""
+    __slots__ = ("user_id", "robot", "last_active", "connection", "detached_at")
+
+    def __init__(self, user_id, robot):
+        self.user_id = user_id
+        self.robot = robot
+        self.last_active = time.time()
+        self.connection = 0
+        # 断开连接的时间，连接中为 None
+        self.detached_at = None
+
+
+class SessionManager:
+    """
+    会话生命周期管理
+    用最小堆按截止时间排序，只在最早的会话到期时唤醒，不再每 10 秒扫描全部会话；
+    收到消息只更新 last_active，堆中的旧截止时间在出堆时检查，过期项重新入堆(惰性删除)。
+    客户端断开后保留 reconnect_grace 秒，期间同一 user_id 重连会复用原会话，
+    超时后在线程池中关闭 robot，释放线程、线程池和模型引用。
+    """
+
+    def __init__(self, idle_timeout=600, reconnect_grace=0):
+        self.idle_timeout = idle_timeout
+        self.reconnect_grace = reconnect_grace
+        self.sessions = {}
+        self._heap = []
+        self._wakeup = None
+        self._task = None
+        self.evicted = metrics.counter("session.evicted")
+        self.reconnected = metrics.counter("session.reconnected")
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self.sessions
+
+    def get(self, user_id):
+        session = self.sessions.get(user_id)
+        return session.robot if session else None
+
+    def items(self):
+        return [(uid, session.robot) for uid, session in list(self.sessions.items())]
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        """服务退出时关闭所有会话"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for user_id in list(self.sessions):
+            await self.evict(user_id, "服务退出")
+
+    def _deadline(self, session):
+        if session.detached_at is not None:
+            return session.detached_at + self.reconnect_grace
+        return session.last_active + self.idle_timeout
+
+    def _schedule(self, session):
+        deadline = self._deadline(session)
+        # 比堆顶还早时唤醒后台任务重新计算等待时间
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (deadline, session.user_id))
+        if self._wakeup is not None and (earliest is None or deadline < earliest):
+            self._wakeup.set()
+
+    def add(self, user_id, robot):
+        """登记新会话，返回本次连接编号"""
+        session = Session(user_id, robot)
+        session.connection = 1
+        self.sessions[user_id] = session
+        self._schedule(session)
+        return session.connection
+
+    def attach(self, user_id, websocket, loop):
+        """同一 user_id 重连：复用原会话，切换到新的 websocket，返回本次连接编号"""
+        session = self.sessions[user_id]
+        if session.detached_at is not None:
+            self.reconnected.inc()
+            logger.info(f"{user_id} 在宽限期内重连，复用原会话")
+        session.connection += 1
+        session.detached_at = None
+        session.last_active = time.time()
+        session.robot.attach_websocket(websocket, loop)
+        self._schedule(session)
+        return session.connection
+
+    def touch(self, user_id):
+        """收到消息时调用，只记录时间，O(1)"""
+        session = self.sessions.get(user_id)
+        if session is not None:
+            session.last_active = time.time()
+
+    async def detach(self, user_id, connection):
+        """
+        客户端断开：没有宽限期时立即释放，否则等待重连
+        connection 不是最新连接时(已被新连接接管)忽略
+        """
+        session = self.sessions.get(user_id)
+        if session is None or session.connection != connection:
+            return
+        if self.reconnect_grace <= 0:
+            await self.evict(user_id, "连接断开")
+            return
+        session.detached_at = time.time()
+        session.robot.recorder.stop_recording()
+        self._schedule(session)
+
+    async def evict(self, user_id, reason):
+        session = self.sessions.pop(user_id, None)
+        if session is None:
+            return
+        rss_before = get_rss_mb()
+        # shutdown 会等待线程退出，放到线程池中避免阻塞事件循环
+        try:
+            if hasattr(session.robot, "aclose"):
+                await session.robot.aclose()
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, session.robot.shutdown)
+        except Exception as e:
+            logger.error(f"{user_id} 对应的robot释放出错: {e}")
+        self.evicted.inc()
+        logger.info(f"{user_id} 对应的robot已释放({reason})，剩余会话 {len(self.sessions)}，"
+                    f"进程内存 {rss_before:.1f} -> {get_rss_mb():.1f} MB")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, user_id = heapq.heappop(self._heap)
+                session = self.sessions.get(user_id)
+                if session is None:
+                    continue
+                deadline = self._deadline(session)
+                if deadline > now:
+                    # 期间有活跃，按新的截止时间重新入堆
+                    heapq.heappush(self._heap, (deadline, user_id))
+                    continue
+                reason = "重连超时" if session.detached_at is not None else "长时间不活跃"
+                await self.evict(user_id, reason)
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+
+from bailing import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING, COMMITTED, CANCELLED = "pending", "committed", "cancelled"
+
+
+class Speculation:
+    """
+    一次推测执行：VAD 报告暂定停顿(end)后立即开始 ASR + LLM + TTS，
+    合成好的音频先暂存不播放；用户继续说话则取消，静音得到确认则立即提交播放
+    """
+
+    def __init__(self, turn_id, confirm_frames):
+        self.turn_id = turn_id
+        self.confirm_frames = confirm_frames
+        self.silent_frames = 0
+        self.state = PENDING
+        # 提交时 Robot 需要在同一把锁里设置 chat_lock，所以用可重入锁
+        self.lock = threading.RLock()
+        self.decided = threading.Event()
+        # 暂存的 (turn_id, tts future)，提交时按顺序放入 tts_queue
+        self.pending = []
+        # LLM 流是否结束
+        self.done = False
+        # 需要调用工具时不做推测，确认后走正常流程
+        self.fallback = False
+        self.start_time = time.time()
+        self.first_audio_time = None
+
+    def tick(self):
+        """每收到一帧静音调用一次，返回静音是否已经确认"""
+        self.silent_frames += 1
+        return self.silent_frames >= self.confirm_frames
+
+    def _on_audio_ready(self, future):
+        if self.first_audio_time is None and not future.cancelled():
+            self.first_audio_time = time.time()
+
+    def hold(self, future, tts_queue):
+        """推测期间合成的音频先暂存，已提交则直接入队，已取消则丢弃"""
+        with self.lock:
+            if self.state == CANCELLED:
+                future.cancel()
+                return
+            if self.state == COMMITTED:
+                tts_queue.put((self.turn_id, future))
+                return
+            future.add_done_callback(self._on_audio_ready)
+            self.pending.append((self.turn_id, future))
+
+    def commit(self, tts_queue):
+        """静音确认：暂存的音频立即开始播放，返回节省的时间(秒)"""
+        now = time.time()
+        with self.lock:
+            self.state = COMMITTED
+            for item in self.pending:
+                tts_queue.put(item)
+            self.pending = []
+        self.decided.set()
+        # 推测提前开始的时间，最多算到第一段音频合成好为止
+        ready = self.first_audio_time if self.first_audio_time is not None else now
+        return max(0.0, min(ready, now) - self.start_time)
+
+    def cancel(self):
+        with self.lock:
+            self.state = CANCELLED
+            for _, future in self.pending:
+                future.cancel()
+            self.pending = []
+        self.decided.set()
+
+    def wait(self, stop_event, interval=0.5):
+        """推测线程等待确认或取消，返回是否已提交"""
+        while not self.decided.wait(interval):
+            if stop_event.is_set():
+                return False
+        return self.state == COMMITTED
+
+
+class SpeculationStats:
+    """推测命中率和节省的时延"""
+
+    def __init__(self):
+        self.hit = metrics.counter("speculative.hit")
+        self.miss = metrics.counter("speculative.miss")
+        self.saved = metrics.latency("speculative.saved")
+        self.hits = 0
+        self.misses = 0
+
+    def record_hit(self, saved):
+        self.hits += 1
+        self.hit.inc()
+        self.saved.add(saved)
+        logger.info(f"推测命中，节省 {saved * 1000:.0f} ms，本会话命中率 {self.hit_rate():.0%}")
+
+    def record_miss(self):
+        self.misses += 1
+        self.miss.inc()
+        logger.info(f"推测未命中(用户继续说话)，本会话命中率 {self.hit_rate():.0%}")
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,29 +1,60 @@
 import asyncio
 import logging
 import os
+import queue
 import subprocess
+import threading
 import time
 import uuid
 from abc import ABC, ABCMeta, abstractmethod
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from gtts import gTTS
 import edge_tts
 import ChatTTS
+import numpy as np
 import torch
 import torchaudio
 import soundfile as sf
+from pydub import AudioSegment
 from kokoro import KModel, KPipeline
 
+from bailing import metrics
+from bailing.archive import get_archive
+from bailing.model_pool import ModelPool
+from bailing.resources import get_resources
+
 logger = logging.getLogger(__name__)
 
 
 class AbstractTTS(ABC):
     __metaclass__ = ABCMeta
+    # 从 ModelPool 获取的模型，会话结束时释放
+    model_keys = ()
 
     @abstractmethod
     def to_tts(self, text):
         pass
 
+    def to_pcm(self, text):
+        """
+        返回 (int16 单声道 PCM, 采样率)，用于流式下行
+        默认先合成文件再解码，能直接拿到音频数据的子类应覆盖此方法
+        """
+        tts_file = self.to_tts(text)
+        if not tts_file:
+            return None, None
+        audio = AudioSegment.from_file(tts_file).set_channels(1).set_sample_width(2)
+        get_archive().discard(tts_file)
+        return np.frombuffer(audio.raw_data, dtype=np.int16), audio.frame_rate
+
+    def close(self):
+        """会话结束时释放共享模型的引用"""
+        pool = ModelPool()
+        for key in self.model_keys:
+            pool.release(key)
+        self.model_keys = ()
+
 
 class GTTS(AbstractTTS):
     def __init__(self, config):
@@ -123,10 +154,16 @@ class EdgeTTS(AbstractTTS):
 class CHATTTS(AbstractTTS):
     def __init__(self, config):
         self.output_file = config.get("output_file", ".")
-        self.chat = ChatTTS.Chat()
-        self.chat.load(compile=False)  # Set to True for better performance
+        self.chat = ModelPool().get(("CHATTTS",), self._load_chat)
+        self.model_keys = [("CHATTTS",)]
         self.rand_spk = self.chat.sample_random_speaker()
 
+    @staticmethod
+    def _load_chat():
+        chat = ChatTTS.Chat()
+        chat.load(compile=False)  # Set to True for better performance
+        return chat
+
     def _generate_filename(self, extension=".wav"):
         return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
 
@@ -148,11 +185,12 @@ class CHATTTS(AbstractTTS):
             params_refine_text = ChatTTS.Chat.RefineTextParams(
                 prompt='[oral_2][laugh_0][break_6]',
             )
-            wavs = self.chat.infer(
-                [text],
-                params_refine_text=params_refine_text,
-                params_infer_code=params_infer_code,
-            )
+            with get_resources().slot("CHATTTS"):
+                wavs = self.chat.infer(
+                    [text],
+                    params_refine_text=params_refine_text,
+                    params_infer_code=params_infer_code,
+                )
             try:
                 torchaudio.save(tmpfile, torch.from_numpy(wavs[0]).unsqueeze(0), 24000)
             except:
@@ -199,6 +237,79 @@ class CHATTTS(AbstractTTS):
 #             return None
 
 
+class KokoroEngine:
+    """
+    所有会话共享、串行执行的 Kokoro 合成引擎，不做批量前向
+    G2P 在调用方线程完成，这里只排队做 KModel 前向：每轮在 max_wait_ms 内最多取出
+    max_drain 个排队的请求，相同 (音素, 音色, 语速) 的请求只推理一次，再按音素长度
+    短句优先，由固定数量的 worker 逐条推理。
+    KModel 的前向只支持 batch=1（时长对齐依赖 squeeze），
+    共享引擎避免的是多会话多线程同时前向造成的 CPU 争抢
+    """
+    def __init__(self, model, max_drain=8, max_wait_ms=5, workers=1):
+        self.model = model
+        self.max_drain = max_drain
+        self.max_wait = max_wait_ms / 1000.0
+        self.request_queue = queue.Queue()
+        self.queue_latency = metrics.latency("tts.kokoro.queue")
+        self.infer_latency = metrics.latency("tts.kokoro.infer")
+        # 取出的请求数与实际前向次数，两者之差即去重节省的前向
+        self.requests = metrics.counter("tts.kokoro.requests")
+        self.forwards = metrics.counter("tts.kokoro.forwards")
+        self.dedup_hits = metrics.counter("tts.kokoro.dedup")
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for t in self.threads:
+            t.start()
+        logger.info(f"Kokoro 合成引擎已启动，max_drain={max_drain}, max_wait_ms={max_wait_ms}, workers={workers}")
+
+    def submit(self, ps, voice, pack, speed) -> Future:
+        future = Future()
+        self.request_queue.put((ps, voice, pack, speed, time.time(), future))
+        return future
+
+    def _drain(self):
+        pending = [self.request_queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(pending) < self.max_drain:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._drain()
+            self.requests.inc(len(pending))
+            # 相同输入合并，短句优先，减少排队中短句的等待
+            groups = {}
+            for ps, voice, pack, speed, submit_time, future in pending:
+                self.queue_latency.add(time.time() - submit_time)
+                groups.setdefault((ps, voice, speed), (pack, []))[1].append(future)
+            for (ps, voice, speed), (pack, futures) in sorted(groups.items(), key=lambda item: len(item[0][0])):
+                # 调用方等待超时后会取消请求，全部取消时不再前向
+                futures = [future for future in futures if future.set_running_or_notify_cancel()]
+                if not futures:
+                    continue
+                self.dedup_hits.inc(len(futures) - 1)
+                self.forwards.inc()
+                start_time = time.time()
+                try:
+                    with get_resources().slot("KOKOROTTS"), torch.inference_mode():
+                        output = self.model(ps, pack[len(ps) - 1], speed, return_output=True)
+                    audio = output.audio.cpu().numpy()
+                    self.infer_latency.add(time.time() - start_time)
+                    for future in futures:
+                        future.set_result(audio)
+                except Exception as e:
+                    logger.error(f"[KokoroEngine] 合成失败: {e}")
+                    for future in futures:
+                        future.set_exception(e)
+
+
 class KOKOROTTS(AbstractTTS):
     def __init__(self, config):
         """
@@ -219,17 +330,33 @@ class KOKOROTTS(AbstractTTS):
         # device selection
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
+        # 模型和 pipeline 进程内共享，会话只保留自己的 voice 等配置
+        self.model_key = ("KOKOROTTS", self.repo_id, self.lang, self.device)
+        self.model, self.en_pipeline, self.pipeline = ModelPool().get(self.model_key, self._load_pipelines)
+        self.model_keys = [self.model_key]
+
+        # 多会话共享的合成引擎，默认关闭
+        engine_config = config.get("engine") or {}
+        self.engine = None
+        if engine_config.get("enabled", False) and self.model is not None:
+            self.engine = ModelPool().get(("KokoroEngine",) + self.model_key[1:], lambda: KokoroEngine(
+                self.model,
+                max_drain=engine_config.get("max_drain", 8),
+                max_wait_ms=engine_config.get("max_wait_ms", 5),
+                workers=engine_config.get("workers", 1),
+            ))
+            self.model_keys.append(("KokoroEngine",) + self.model_key[1:])
+        # 等待引擎合成结果的超时，避免引擎积压或异常时会话一直阻塞
+        self.engine_timeout = engine_config.get("timeout_s", 10)
+
+    def _load_pipelines(self):
         # load model if Chinese TTS
-        self.model = None
+        model = None
         if self.lang == "z":
-            self.model = KModel(repo_id=self.repo_id).to(self.device).eval()
+            model = KModel(repo_id=self.repo_id).to(self.device).eval()
 
-        # set up pipelines
-        self._setup_pipelines()
-
-    def _setup_pipelines(self):
         # English/IPA fallback pipeline
-        self.en_pipeline = KPipeline(
+        en_pipeline = KPipeline(
             lang_code="a", repo_id=self.repo_id, model=False
         )
 
@@ -238,17 +365,16 @@ class KOKOROTTS(AbstractTTS):
                 return "kˈOkəɹO"
             elif text == "Sol":
                 return "sˈOl"
-            return next(self.en_pipeline(text)).phonemes
-
-        self.en_callable = en_callable
+            return next(en_pipeline(text)).phonemes
 
         # Main TTS pipeline
-        self.pipeline = KPipeline(
+        pipeline = KPipeline(
             lang_code=self.lang,
             repo_id=self.repo_id,
-            model=self.model,
-            en_callable=self.en_callable
+            model=model,
+            en_callable=en_callable
         )
+        return model, en_pipeline, pipeline
 
     def _generate_filename(self, extension=".wav"):
         fname = f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}"
@@ -270,6 +396,44 @@ class KOKOROTTS(AbstractTTS):
             speed = 1.0 - (len_ps - 83) / 500.0
         return speed * 1.1
 
+    def _engine_tts(self, text: str):
+        """G2P 在当前线程完成，前向交给共享引擎"""
+        ps, _ = self.pipeline.g2p(text)
+        if len(ps) > 510:
+            ps = ps[:510]
+        pack = self.pipeline.load_voice(self.voice).to(self.device)
+        future = self.engine.submit(ps, self.voice, pack, self._speed_callable(len(ps)))
+        try:
+            return future.result(timeout=self.engine_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RuntimeError(f"等待合成引擎结果超过 {self.engine_timeout} 秒")
+
+    def _synthesize(self, text: str):
+        if self.engine is not None:
+            return self._engine_tts(text.replace("\n", " "))
+        generator = self.pipeline(
+            text.replace("\n", " "),
+            voice=self.voice,
+            speed=self._speed_callable,
+            #split_pattern=r"\n+"
+        )
+        with get_resources().slot("KOKOROTTS"):
+            result = next(generator)
+        return result.audio
+
+    def to_pcm(self, text: str):
+        """直接返回合成的 PCM，不落盘"""
+        start_time = time.time()
+        try:
+            wav = np.asarray(self._synthesize(text), dtype=np.float32)
+            pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype(np.int16)
+            self._log_execution_time(start_time)
+            return pcm, self.sample_rate
+        except Exception as e:
+            logger.error(f"[KOKOROTTS] Failed to generate TTS: {e}")
+            return None, None
+
     def to_tts(self, text: str) -> str:
         """
         Generate TTS for `text`. Returns path to the combined WAV file.
@@ -278,14 +442,7 @@ class KOKOROTTS(AbstractTTS):
         start_time = time.time()
 
         try:
-            generator = self.pipeline(
-                text.replace("\n", " "),
-                voice=self.voice,
-                speed=self._speed_callable,
-                #split_pattern=r"\n+"
-            )
-            result = next(generator)
-            wav = result.audio
+            wav = self._synthesize(text)
             sf.write(output_file, wav, self.sample_rate)
 
             self._log_execution_time(start_time)
@@ -295,6 +452,33 @@ class KOKOROTTS(AbstractTTS):
             return ""
 
 
+class MockTTS(AbstractTTS):
+    """
+    本地替身，生成与文本长度相当的正弦音，按 rtf 模拟合成耗时，用于离线压测
+    """
+    def __init__(self, config):
+        self.output_file = config.get("output_file", "tmp/")
+        self.sample_rate = config.get("sample_rate", 24000)
+        self.chars_per_second = config.get("chars_per_second", 5)
+        self.rtf = config.get("rtf", 0.1)  # 合成耗时 / 音频时长
+
+    def _generate_filename(self, extension=".wav"):
+        return os.path.join(self.output_file, f"tts-{datetime.now().date()}@{uuid.uuid4().hex}{extension}")
+
+    def to_pcm(self, text):
+        duration = max(0.2, len(text) / self.chars_per_second)
+        time.sleep(duration * self.rtf)
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        pcm = (0.2 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+        return pcm, self.sample_rate
+
+    def to_tts(self, text):
+        tmpfile = self._generate_filename(".wav")
+        pcm, sample_rate = self.to_pcm(text)
+        sf.write(tmpfile, pcm, sample_rate)
+        return tmpfile
+
+
 def create_instance(class_name, *args, **kwargs):
     # 获取类对象
     cls = globals().get(class_name)
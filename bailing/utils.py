@@ -1,3 +1,5 @@
+import os
+import sys
 import yaml
 import json
 import re
@@ -25,9 +27,45 @@ def write_json_file(file_path, data):
         json.dump(data, file, ensure_ascii=False, indent=4)
 
 
+def get_rss_mb():
+    """获取当前进程常驻内存(MB)"""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except Exception:
+        pass
+    try:
+        import resource
+        # 非 Linux 平台取峰值内存，macOS 单位为字节，Linux 为 KB
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+    except Exception:
+        return 0.0
+
+
+def merge_config(base, override):
+    """字典逐层合并，列表和其他值整体覆盖，不修改传入的配置"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
 def read_config(config_path):
+    """
+    读取 yaml 配置，文件中有 base 时先读取 base 指向的配置(相对当前文件所在目录)，
+    再把当前文件的内容合并上去，用于只写差异的覆盖配置
+    """
     with open(config_path, "r",encoding="utf-8") as file:
-        config = yaml.safe_load(file)
+        config = yaml.safe_load(file) or {}
+    base = config.pop("base", None)
+    if base:
+        base_path = os.path.join(os.path.dirname(config_path), base)
+        config = merge_config(read_config(base_path), config)
     return config
 
 
@@ -43,6 +81,79 @@ def is_segment_sentence(tokens, start_index):
             return True, i
     return False, None
 
+# 可以分段送 TTS 的标点，以及其中的句末标点
+SEGMENT_PUNCTUATION = frozenset(",.?，。？！!;；:：")
+SENTENCE_END_PUNCTUATION = frozenset(".?。？！!;；")
+
+
+class SentenceSegmenter:
+    """
+    流式分句：LLM 每输出一个 token 只扫描这个 token，记住当前未输出文本中最后一个标点的位置，
+    不再每次拼接全文再从尾部回扫，总开销与回复长度成线性关系。
+    第一段在第一个标点(通常是逗号)处立即输出，缩短首包时延；之后的分段在句末标点处输出，
+    且长度至少为 min_chars，并按 growth 逐段增大(不超过 max_chars)，让 TTS 调用更少、每次更长；
+    只有逗号时累积超过 max_chars 也在最后一个标点处输出。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        # 为了保证语音的连贯，第一段至少 first_min_chars + 1 个字
+        self.first_min_chars = config.get("first_min_chars", 2)
+        self.min_chars = config.get("min_chars", 10)
+        self.growth = config.get("growth", 1.5)
+        self.max_chars = config.get("max_chars", 80)
+        self.parts = []
+        self.length = 0
+        # 未输出文本中最后一个标点、最后一个句末标点之后的位置，0 表示没有
+        self.cut = 0
+        self.sentence_cut = 0
+        self.segments = 0
+
+    def _target(self):
+        return min(self.max_chars, self.min_chars * self.growth ** (self.segments - 1))
+
+    def _scan(self, text, offset):
+        for i, ch in enumerate(text):
+            if ch in SEGMENT_PUNCTUATION:
+                self.cut = offset + i + 1
+                if ch in SENTENCE_END_PUNCTUATION:
+                    self.sentence_cut = self.cut
+
+    def _emit(self, cut):
+        pending = "".join(self.parts)
+        segment, rest = pending[:cut], pending[cut:]
+        self.parts = [rest] if rest else []
+        self.length = len(rest)
+        self.cut = self.sentence_cut = 0
+        # 剩余部分很短(最后一个标点之后的内容)，重新扫描一遍
+        self._scan(rest, 0)
+        self.segments += 1
+        return segment
+
+    def push(self, token):
+        """追加一个 token，返回可以送去 TTS 的分段，没有时返回 None"""
+        if not token:
+            return None
+        self._scan(token, self.length)
+        self.parts.append(token)
+        self.length += len(token)
+        if self.segments == 0:
+            if self.cut > self.first_min_chars:
+                return self._emit(self.cut)
+            return None
+        if self.sentence_cut and self.sentence_cut >= self._target():
+            return self._emit(self.sentence_cut)
+        if self.cut >= self.max_chars:
+            return self._emit(self.cut)
+        return None
+
+    def flush(self):
+        """回复结束，返回剩余的文本"""
+        if not self.parts:
+            return None
+        return self._emit(self.length)
+
+
 def is_interrupt(query: str):
     for interrupt_word in ("停一下", "听我说", "不要说了", "stop", "hold on", "excuse me"):
         if query.lower().find(interrupt_word)>=0:
@@ -56,3 +167,41 @@ def extract_json_from_string(input_string):
     if match:
         return match.group(1)  # 返回提取的 JSON 字符串
     return None
+
+
+if __name__ == "__main__":
+    # 长回复分句的耗时对比：python -m bailing.utils [回复字数]
+    import time
+
+    reply_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    clause = "今天北京天气晴朗，最高气温二十五度，适合出门散步。"
+    tokens = [ch for ch in (clause * (reply_chars // len(clause) + 1))[:reply_chars]]
+
+    start_time = time.perf_counter()
+    response_message, start, old_segments = [], 0, []
+    for token in tokens:
+        response_message.append(token)
+        concat = "".join(response_message)
+        flag, index = is_segment_sentence(concat, start)
+        if flag and index + 1 - start > 2:
+            old_segments.append(concat[start:index + 1])
+            start = index + 1
+    old_cost = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    segmenter, new_segments = SentenceSegmenter(), []
+    for token in tokens:
+        segment = segmenter.push(token)
+        if segment:
+            new_segments.append(segment)
+    rest = segmenter.flush()
+    if rest:
+        new_segments.append(rest)
+    new_cost = time.perf_counter() - start_time
+    assert "".join(new_segments) == "".join(tokens)
+
+    print(f"{reply_chars} 字回复，每字一个 token")
+    print(f"is_segment_sentence: {old_cost * 1000:.1f} ms，TTS 调用 {len(old_segments)} 次，"
+          f"首段 {len(old_segments[0])} 字")
+    print(f"SentenceSegmenter:   {new_cost * 1000:.1f} ms，TTS 调用 {len(new_segments)} 次，"
+          f"首段 {len(new_segments[0])} 字，平均每段 {reply_chars / len(new_segments):.1f} 字")
@@ -1,18 +1,35 @@
+import asyncio
 import os
+import queue
+import threading
+import time
 import uuid
 import wave
 from abc import ABC, abstractmethod
+from contextlib import contextmanager, ExitStack
 import logging
 from datetime import datetime
 
 import numpy as np
 import torch
-from silero_vad import load_silero_vad, VADIterator
+from silero_vad import load_silero_vad
+
+try:
+    import onnxruntime
+except ImportError:  # 可选依赖：pip install onnxruntime
+    onnxruntime = None
+
+from bailing import metrics
+from bailing.model_pool import ModelPool
+from bailing.resources import get_resources
 
 logger = logging.getLogger(__name__)
 
+INT16_SCALE = np.float32(1.0 / 32768)
 
 class VAD(ABC):
+    # 从 ModelPool 获取的模型，会话结束时释放
+    model_keys = ()
     @abstractmethod
     def is_vad(self, data):
         pass
@@ -20,19 +37,339 @@ class VAD(ABC):
     def reset_states(self):
         pass
 
+    def is_vad_batch(self, frames):
+        """积压时一次处理多帧，按顺序返回每帧的结果"""
+        return [self.is_vad(data) for data in frames]
+
+    def start_stream(self, audio_queue, vad_queue):
+        """
+        交给共享调度器处理音频流，返回 True 表示已接管，
+        调用方不需要再启动自己的 VAD 线程
+        """
+        return False
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        """会话结束时释放共享模型的引用"""
+        pool = ModelPool()
+        for key in self.model_keys:
+            pool.release(key)
+        self.model_keys = ()
+
+
+class SileroStream:
+    """
+    批量调度时单个会话的 VAD 状态：Silero 的循环状态 + VADIterator 的触发逻辑
+    """
+    def __init__(self, threshold, sampling_rate, min_silence_duration_ms, speech_pad_ms=30):
+        self.threshold = threshold
+        self.sampling_rate = sampling_rate
+        self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
+        self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+        self.context_size = 64 if sampling_rate == 16000 else 32
+        self.reset_states()
+
+    def reset_states(self):
+        self.state = torch.zeros((2, 1, 128))
+        self.context = torch.zeros((1, self.context_size))
+        self.triggered = False
+        self.temp_end = 0
+        self.current_sample = 0
+
+    def step(self, speech_prob, window_size_samples):
+        """与 VADIterator.__call__ 一致，输入的是已经算好的语音概率"""
+        self.current_sample += window_size_samples
+
+        if (speech_prob >= self.threshold) and self.temp_end:
+            self.temp_end = 0
+
+        if (speech_prob >= self.threshold) and not self.triggered:
+            self.triggered = True
+            speech_start = max(0, self.current_sample - self.speech_pad_samples - window_size_samples)
+            return {'start': int(speech_start)}
+
+        if (speech_prob < self.threshold - 0.15) and self.triggered:
+            if not self.temp_end:
+                self.temp_end = self.current_sample
+            if self.current_sample - self.temp_end < self.min_silence_samples:
+                return None
+            speech_end = self.temp_end + self.speech_pad_samples - window_size_samples
+            self.temp_end = 0
+            self.triggered = False
+            return {'end': int(speech_end)}
+
+        return None
+
+
+class EnergyGate:
+    """
+    Silero 之前的低成本门限：帧能量和过零率，带迟滞
+    能量高于 open_db，或高于 close_db 且过零率较高(清辅音)时打开；
+    能量低于 close_db 后再持续 hangover_ms 才关闭，关闭时的帧可以不跑模型
+    """
+    def __init__(self, open_db=-45, close_db=-55, zcr_min=0.1, hangover_ms=300, frame_ms=32):
+        # 与 dBFS 对应的均方能量，避免每帧取对数
+        self.open_power = 10 ** (open_db / 10)
+        self.close_power = 10 ** (close_db / 10)
+        self.zcr_min = zcr_min
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+        self.hangover = 0
+        self.is_open = False
+
+    def update(self, frame):
+        """frame 为 -1~1 的 float32 帧，返回门限是否打开"""
+        power = float(np.dot(frame, frame)) / len(frame)
+        speech_possible = power >= self.open_power
+        if not speech_possible and power >= self.close_power:
+            zcr = np.count_nonzero(np.signbit(frame[1:]) != np.signbit(frame[:-1])) / len(frame)
+            speech_possible = zcr >= self.zcr_min or self.is_open
+        if speech_possible:
+            self.is_open = True
+            self.hangover = self.hangover_frames
+        elif self.hangover > 0:
+            self.hangover -= 1
+        else:
+            self.is_open = False
+        return self.is_open
+
+    def reset(self):
+        self.hangover = 0
+        self.is_open = False
+
+
+class VADScheduler:
+    """
+    所有会话共享的 VAD 调度器
+    每个 tick 从各会话的 audio_queue 各取一帧，拼成一个 batch 做一次前向，
+    各会话的循环状态分开保存，结果写回各自的 vad_queue
+    """
+    def __init__(self, model, lock, sampling_rate, tick_ms=10, max_batch_size=64):
+        self.model = model
+        self.lock = lock
+        self.sampling_rate = sampling_rate
+        self.window_size_samples = 512 if sampling_rate == 16000 else 256
+        self.tick = tick_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.latency = metrics.latency("vad.batch")
+        self.batch_calls = metrics.counter("vad.batch.calls")
+        self.batch_frames = metrics.counter("vad.batch.frames")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"VAD 批量调度器已启动，tick_ms={tick_ms}, max_batch_size={max_batch_size}")
+
+    def register(self, stream, audio_queue, vad_queue):
+        with self.sessions_lock:
+            self.sessions[id(stream)] = (stream, audio_queue, vad_queue)
+
+    def unregister(self, stream):
+        with self.sessions_lock:
+            self.sessions.pop(id(stream), None)
+
+    def _collect(self):
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        batch = []
+        for stream, audio_queue, vad_queue in sessions:
+            if len(batch) >= self.max_batch_size:
+                break
+            try:
+                data = audio_queue.get_nowait()
+            except queue.Empty:
+                continue
+            # 会话关闭时放入的 None 只用于唤醒，调度器不处理
+            if data is None:
+                continue
+            batch.append((stream, vad_queue, data))
+        return batch
+
+    def _infer(self, batch):
+        x = torch.from_numpy(np.stack(
+            [np.frombuffer(data, dtype=np.int16) for _, _, data in batch]
+        ).astype(np.float32) / 32768.0)
+        state = torch.cat([stream.state for stream, _, _ in batch], dim=1)
+        context = torch.cat([stream.context for stream, _, _ in batch], dim=0)
+        with get_resources().slot("SileroVAD"), self.lock:
+            self.model._state = state
+            self.model._context = context
+            self.model._last_sr = self.sampling_rate
+            self.model._last_batch_size = len(batch)
+            probs = self.model(x, self.sampling_rate)
+            state = self.model._state
+            context = self.model._context
+        for i, (stream, _, _) in enumerate(batch):
+            stream.state = state[:, i:i + 1]
+            stream.context = context[i:i + 1]
+        return probs.view(-1).tolist()
+
+    def _run(self):
+        # 所有会话的 VAD 都依赖这一个线程，单个 batch 出错只记录日志，线程继续运行
+        while True:
+            try:
+                batch = self._collect()
+                if not batch:
+                    time.sleep(self.tick)
+                    continue
+                self._process(batch)
+            except Exception as e:
+                logger.error(f"VAD 调度器处理出错: {e}")
+                time.sleep(self.tick)
+
+    def _process(self, batch):
+        # 帧长不一致无法拼 batch，直接跳过
+        frames = [item for item in batch if len(item[2]) == self.window_size_samples * 2]
+        for stream, vad_queue, data in batch:
+            if len(data) != self.window_size_samples * 2:
+                logger.warning(f"VAD 帧长度 {len(data)} 字节不符合要求，跳过")
+                vad_queue.put({"voice": data, "vad_statue": None})
+        if not frames:
+            return
+        start_time = time.time()
+        try:
+            probs = self._infer(frames)
+        except Exception as e:
+            logger.error(f"VAD 批量处理出错: {e}")
+            for stream, vad_queue, data in frames:
+                vad_queue.put({"voice": data, "vad_statue": None})
+            return
+        self.latency.add(time.time() - start_time)
+        self.batch_calls.inc()
+        self.batch_frames.inc(len(frames))
+        for (stream, vad_queue, data), prob in zip(frames, probs):
+            vad_statue = stream.step(prob, self.window_size_samples)
+            if vad_statue is not None:
+                logger.debug(f"VAD output: {vad_statue}")
+            vad_queue.put({"voice": data, "vad_statue": vad_statue})
+
+
+class SessionSileroModel:
+    """
+    共享 Silero 模型的会话句柄
+    Silero 的循环状态保存在模型对象内部，多个会话共享同一模型时，
+    每次推理前换入本会话的状态，推理后再换出，互不干扰
+    """
+    def __init__(self, model, lock):
+        self.model = model
+        self.lock = lock
+        self._state = None
+        self._context = None
+
+    def __call__(self, x, sr):
+        with self.lock:
+            if self._state is None:
+                self.model.reset_states()
+            else:
+                self.model._state = self._state
+                self.model._context = self._context
+                self.model._last_sr = sr
+                self.model._last_batch_size = 1
+            out = self.model(x, sr)
+            self._state = self.model._state
+            self._context = self.model._context
+        return out
+
+    def reset_states(self):
+        self._state = None
+        self._context = None
+
+    @contextmanager
+    def session(self, sr):
+        """连续处理多帧时只换入/换出一次状态，期间直接调用返回的共享模型"""
+        with self.lock:
+            if self._state is None:
+                self.model.reset_states()
+            else:
+                self.model._state = self._state
+                self.model._context = self._context
+                self.model._last_sr = sr
+                self.model._last_batch_size = 1
+            try:
+                yield self.model
+            finally:
+                self._state = self.model._state
+                self._context = self.model._context
+
 
 class SileroVAD(VAD):
+    model_key = ("SileroVAD",)
+    latency_metric = "vad.frame"
+
     def __init__(self, config):
-        print("SileroVAD", config)
-        self.model = load_silero_vad()
+        print(type(self).__name__, config)
+        pool = ModelPool()
         self.sampling_rate = config.get("sampling_rate")
         self.threshold = config.get("threshold")
         self.min_silence_duration_ms = config.get("min_silence_duration_ms")
-        self.vad_iterator = VADIterator(self.model,
-                            threshold=self.threshold,
-                            sampling_rate=self.sampling_rate,
-                            min_silence_duration_ms=self.min_silence_duration_ms)
-        logger.debug(f"VAD Iterator initialized with model {self.model}")
+        self.window_size_samples = 512 if self.sampling_rate == 16000 else 256
+        # 每个会话只持有自己的状态
+        self.model_keys = [self.model_key]
+        shared_model = self._load_model(config, pool)
+        # 触发逻辑与 VADIterator 一致，批量调度时循环状态也保存在这里
+        self.stream = SileroStream(self.threshold, self.sampling_rate, self.min_silence_duration_ms)
+
+        # 能量/过零率门限，静音且未触发时跳过模型，默认关闭
+        gate_config = config.get("gate") or {}
+        self.gate = None
+        self.preroll = 0
+        if gate_config.get("enabled", False):
+            self.gate = EnergyGate(open_db=gate_config.get("open_db", -45),
+                                   close_db=gate_config.get("close_db", -55),
+                                   zcr_min=gate_config.get("zcr_min", 0.1),
+                                   hangover_ms=gate_config.get("hangover_ms", 300),
+                                   frame_ms=self.window_size_samples * 1000 / self.sampling_rate)
+            # 门限打开时先用之前跳过的几帧预热模型状态，避免起始段被漏掉
+            self.preroll = gate_config.get("preroll", 2)
+        self.skipped_run = 0
+        self.gate_frames = metrics.counter("vad.gate.frames")
+        self.gate_skipped = metrics.counter("vad.gate.skipped")
+
+        # 预分配的帧环形缓冲：int16 直接换算写入，每帧不再创建新的 numpy 数组和 tensor
+        # 多留 preroll 行，保证预热用的前几帧不会被同一批的新帧覆盖
+        self.max_drain = config.get("max_drain", 32)
+        self.ring_size = self.max_drain + self.preroll
+        self.ring = np.zeros((self.ring_size, self.window_size_samples), dtype=np.float32)
+        self.ring_input = self._wrap_ring(self.ring)
+        self.ring_head = 0
+        self.frame_latency = metrics.latency(self.latency_metric)
+
+        # 多会话批量调度，默认关闭
+        batch_config = config.get("batch") or {}
+        self.scheduler = None
+        if batch_config.get("enabled", False) and shared_model is None:
+            logger.warning(f"{type(self).__name__} 不支持批量调度，忽略 batch 配置")
+        elif batch_config.get("enabled", False):
+            self.scheduler = pool.get(("SileroVADScheduler", self.sampling_rate), lambda: VADScheduler(
+                shared_model,
+                pool.infer_lock(self.model_key),
+                self.sampling_rate,
+                tick_ms=batch_config.get("tick_ms", 10),
+                max_batch_size=batch_config.get("max_batch_size", 64),
+            ))
+            self.model_keys.append(("SileroVADScheduler", self.sampling_rate))
+
+    def _load_model(self, config, pool):
+        """加载共享模型，设置 self.model，返回供批量调度使用的共享模型"""
+        shared_model = pool.get(self.model_key, load_silero_vad)
+        self.model = SessionSileroModel(shared_model, pool.infer_lock(self.model_key))
+        return shared_model
+
+    @staticmethod
+    def _wrap_ring(ring):
+        # 与 ring 共享内存的 tensor，按行取出即可送入模型
+        return torch.from_numpy(ring)
+
+    def start_stream(self, audio_queue, vad_queue):
+        if self.scheduler is None:
+            return False
+        self.scheduler.register(self.stream, audio_queue, vad_queue)
+        return True
+
+    def stop_stream(self):
+        if self.scheduler is not None:
+            self.scheduler.unregister(self.stream)
 
     @staticmethod
     def int2float(sound):
@@ -43,25 +380,155 @@ class SileroVAD(VAD):
         return sound
 
     def is_vad(self, data):
-        try:
-            audio_int16 = np.frombuffer(data, dtype=np.int16)
-            audio_float32 = self.int2float(audio_int16)
-            vad_output = self.vad_iterator(torch.from_numpy(audio_float32))
-            if vad_output is not None:
-                logger.debug(f"VAD output: {vad_output}")
-            return vad_output
-        except Exception as e:
-            logger.error(f"Error in VAD processing: {e}")
-            return None
+        return self.is_vad_batch([data])[0]
+
+    def is_vad_batch(self, frames):
+        """
+        一次处理多帧：先把各帧换算写入环形缓冲，再在一次加锁、一次状态换入内逐帧前向，
+        Silero 是循环网络，同一会话的帧之间有依赖，只能按顺序推理，start/end 事件保持原有顺序
+        """
+        results = [None] * len(frames)
+        frame_bytes = self.window_size_samples * 2
+        for offset in range(0, len(frames), self.max_drain):
+            chunk = frames[offset:offset + self.max_drain]
+            start_time = time.time()
+            slots = []
+            for data in chunk:
+                if len(data) != frame_bytes:
+                    logger.warning(f"VAD 帧长度 {len(data)} 字节不符合要求，跳过")
+                    slots.append(None)
+                    continue
+                slot = self.ring_head
+                self.ring_head = (slot + 1) % self.ring_size
+                np.multiply(np.frombuffer(data, dtype=np.int16), INT16_SCALE, out=self.ring[slot])
+                slots.append(slot)
+            try:
+                # 整批都被门限跳过时不加锁、不换入状态
+                with ExitStack() as stack:
+                    model = None
+                    for i, slot in enumerate(slots):
+                        if slot is None:
+                            continue
+                        if self._gate_skip(slot):
+                            # 只推进时间，未触发时 prob=0 不会产生事件
+                            results[offset + i] = self.stream.step(0.0, self.window_size_samples)
+                            continue
+                        if model is None:
+                            stack.enter_context(get_resources().slot(type(self).__name__))
+                            model = stack.enter_context(self.model.session(self.sampling_rate))
+                        for prev in range(min(self.preroll, self.skipped_run), 0, -1):
+                            model(self.ring_input[(slot - prev) % self.ring_size], self.sampling_rate)
+                        self.skipped_run = 0
+                        prob = float(model(self.ring_input[slot], self.sampling_rate))
+                        vad_output = self.stream.step(prob, self.window_size_samples)
+                        if vad_output is not None:
+                            logger.debug(f"VAD output: {vad_output}")
+                        results[offset + i] = vad_output
+            except Exception as e:
+                logger.error(f"Error in VAD processing: {e}")
+            self.frame_latency.add((time.time() - start_time) / max(1, len(chunk)))
+        return results
+
+    def _gate_skip(self, slot):
+        """门限关闭且 VAD 未处于说话状态时跳过模型"""
+        if self.gate is None:
+            return False
+        self.gate_frames.inc()
+        is_open = self.gate.update(self.ring[slot])
+        if is_open or self.stream.triggered:
+            return False
+        self.skipped_run += 1
+        self.gate_skipped.inc()
+        return True
 
     def reset_states(self):
         try:
-            self.vad_iterator.reset_states()  # Reset model states after each audio
+            self.stream.reset_states()
+            if self.gate is not None:
+                self.gate.reset()
+            self.skipped_run = 0
+            self.model.reset_states()  # Reset model states after each audio
             logger.debug("VAD states reset.")
         except Exception as e:
             logger.error(f"Error resetting VAD states: {e}")
 
 
+def drain_queue(q, first, max_items):
+    """取出队列中已经积压的数据(不等待)，和 first 一起返回，最多 max_items 项"""
+    items = [first]
+    while len(items) < max_items:
+        try:
+            items.append(q.get_nowait())
+        except (queue.Empty, asyncio.QueueEmpty):
+            break
+    return items
+
+
+class OnnxSileroModel:
+    """
+    Silero 的 onnxruntime 版本：onnxruntime 会话进程内共享，state 和上下文由每个 VAD 实例显式保存，
+    session.run 线程安全，多个会话线程可以同时推理，不需要推理锁
+    """
+
+    def __init__(self, session, sampling_rate, window_size_samples):
+        self.ort_session = session
+        self.sr = np.array(sampling_rate, dtype=np.int64)
+        self.context_size = 64 if sampling_rate == 16000 else 32
+        # 输入 = 上一帧末尾的上下文 + 当前帧，预分配后原地更新
+        self.input = np.zeros((1, self.context_size + window_size_samples), dtype=np.float32)
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+
+    def __call__(self, frame, sr=None):
+        self.input[0, self.context_size:] = frame
+        out, self.state = self.ort_session.run(None, {"input": self.input, "state": self.state, "sr": self.sr})
+        self.input[0, :self.context_size] = self.input[0, -self.context_size:]
+        return out[0][0]
+
+    def reset_states(self):
+        self.input.fill(0)
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+
+    @contextmanager
+    def session(self, sr):
+        # 与 SessionSileroModel 接口一致，状态本来就在实例上，无需换入换出
+        yield self
+
+
+def load_silero_onnx(model_path=None, intra_op_num_threads=1):
+    if model_path is None:
+        import silero_vad
+        model_path = os.path.join(os.path.dirname(silero_vad.__file__), "data", "silero_vad.onnx")
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class SileroOnnxVAD(SileroVAD):
+    """
+    用 onnxruntime 推理的 SileroVAD，每次推理只用 1 个线程(intra_op_num_threads)，
+    不再使用 torch 的全局线程池，会话多时不会互相抢占 CPU；触发逻辑、门限、积压处理与 SileroVAD 相同
+    """
+    latency_metric = "vad.onnx.frame"
+
+    def _load_model(self, config, pool):
+        if onnxruntime is None:
+            raise RuntimeError("SileroOnnxVAD 需要安装 onnxruntime")
+        model_path = config.get("model_path")
+        threads = config.get("intra_op_num_threads") or get_resources().threads("SileroOnnxVAD", 1)
+        self.model_key = ("SileroOnnxVAD", model_path, threads)
+        self.model_keys = [self.model_key]
+        session = pool.get(self.model_key, lambda: load_silero_onnx(model_path, threads))
+        self.model = OnnxSileroModel(session, self.sampling_rate, self.window_size_samples)
+        # 批量调度器基于 torch 模型，ONNX 版本不使用
+        return None
+
+    @staticmethod
+    def _wrap_ring(ring):
+        return ring
+
+
 def create_instance(class_name, *args, **kwargs):
     # 获取类对象
     cls = globals().get(class_name)
@@ -70,3 +537,145 @@ def create_instance(class_name, *args, **kwargs):
         return cls(*args, **kwargs)
     else:
         raise ValueError(f"Class {class_name} not found")
+
+
+def _gate_benchmark(fixture_dir):
+    """
+    对比能量门限开/关：空闲(低噪声)时每会话 CPU，以及各 wav 中语音起点的漏检和延迟
+    python -m bailing.vad gate <fixture_dir>
+    """
+    import glob
+
+    base_config = {"sampling_rate": 16000, "threshold": 0.5, "min_silence_duration_ms": 200}
+    gate_config = {"enabled": True, "open_db": -45, "close_db": -55, "zcr_min": 0.1,
+                   "hangover_ms": 300, "preroll": 2}
+    frame_seconds = 512 / 16000
+
+    def split(pcm):
+        return [pcm[i:i + 1024] for i in range(0, len(pcm) - 1023, 1024)]
+
+    def onsets(vad, frames):
+        vad.reset_states()
+        times = []
+        for i in range(0, len(frames), vad.max_drain):
+            for j, event in enumerate(vad.is_vad_batch(frames[i:i + vad.max_drain])):
+                if event is not None and "start" in event:
+                    times.append((i + j) * frame_seconds)
+        return times
+
+    plain = SileroVAD(base_config)
+    gated = SileroVAD(dict(base_config, gate=gate_config))
+
+    # 空闲：约 -70 dBFS 的底噪，对应麦克风开着但没人说话
+    rng = np.random.default_rng(0)
+    idle = split((rng.standard_normal(16000 * 30) * 10).astype(np.int16).tobytes())
+    for name, vad in (("关闭", plain), ("开启", gated)):
+        vad.reset_states()
+        cpu_start = time.process_time()
+        for i in range(0, len(idle), vad.max_drain):
+            vad.is_vad_batch(idle[i:i + vad.max_drain])
+        cpu = time.process_time() - cpu_start
+        print(f"门限{name}：空闲 30s 音频 CPU {cpu * 1000:.1f} ms，占单核 {cpu / 30:.2%}/会话")
+
+    missed, delays, total = 0, [], 0
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.wav"))):
+        with wave.open(path, "rb") as wf:
+            frames = split(wf.readframes(wf.getnframes()))
+        reference, candidate = onsets(plain, frames), onsets(gated, frames)
+        total += len(reference)
+        for t in reference:
+            matched = [c - t for c in candidate if -0.1 <= c - t <= 0.3]
+            if matched:
+                delays.append(matched[0])
+            else:
+                missed += 1
+        print(f"{os.path.basename(path)} 起点 {len(reference)} 个，门限开启后 {len(candidate)} 个")
+    if total:
+        mean_delay = sum(delays) / len(delays) * 1000 if delays else 0.0
+        print(f"共 {total} 个语音起点，漏检 {missed} 个，平均延迟 {mean_delay:.1f} ms")
+
+
+def _onnx_benchmark(pcm_data, sessions=8):
+    """
+    torch 与 onnxruntime 后端对比：sessions 个线程各自一个 VAD 实例，同时按最快速度处理同一段音频，
+    统计总吞吐(帧/秒)、每帧时延分位数以及两者事件是否一致
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    frames = [pcm_data[i:i + 1024] for i in range(0, len(pcm_data) - 1023, 1024)]
+    base_config = {"sampling_rate": 16000, "threshold": 0.5, "min_silence_duration_ms": 200, "max_drain": 1}
+    events = {}
+    for cls in (SileroVAD, SileroOnnxVAD):
+        vads = [cls(base_config) for _ in range(sessions)]
+
+        def run(vad):
+            return [vad.is_vad(frame) for frame in frames]
+
+        run(vads[0])  # 预热
+        vads[0].reset_states()
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            outputs = list(pool.map(run, vads))
+        elapsed = time.time() - start
+        events[cls.__name__] = [e for e in outputs[0] if e is not None]
+        latency = metrics.latency(cls.latency_metric)
+        print(f"{cls.__name__:14s} {sessions} 个会话并发，吞吐 {len(frames) * sessions / elapsed:.0f} 帧/秒，"
+              f"每帧 p50 {latency.percentile(50) * 1000:.3f} ms，p95 {latency.percentile(95) * 1000:.3f} ms，"
+              f"torch 线程数 {torch.get_num_threads()}")
+        for vad in vads:
+            vad.close()
+    print(f"事件一致: {events['SileroVAD'] == events['SileroOnnxVAD']}")
+
+
+if __name__ == "__main__":
+    # 每帧 CPU 耗时，以及卡顿后追上实时所需的时间：python -m bailing.vad [test.wav] [卡顿秒数]
+    # 能量门限对比：python -m bailing.vad gate <fixture_dir>
+    # torch 与 onnx 后端并发吞吐对比：python -m bailing.vad onnx [test.wav] [会话数]
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "gate":
+        _gate_benchmark(sys.argv[2])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "onnx":
+        if len(sys.argv) > 2:
+            with wave.open(sys.argv[2], "rb") as wf:
+                onnx_pcm = wf.readframes(wf.getnframes())
+        else:
+            onnx_pcm = (np.random.default_rng(0).standard_normal(16000 * 10) * 3000).astype(np.int16).tobytes()
+        _onnx_benchmark(onnx_pcm, int(sys.argv[3]) if len(sys.argv) > 3 else 8)
+        sys.exit(0)
+    if len(sys.argv) > 1:
+        with wave.open(sys.argv[1], "rb") as wf:
+            pcm_data = wf.readframes(wf.getnframes())
+    else:
+        rng = np.random.default_rng(0)
+        pcm_data = (rng.standard_normal(16000 * 10) * 3000).astype(np.int16).tobytes()
+    stall_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    test_frames = [pcm_data[i:i + 1024] for i in range(0, len(pcm_data) - 1023, 1024)]
+    frame_seconds = 512 / 16000
+    base_config = {"sampling_rate": 16000, "threshold": 0.5, "min_silence_duration_ms": 200}
+
+    for drain in (1, 32):
+        vad = SileroVAD(dict(base_config, max_drain=drain))
+        cpu_start = time.process_time()
+        results = []
+        for i in range(0, len(test_frames), drain):
+            results.extend(vad.is_vad_batch(test_frames[i:i + drain]))
+        cpu = (time.process_time() - cpu_start) / len(test_frames)
+        events = [r for r in results if r is not None]
+
+        # 模拟卡顿：积压 stall_seconds 的音频，之后音频仍按实时到达，统计清空积压用了多久
+        vad.reset_states()
+        backlog = queue.Queue()
+        for frame in test_frames[:int(stall_seconds / frame_seconds)]:
+            backlog.put(frame)
+        start = time.time()
+        arrived = 0
+        while not backlog.empty():
+            due = int((time.time() - start) / frame_seconds)
+            for _ in range(due - arrived):
+                backlog.put(test_frames[arrived % len(test_frames)])
+            arrived = max(arrived, due)
+            vad.is_vad_batch(drain_queue(backlog, backlog.get(), drain))
+        print(f"max_drain={drain:2d} 每帧 CPU {cpu * 1000:.3f} ms，事件 {len(events)} 个，"
+              f"卡顿 {stall_seconds:.1f}s 后追上实时用时 {time.time() - start:.2f}s")
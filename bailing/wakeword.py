@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from bailing import metrics
+from bailing.model_pool import ModelPool
+from bailing.resources import get_resources
+
+try:
+    import sherpa_onnx
+except ImportError:  # 可选依赖：pip install sherpa-onnx pypinyin
+    sherpa_onnx = None
+
+logger = logging.getLogger(__name__)
+
+INT16_SCALE = np.float32(1.0 / 32768)
+
+
+class KWS(ABC):
+    # 从 ModelPool 获取的模型，会话结束时释放
+    model_keys = ()
+
+    @abstractmethod
+    def feed(self, frame):
+        """喂入一帧 int16 PCM，检测到唤醒词时返回 True"""
+        pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pool = ModelPool()
+        for key in self.model_keys:
+            pool.release(key)
+        self.model_keys = ()
+
+
+class SherpaKWS(KWS):
+    """
+    sherpa-onnx 的流式关键词检测(zipformer transducer，约 3M 参数)，
+    唤醒词按拼音切分后写入关键词文件，不需要针对唤醒词重新训练；
+    KeywordSpotter 进程内共享，每个会话一个 stream
+    """
+
+    def __init__(self, config, wake_words):
+        if sherpa_onnx is None:
+            raise RuntimeError("SherpaKWS 需要安装 sherpa-onnx 和 pypinyin")
+        self.model_dir = config.get("model_dir", "models/sherpa-onnx-kws-zipformer-wenetspeech-3.3M-2024-01-01")
+        self.sample_rate = config.get("sample_rate", 16000)
+        self.wake_words = tuple(wake_words)
+        threads = config.get("num_threads") or get_resources().threads("SherpaKWS", 1)
+        self.model_key = ("SherpaKWS", self.model_dir, self.wake_words, threads)
+        self.spotter = ModelPool().get(self.model_key, lambda: self._load(config, threads))
+        self.model_keys = [self.model_key]
+        self.stream = self.spotter.create_stream()
+        self.latency = metrics.latency("wakeword.frame")
+
+    def _load(self, config, threads):
+        def path(name, default):
+            return os.path.join(self.model_dir, config.get(name, default))
+
+        tokens = path("tokens", "tokens.txt")
+        digest = hashlib.md5("|".join(self.wake_words).encode("utf-8")).hexdigest()[:8]
+        keywords_file = os.path.join(config.get("output_dir", "tmp/"), f"keywords-{digest}.txt")
+        os.makedirs(os.path.dirname(keywords_file) or ".", exist_ok=True)
+        # 关键词文件每行：拼音 token 序列 @原文
+        token_lists = sherpa_onnx.text2token(list(self.wake_words), tokens=tokens, tokens_type="ppinyin")
+        with open(keywords_file, "w", encoding="utf-8") as f:
+            for word, word_tokens in zip(self.wake_words, token_lists):
+                f.write(f"{' '.join(word_tokens)} @{word}\n")
+        return sherpa_onnx.KeywordSpotter(
+            tokens=tokens,
+            encoder=path("encoder", "encoder-epoch-12-avg-2-chunk-16-left-64.onnx"),
+            decoder=path("decoder", "decoder-epoch-12-avg-2-chunk-16-left-64.onnx"),
+            joiner=path("joiner", "joiner-epoch-12-avg-2-chunk-16-left-64.onnx"),
+            num_threads=threads,
+            keywords_file=keywords_file,
+            keywords_score=config.get("keywords_score", 1.0),
+            keywords_threshold=config.get("keywords_threshold", 0.25),
+            max_active_paths=config.get("max_active_paths", 4),
+            provider="cpu",
+        )
+
+    def feed(self, frame):
+        start_time = time.time()
+        samples = np.frombuffer(frame, dtype=np.int16) * INT16_SCALE
+        self.stream.accept_waveform(self.sample_rate, samples)
+        detected = False
+        with get_resources().slot("SherpaKWS"):
+            while self.spotter.is_ready(self.stream):
+                self.spotter.decode_stream(self.stream)
+                if self.spotter.get_result(self.stream):
+                    detected = True
+        self.latency.add(time.time() - start_time)
+        return detected
+
+    def reset(self):
+        # 每段语音重新开始，避免上一段的尾巴影响下一段
+        self.stream = self.spotter.create_stream()
+
+
+class WakeWordGate:
+    """
+    唤醒词门限：未唤醒时 VAD 切出的语音只做关键词检测，不做 ASR、不调用 LLM；
+    检测到唤醒词后这一段正常识别，并在 active_window_s 内保持唤醒，每轮对话都会续期
+    """
+
+    def __init__(self, config, wake_words):
+        module = config.get("module", "SherpaKWS")
+        self.kws = create_instance(module, config.get(module) or {}, wake_words)
+        self.active_window = config.get("active_window_s", 30)
+        self.awake_until = 0.0
+        # 当前这段语音开始时是否已唤醒，None 表示还没有开始
+        self.segment_awake = None
+        self.detected = False
+        self.segment_frames = 0
+        self.wakeups = metrics.counter("wakeword.detected")
+        self.passed = metrics.counter("wakeword.segments.passed")
+        self.skipped = metrics.counter("wakeword.segments.skipped")
+        # 被跳过的语音帧数，每帧 32ms，即节省的 ASR 音频时长
+        self.skipped_frames = metrics.counter("wakeword.skipped_frames")
+        logger.info(f"唤醒词门限已开启：{'/'.join(wake_words)}，唤醒后保持 {self.active_window} 秒")
+
+    def is_awake(self):
+        return time.time() < self.awake_until
+
+    def renew(self):
+        self.awake_until = time.time() + self.active_window
+
+    def listening(self):
+        """这段语音是否只做唤醒词检测，在每段语音的第一帧按当时是否唤醒确定"""
+        if self.segment_awake is None:
+            self.segment_awake = self.is_awake()
+        return not self.segment_awake
+
+    def feed(self, frame):
+        """未唤醒时 VAD 判定为语音的帧，返回这段语音中是否已检测到唤醒词"""
+        self.segment_frames += 1
+        if not self.detected and self.kws.feed(frame):
+            self.detected = True
+            self.wakeups.inc()
+            logger.info("检测到唤醒词")
+        return self.detected
+
+    def end_segment(self):
+        """
+        一段语音结束，返回 (是否继续识别, ASR 是否已经收到了整段音频)
+        中途才唤醒的一段，流式 ASR 没有收到前面的帧，需要整段重新识别
+        """
+        segment_awake, detected = bool(self.segment_awake), self.detected
+        if not segment_awake and not detected:
+            self.skipped.inc()
+            self.skipped_frames.inc(self.segment_frames)
+        else:
+            self.passed.inc()
+            self.renew()
+        self.segment_awake = None
+        self.detected = False
+        self.segment_frames = 0
+        self.kws.reset()
+        return segment_awake or detected, segment_awake
+
+    def close(self):
+        self.kws.close()
+
+
+def create_gate(config):
+    """按 WakeWordGate 配置创建门限，未开启时返回 None"""
+    gate_config = config.get("WakeWordGate") or {}
+    if not gate_config.get("enabled", False):
+        return None
+    wake_words = config.get("WakeWord")
+    if isinstance(wake_words, str):
+        wake_words = [wake_words]
+    wake_words = [w.strip() for w in wake_words or [] if w and w.strip()]
+    if not wake_words:
+        logger.warning("WakeWordGate 已开启但没有配置 WakeWord，忽略")
+        return None
+    return WakeWordGate(gate_config, wake_words)
+
+
+def create_instance(class_name, *args, **kwargs):
+    # 获取类对象
+    cls = globals().get(class_name)
+    if cls:
+        # 创建并返回实例
+        return cls(*args, **kwargs)
+    else:
+        raise ValueError(f"Class {class_name} not found")
@@ -45,19 +45,25 @@ auto_import_modules('plugins.functions')
 
 
 class TaskManager:
-    def __init__(self, config, result_queue: queue.Queue):
+    def __init__(self, config, result_queue: queue.Queue, executor=None):
         self.functions = read_json_file(config.get("functions_call_name", "function_calls_config.json"))
         aigc_enabled = config.get("aigc_enabled", False)
         if not aigc_enabled:
             self.functions = [item for item in self.functions if item["function"]["name"] != 'aigc']
         self.task_queue = queue.Queue()
-        # 初始化线程池
-        self.task_executor = ThreadPoolExecutor(max_workers=10)
+        # 初始化线程池，会话传入线程池时共用，不单独创建
+        self._owns_executor = executor is None
+        self.task_executor = executor or ThreadPoolExecutor(max_workers=10)
         self.result_queue = result_queue
 
     def get_functions(self):
         return self.functions
 
+    def shutdown(self):
+        """会话结束时释放线程池，不等待进行中的工具调用；传入的线程池由调用方关闭"""
+        if self._owns_executor:
+            self.task_executor.shutdown(wait=False, cancel_futures=True)
+
     def process_task(self):
         def task_thread():
             while True:
@@ -25,6 +25,13 @@ logging.basicConfig(
     ]
 )
 from bailing import robot
+from bailing import metrics
+from bailing.archive import get_archive
+from bailing.resources import get_resources
+from bailing.async_robot import AsyncRobot
+from bailing.model_pool import ModelPool
+from bailing.session_manager import SessionManager
+from bailing.utils import get_rss_mb, read_config
 
 # 获取根 logger
 logger = logging.getLogger(__name__)
@@ -39,32 +46,39 @@ parser.add_argument('--config_path', type=str, help="配置文件", default="con
 # Parse arguments
 args = parser.parse_args()
 config_path = args.config_path
+# asyncio 运行模式：会话不再单独创建线程
+server_config = read_config(config_path)
+async_runtime = (server_config.get("AsyncRuntime") or {}).get("enabled", False)
+# 过载保护：会话数上限，以及任一会话队列积压超过比例时拒绝新会话
+queue_config = server_config.get("Queues") or {}
+MAX_SESSIONS = queue_config.get("max_sessions", 0)
+OVERLOAD_RATIO = queue_config.get("overload_ratio", 0)
+# 音频归档在启动时按配置创建，各会话共享
+get_archive(server_config.get("Archive"))
+get_resources(server_config.get("Resources"))
+# 会话生命周期：不活跃超时，以及断开后等待重连的宽限期(0 表示断开立即释放)
+session_config = server_config.get("Session") or {}
 
 
 app = FastAPI()
-TIMEOUT = 600  # 60 秒不活跃断开
-active_robots: Dict[str, list] = {}
-
-async def cleanup_task():
-    while True:
-        now = time.time()
-        for uid, (robot_instance, ts) in list(active_robots.items()):
-            if now - ts > TIMEOUT:
-                try:
-                    robot_instance.recorder.stop_recording()
-                    robot_instance.shutdown()
-                    logger.info(f"{uid} 对应的robot已释放")
-                except Exception as e:
-                    logger.info(f"{uid} 对应的robot释放 出错: {e}")
-                active_robots.pop(uid, None)
-        await asyncio.sleep(10)
+TIMEOUT = session_config.get("idle_timeout", 600)  # 600 秒不活跃断开
+active_robots = SessionManager(idle_timeout=TIMEOUT, reconnect_grace=session_config.get("reconnect_grace", 30))
+
+def is_overloaded():
+    if MAX_SESSIONS and len(active_robots) >= MAX_SESSIONS:
+        return True
+    if OVERLOAD_RATIO:
+        for _, robot_instance in active_robots.items():
+            for stats in robot_instance.queue_stats().values():
+                if stats["maxsize"] and stats["depth"] >= stats["maxsize"] * OVERLOAD_RATIO:
+                    return True
+    return False
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    task = asyncio.create_task(cleanup_task())
+    active_robots.start()
     yield
-    task.cancel()
-    await task
+    await active_robots.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -80,20 +94,50 @@ app.add_middleware(
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(...)):
+async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(...), stream: int = Query(0),
+                             codec: str = Query("pcm")):
     await websocket.accept()
     loop = asyncio.get_event_loop()
     logger.info("WebSocket连接已建立")
-    if user_id not in active_robots:
-        active_robots[user_id] = [robot.Robot(config_path, websocket, loop), time.time()]
-        threading.Thread(target=active_robots[user_id][0].run, daemon=True).start()
-        #active_robots[user_id][0].run()
-    robot_instance = active_robots[user_id][0]
+    if user_id in active_robots:
+        # 重连：复用原会话，切换到新连接
+        connection = active_robots.attach(user_id, websocket, loop)
+    else:
+        if is_overloaded():
+            logger.warning(f"服务过载，拒绝新会话 {user_id}")
+            metrics.counter("session.rejected").inc()
+            await websocket.close(code=1013)  # 1013 = Try Again Later
+            return
+        if async_runtime:
+            # 初始化会加载模型、读取记忆，放到线程池中避免阻塞事件循环
+            robot_instance = await loop.run_in_executor(None, AsyncRobot, config_path, websocket, loop)
+            if user_id in active_robots:
+                # 初始化期间同一用户的另一个连接已经建好会话：先接管已有的会话，再释放这个
+                logger.info(f"{user_id} 的会话已由并发连接创建，释放重复的会话")
+                connection = active_robots.attach(user_id, websocket, loop)
+                await robot_instance.aclose()
+            else:
+                connection = active_robots.add(user_id, robot_instance)
+                robot_instance.start()
+        else:
+            robot_instance = robot.Robot(config_path, websocket, loop)
+            connection = active_robots.add(user_id, robot_instance)
+            threading.Thread(target=robot_instance.run, daemon=True).start()
+    robot_instance = active_robots.get(user_id)
+    # 前端声明支持流式下行时按 PCM 块发送
+    downlink_codec = robot_instance.player.negotiate(stream=bool(stream), codec=codec)
+    uplink_codec = robot_instance.recorder.set_codec(codec)
+    # 协商结果可能回退到 pcm，前端收到后才按这个编码发送音频
+    await websocket.send_text(json.dumps({"type": "codec", "codec": uplink_codec,
+                                          "downlink": downlink_codec, "stream": robot_instance.player.streaming}))
 
     try:
         # 模拟处理流程
         while True:
             msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                logger.info("客户端断开连接")
+                break
 
             if "bytes" in msg:
                 robot_instance.recorder.put_audio(msg["bytes"])
@@ -109,18 +153,35 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(...)):
                         robot_instance.player.set_playing_status(False)
                 else:
                     logger.warning(f"未知指令：{msg}")
-            active_robots[user_id][1] = time.time()
+            active_robots.touch(user_id)
 
     except WebSocketDisconnect:
         logger.info("客户端断开连接")
     except Exception as e:
         logger.error(f"WebSocket错误: {e}")
     finally:
-        # 清理资源
-        #robot_instance.recorder.stop_recording()
-        #robot_instance.shutdown()
+        # 清理资源：立即释放，或在宽限期内等待重连
+        await active_robots.detach(user_id, connection)
         logger.info("WebSocket连接已关闭")
 
+@app.get("/stats")
+async def stats():
+    """运行状态：会话数、进程内存、共享模型及各会话初始化耗时"""
+    return {
+        "sessions": len(active_robots),
+        "rss_mb": round(get_rss_mb(), 1),
+        "cpu_time": round(time.process_time(), 3),
+        "models": ModelPool().stats(),
+        "archive": get_archive().stats(),
+        "resources": get_resources().stats(),
+        "metrics": metrics.snapshot(),
+        "robots": {
+            uid: {"init_time": round(r.init_time, 3), "init_rss_mb": round(r.init_rss_mb, 1),
+                  "queues": r.queue_stats()}
+            for uid, r in active_robots.items()
+        },
+    }
+
 # 托管前端静态文件
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库根目录不是安装包，直接运行 pytest 时也能导入 bailing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,131 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from bailing.bounded_queue import BoundedQueue, AsyncBoundedQueue, create_queue, is_silent_frame
+
+LOUD = (np.ones(512, dtype=np.int16) * 5000).tobytes()
+SILENT = np.zeros(512, dtype=np.int16).tobytes()
+
+
+def frame(statue=None, voice=LOUD):
+    return {"voice": voice, "vad_statue": statue}
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    return items
+
+
+def test_unbounded_by_default():
+    q = create_queue("audio", None)
+    assert q.maxsize == 0 and q.policy == "block"
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedQueue("audio", 2, "drop_random")
+
+
+def test_drop_oldest_and_newest():
+    q = BoundedQueue("audio", 2, "drop_oldest")
+    for i in range(4):
+        q.put(i)
+    assert drain(q) == [2, 3]
+    assert q.drops == 2
+
+    q = BoundedQueue("audio", 2, "drop_newest")
+    for i in range(4):
+        q.put(i)
+    assert drain(q) == [0, 1]
+
+
+def test_drop_silent_prefers_silence():
+    q = BoundedQueue("audio", 3, "drop_silent")
+    for data in (LOUD, SILENT, LOUD, LOUD):
+        q.put(data)
+    assert [is_silent_frame(d) for d in drain(q)] == [False, False, False]
+
+
+def test_skip_ahead_keeps_latest():
+    q = BoundedQueue("audio", 3, "skip_ahead")
+    for i in range(5):
+        q.put(i)
+    assert drain(q) == [3, 4]
+    assert q.stats()["high_watermark"] == 3
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "drop_newest", "drop_silent", "skip_ahead"])
+def test_vad_events_survive_overflow(policy):
+    q = BoundedQueue("vad", 4, policy)
+    q.put(frame("start"))
+    for _ in range(10):
+        q.put(frame(voice=SILENT))
+    q.put(frame("end"))
+    q.put(frame("start"))
+    for _ in range(10):
+        q.put(frame())
+    q.put(frame("end"))
+    statues = [item["vad_statue"] for item in drain(q) if item["vad_statue"] is not None]
+    assert statues == ["start", "end", "start", "end"]
+    assert q.drops > 0
+
+
+def test_wake_sentinel_survives_overflow():
+    q = BoundedQueue("audio", 2, "skip_ahead")
+    q.put(LOUD)
+    q.put(None)
+    q.put(LOUD)
+    assert None in drain(q)
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "drop_newest", "skip_ahead"])
+def test_async_vad_events_survive_overflow(policy):
+    async def run():
+        q = AsyncBoundedQueue("vad", 2, policy)
+        for statue in ("start", "end", "start"):
+            q.put_nowait(frame(statue))
+            q.put_nowait(frame())
+        return [item["vad_statue"] for item in drain(q) if item["vad_statue"] is not None]
+
+    assert asyncio.run(run()) == ["start", "end", "start"]
+
+
+def test_dropped_tts_futures_are_cancelled():
+    from concurrent.futures import Future
+
+    futures = [Future() for _ in range(4)]
+    q = BoundedQueue("tts", 2, "drop_oldest")
+    for turn_id, future in enumerate(futures):
+        q.put((turn_id, future))
+    assert [f.cancelled() for f in futures] == [True, True, False, False]
+
+    futures = [Future() for _ in range(3)]
+    q = BoundedQueue("tts", 2, "drop_newest")
+    for turn_id, future in enumerate(futures):
+        q.put((turn_id, future))
+    assert [f.cancelled() for f in futures] == [False, False, True]
+
+
+def test_protected_items_survive_overflow():
+    active_turn = 2
+    q = BoundedQueue("play", 3, "drop_oldest")
+    q.protect = lambda item: item[0] == active_turn
+    for seq in range(5):
+        q.put((active_turn, seq, LOUD))
+    q.put((1, 0, LOUD))
+    assert [item[:2] for item in drain(q) if item[0] == active_turn] == [(2, i) for i in range(5)]
+
+
+def test_default_config_is_unbounded():
+    import os
+    import yaml
+
+    config_file = os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml")
+    with open(config_file, encoding="utf-8") as f:
+        queues = yaml.safe_load(f)["Queues"]
+    for name in ("audio", "vad", "tts", "play"):
+        assert create_queue(name, queues).maxsize == 0
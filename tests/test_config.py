@@ -0,0 +1,29 @@
+import os
+
+from bailing.utils import read_config
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+
+def test_overlay_merged_onto_base(tmp_path):
+    (tmp_path / "base.yaml").write_text(
+        "Queues:\n  tts:\n    maxsize: 0\n    policy: block\n"
+        "selected_module:\n  LLM: OpenAILLM\n  TTS: KOKOROTTS\n"
+        "Codecs: [pcm, opus]\n", encoding="utf-8")
+    (tmp_path / "overlay.yaml").write_text(
+        "base: base.yaml\nQueues:\n  tts:\n    maxsize: 50\nselected_module:\n  LLM: MockLLM\n"
+        "Codecs: [pcm]\n", encoding="utf-8")
+    config = read_config(str(tmp_path / "overlay.yaml"))
+    assert "base" not in config
+    assert config["Queues"]["tts"] == {"maxsize": 50, "policy": "block"}
+    assert config["selected_module"] == {"LLM": "MockLLM", "TTS": "KOKOROTTS"}
+    # 列表整体覆盖
+    assert config["Codecs"] == ["pcm"]
+
+
+def test_loadtest_config_only_overrides():
+    base = read_config(os.path.join(CONFIG_DIR, "config.yaml"))
+    loadtest = read_config(os.path.join(CONFIG_DIR, "config_loadtest.yaml"))
+    assert loadtest["selected_module"]["LLM"] == "MockLLM"
+    assert loadtest["Queues"]["audio"]["policy"] == base["Queues"]["audio"]["policy"]
+    assert loadtest["ASR"] == base["ASR"]
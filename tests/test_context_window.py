@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bailing.dialogue import ContextWindow, estimate_tokens, message_tokens
+
+
+def conversation(turns, reply="今天天气晴朗，适合出门散步。" * 5):
+    messages = [{"role": "system", "content": "你是百聆"}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"第{turn}轮问题"})
+        messages.append({"role": "assistant", "content": reply})
+    return messages
+
+
+class Summarizer:
+    def __init__(self, result="用户问了天气"):
+        self.result = result
+        self.prompts = []
+        self.called = threading.Event()
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        self.called.set()
+        return self.result
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcdefgh") == 2
+    assert message_tokens({"role": "user", "content": "你好"}) == 6
+
+
+def test_under_budget_sends_everything():
+    summarizer = Summarizer()
+    window = ContextWindow({"max_tokens": 10000}, summarizer)
+    messages = conversation(3)
+    assert window.apply(messages) == messages
+    assert window.last_saved == 0 and not summarizer.prompts
+    window.close()
+
+
+def test_over_budget_folds_old_turns_in_background():
+    summarizer = Summarizer()
+    executor = ThreadPoolExecutor(max_workers=1)
+    window = ContextWindow({"max_tokens": 300, "keep_turns": 2}, summarizer, executor)
+    messages = conversation(10)
+    # 摘要完成之前原样发送，不丢上下文
+    assert window.apply(messages) == messages
+    assert summarizer.called.wait(5)
+    executor.shutdown(wait=True)
+    assert len(summarizer.prompts) == 1 and "第0轮问题" in summarizer.prompts[0]
+
+    sent = window.apply(messages)
+    assert sent[0] == messages[0]
+    assert sent[1] == {"role": "system", "content": "以下是更早对话的摘要：\n用户问了天气"}
+    # 最近的轮次原样保留，且从一轮的开头开始
+    assert sent[2]["role"] == "user" and sent[-2:] == messages[-2:]
+    assert len(sent) - 2 >= 2 * 2
+    assert sum(message_tokens(m) for m in sent) < sum(message_tokens(m) for m in messages)
+    assert window.last_saved > 0
+
+
+def test_only_one_fold_at_a_time():
+    release = threading.Event()
+    calls = []
+
+    def slow_summarize(prompt):
+        calls.append(prompt)
+        release.wait(5)
+        return "摘要"
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    window = ContextWindow({"max_tokens": 300, "keep_turns": 1}, slow_summarize, executor)
+    messages = conversation(10)
+    for _ in range(3):
+        window.apply(messages)
+    release.set()
+    executor.shutdown(wait=True)
+    assert len(calls) == 1
+
+
+def test_failed_summary_keeps_full_context():
+    executor = ThreadPoolExecutor(max_workers=1)
+    window = ContextWindow({"max_tokens": 300, "keep_turns": 1}, Summarizer(result=""), executor)
+    messages = conversation(10)
+    window.apply(messages)
+    # 等待后台摘要结束
+    executor.submit(lambda: None).result(5)
+    assert window.apply(messages) == messages
+    executor.shutdown(wait=True)
+
+
+def test_shared_executor_not_shut_down_on_close():
+    executor = ThreadPoolExecutor(max_workers=1)
+    window = ContextWindow({}, Summarizer(), executor)
+    window.close()
+    assert executor.submit(lambda: 1).result() == 1
+    executor.shutdown()
@@ -0,0 +1,69 @@
+import json
+import os
+
+from bailing.dialogue import Dialogue, JournalWriter, Message, compact_journal, read_journal
+
+
+def test_append_and_flush(tmp_path):
+    journal = JournalWriter({"fsync_interval_ms": 50})
+    path = str(tmp_path / "dialogue-2024-10-01 10:00:00-a.jsonl")
+    journal.append(path, [{"role": "user", "content": "你好"}])
+    journal.append(path, [{"role": "assistant", "content": "嗨"}])
+    journal.append(path, [])
+    assert journal.flush()
+    assert read_journal(path) == [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "嗨"}]
+
+
+def test_max_open_files(tmp_path):
+    journal = JournalWriter({"max_open_files": 2})
+    paths = [str(tmp_path / f"dialogue-{i}.jsonl") for i in range(5)]
+    for i, path in enumerate(paths):
+        journal.append(path, [{"role": "user", "content": str(i)}])
+    assert journal.flush()
+    assert len(journal.files) <= 2
+    assert [read_journal(p)[0]["content"] for p in paths] == ["0", "1", "2", "3", "4"]
+
+
+def test_read_journal_skips_partial_line(tmp_path):
+    path = tmp_path / "dialogue.jsonl"
+    path.write_text('{"role": "user", "content": "a"}\n\n{"role": "assi', encoding="utf-8")
+    assert read_journal(str(path)) == [{"role": "user", "content": "a"}]
+
+
+def test_compact_journal(tmp_path):
+    path = tmp_path / "dialogue-2024-10-01 10:00:00-a.jsonl"
+    path.write_text('{"role": "user", "content": "a"}\n', encoding="utf-8")
+    json_path = compact_journal(str(path))
+    assert json_path.endswith("-a.json") and not path.exists()
+    with open(json_path, encoding="utf-8") as f:
+        assert json.load(f) == [{"role": "user", "content": "a"}]
+
+
+def test_compact_journal_keep_source(tmp_path):
+    path = tmp_path / "dialogue.jsonl"
+    path.write_text('{"role": "user", "content": "a"}\n', encoding="utf-8")
+    assert os.path.exists(compact_journal(str(path), remove=False))
+    assert path.exists()
+
+
+def test_dialogue_journal_is_incremental_and_per_session(tmp_path):
+    journal = JournalWriter()
+    first = Dialogue(str(tmp_path), journal=journal)
+    second = Dialogue(str(tmp_path), journal=journal)
+    # 同一秒开始的会话写到不同的文件
+    assert first.journal_file != second.journal_file
+
+    first.put(Message(role="system", content="你是百聆"))
+    first.put(Message(role="user", content="你好"))
+    first.put(Message(role="assistant", content="嗨"))
+    first.dump_dialogue()
+    first.put(Message(role="user", content="再见"))
+    first.dump_dialogue()
+    first.dump_dialogue()
+    first.close()
+    assert [m["content"] for m in read_journal(first.journal_file)] == ["你好", "嗨", "再见"]
+    assert not os.path.exists(second.journal_file)
+
+    compacted = first.compact()
+    with open(compacted, encoding="utf-8") as f:
+        assert [m["content"] for m in json.load(f)] == ["你好", "嗨", "再见"]
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+
+from bailing import memory
+from bailing.memory import Memory, MemoryStore
+
+
+class FakeClient:
+    """替代 openai.OpenAI，记录每次整理调用的 prompt"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.prompts = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, stream):
+        if self.fail:
+            raise ConnectionError("offline")
+        self.prompts.append(messages[0]["content"])
+        message = type("M", (), {"content": f"记忆{len(self.prompts)}"})
+        return type("R", (), {"choices": [type("C", (), {"message": message})]})
+
+
+def make_store(tmp_path, **config):
+    history = tmp_path / "history"
+    history.mkdir(exist_ok=True)
+    config = {"dialogue_history_path": str(history), "memory_file": str(tmp_path / "memory.json"),
+              "min_file_age_s": 0, **config}
+    store = MemoryStore(config)
+    store.client = FakeClient()
+    return store, history
+
+
+def write_json(history, name, dialogues, old=True):
+    path = history / name
+    path.write_text(json.dumps(dialogues, ensure_ascii=False), encoding="utf-8")
+    if old:
+        os.utime(path, (0, 0))
+    return path
+
+
+def turn(text):
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": "好的"}]
+
+
+def test_json_files_consolidated_once(tmp_path):
+    store, history = make_store(tmp_path)
+    write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("我叫小明"))
+    write_json(history, "dialogue-2024-10-02 10:00:00.json", turn("我喜欢猫"))
+    store.consolidate()
+    assert len(store.client.prompts) == 1
+    prompt = store.client.prompts[0]
+    assert prompt.index("我叫小明") < prompt.index("我喜欢猫")
+    assert store.memory["memory"] == "记忆1"
+    store.consolidate()
+    assert len(store.client.prompts) == 1
+
+
+
+def test_unchanged_json_not_reread(tmp_path, monkeypatch):
+    store, history = make_store(tmp_path)
+    path = write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("我叫小明"))
+    store.consolidate()
+    reads = []
+    read_dialogue_file = Memory.read_dialogue_file
+    monkeypatch.setattr(Memory, "read_dialogue_file", lambda f: reads.append(f) or read_dialogue_file(f))
+    store.consolidate()
+    assert reads == []
+    # 文件变化后重新读取，只整理新增的消息
+    write_json(history, path.name, turn("我叫小明") + turn("我喜欢猫"))
+    os.utime(path, (0, 1))
+    store.consolidate()
+    assert len(reads) == 1 and len(store.client.prompts) == 2
+    assert "我喜欢猫" in store.client.prompts[1] and "我叫小明" not in store.client.prompts[1]
+
+def test_batches_bounded_by_tokens(tmp_path):
+    store, history = make_store(tmp_path, max_batch_tokens=300)
+    for day in range(1, 7):
+        write_json(history, f"dialogue-2024-10-0{day} 10:00:00.json", turn("天气" * 60))
+    store.consolidate()
+    assert 1 < len(store.client.prompts) < 6
+    assert len(store.memory["index"]) == 6
+
+
+def test_recent_json_waits(tmp_path):
+    store, history = make_store(tmp_path, min_file_age_s=60)
+    write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("刚写完"), old=False)
+    store.consolidate()
+    assert store.client.prompts == []
+
+
+def test_journal_read_incrementally(tmp_path):
+    store, history = make_store(tmp_path)
+    journal = history / "dialogue-2024-10-01 10:00:00-abcd1234.jsonl"
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "user", "content": "第一句"}, ensure_ascii=False) + "\n")
+        f.write('{"role": "assistant", "con')
+    store.consolidate()
+    assert "第一句" in store.client.prompts[0]
+    entry = store.memory["index"]["dialogue-2024-10-01 10:00:00-abcd1234"]
+    assert entry["records"] == 1
+
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('tent": "第二句"}\n')
+    store.consolidate()
+    assert len(store.client.prompts) == 2
+    assert "第二句" in store.client.prompts[1] and "第一句" not in store.client.prompts[1]
+    assert store.memory["index"]["dialogue-2024-10-01 10:00:00-abcd1234"]["records"] == 2
+
+
+def test_compacted_journal_tail_still_consolidated(tmp_path):
+    from bailing.dialogue import compact_journal
+
+    store, history = make_store(tmp_path)
+    journal = history / "dialogue-2024-10-01 10:00:00-abcd1234.jsonl"
+    journal.write_text(json.dumps({"role": "user", "content": "第一句"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    store.consolidate()
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "user", "content": "第二句"}, ensure_ascii=False) + "\n")
+    # 压缩前第二句还没有整理
+    os.utime(compact_journal(str(journal)), (0, 0))
+    store.consolidate()
+    assert len(store.client.prompts) == 2
+    assert "第二句" in store.client.prompts[1] and "第一句" not in store.client.prompts[1]
+    store.consolidate()
+    assert len(store.client.prompts) == 2
+
+
+def test_json_skipped_while_journal_exists(tmp_path):
+    store, history = make_store(tmp_path)
+    journal = history / "dialogue-2024-10-01 10:00:00-a.jsonl"
+    journal.write_text(json.dumps({"role": "user", "content": "日志"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    write_json(history, "dialogue-2024-10-01 10:00:00-a.json", [{"role": "user", "content": "日志"}])
+    store.consolidate()
+    assert len(store.client.prompts) == 1 and store.client.prompts[0].count("日志") == 1
+
+
+def test_legacy_history_list_migrated(tmp_path):
+    (tmp_path / "history").mkdir()
+    old = write_json(tmp_path / "history", "dialogue-2024-10-01 10:00:00.json", turn("旧对话"))
+    (tmp_path / "memory.json").write_text(json.dumps(
+        {"memory": "旧记忆", "history_memory_file": [str(old)]}, ensure_ascii=False), encoding="utf-8")
+    store, _ = make_store(tmp_path)
+    store.consolidate()
+    assert store.client.prompts == [] and store.memory["memory"] == "旧记忆"
+
+
+def test_failed_call_retried_later(tmp_path):
+    store, history = make_store(tmp_path)
+    write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("我叫小明"))
+    store.client = FakeClient(fail=True)
+    store.consolidate()
+    assert store.memory["index"] == {} and not os.path.exists(tmp_path / "memory.json")
+    store.client = FakeClient()
+    store.consolidate()
+    assert len(store.client.prompts) == 1
+
+
+def test_index_persisted(tmp_path):
+    store, history = make_store(tmp_path)
+    write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("我叫小明"))
+    store.consolidate()
+    reloaded, _ = make_store(tmp_path)
+    reloaded.consolidate()
+    assert reloaded.client.prompts == [] and reloaded.memory["memory"] == "记忆1"
+    assert not os.path.exists(str(tmp_path / "memory.json") + ".tmp")
+
+
+def test_memory_startup_does_not_wait_for_consolidation(tmp_path, monkeypatch):
+    store, history = make_store(tmp_path)
+    write_json(history, "dialogue-2024-10-01 10:00:00.json", turn("我叫小明"))
+    started, release = threading.Event(), threading.Event()
+    original = store.consolidate
+
+    def blocked():
+        started.set()
+        release.wait(5)
+        original()
+
+    monkeypatch.setattr(store, "consolidate", blocked)
+    monkeypatch.setitem(memory._stores, store.memory_file, store)
+    config = {"memory_file": store.memory_file}
+    first = Memory(config)
+    assert started.wait(5)
+    # 任务还在执行，再创建会话不会重复提交，也不会等待
+    Memory(config)
+    assert first.get_memory() == ""
+    release.set()
+    deadline = time.time() + 5
+    while store.scheduled and time.time() < deadline:
+        time.sleep(0.01)
+    assert first.get_memory() == "记忆1" and len(store.client.prompts) == 1
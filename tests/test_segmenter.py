@@ -0,0 +1,51 @@
+from bailing.utils import SentenceSegmenter, SENTENCE_END_PUNCTUATION
+
+TEXT = "你好，我是百聆。今天天气很好，适合出门散步。我们去公园吧！还有别的事情吗？最后一句没有标点"
+
+
+def segment(text, config=None, token_size=1):
+    segmenter = SentenceSegmenter(config)
+    segments = []
+    for i in range(0, len(text), token_size):
+        segment_text = segmenter.push(text[i:i + token_size])
+        if segment_text:
+            segments.append(segment_text)
+    tail = segmenter.flush()
+    if tail:
+        segments.append(tail)
+    return segments
+
+
+def test_first_segment_at_first_punctuation():
+    assert segment(TEXT)[0] == "你好，"
+
+
+def test_first_segment_needs_min_chars():
+    assert segment("好，我是百聆。")[0] == "好，我是百聆。"
+
+
+def test_segments_are_lossless_for_any_tokenization():
+    for token_size in (1, 2, 3, 7, len(TEXT)):
+        assert "".join(segment(TEXT, token_size=token_size)) == TEXT
+
+
+def test_later_segments_end_at_sentence_and_grow():
+    segments = segment(TEXT)
+    assert segments == ["你好，", "我是百聆。今天天气很好，适合出门散步。", "我们去公园吧！还有别的事情吗？", "最后一句没有标点"]
+    for text in segments[1:-1]:
+        assert text[-1] in SENTENCE_END_PUNCTUATION
+        assert len(text) >= 10
+
+
+def test_long_clause_cut_at_max_chars():
+    text = "一二三，" * 30
+    segments = segment(text, {"max_chars": 20})
+    assert "".join(segments) == text
+    assert all(len(s) <= 20 + 4 for s in segments)
+    assert len(segments) > 3
+
+
+def test_flush_without_pending_text():
+    segmenter = SentenceSegmenter()
+    assert segmenter.flush() is None
+    assert segmenter.push("") is None
@@ -0,0 +1,120 @@
+import asyncio
+
+from bailing.session_manager import SessionManager
+
+
+class FakeRecorder:
+    def __init__(self):
+        self.stopped = False
+
+    def stop_recording(self):
+        self.stopped = True
+
+
+class FakeRobot:
+    def __init__(self):
+        self.recorder = FakeRecorder()
+        self.closed = False
+        self.websocket = None
+
+    def shutdown(self):
+        self.closed = True
+
+    def attach_websocket(self, websocket, loop):
+        self.websocket = websocket
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_idle_session_evicted_at_deadline():
+    async def scenario():
+        manager = SessionManager(idle_timeout=0.05)
+        manager.start()
+        robot = FakeRobot()
+        manager.add("u1", robot)
+        await asyncio.sleep(0.02)
+        assert "u1" in manager
+        await asyncio.sleep(0.1)
+        await manager.stop()
+        return robot, manager
+
+    robot, manager = run(scenario())
+    assert robot.closed and "u1" not in manager
+
+
+def test_touch_extends_deadline():
+    async def scenario():
+        manager = SessionManager(idle_timeout=0.1)
+        manager.start()
+        manager.add("u1", FakeRobot())
+        for _ in range(4):
+            await asyncio.sleep(0.05)
+            manager.touch("u1")
+        alive = "u1" in manager
+        await asyncio.sleep(0.2)
+        gone = "u1" not in manager
+        await manager.stop()
+        return alive, gone
+
+    assert run(scenario()) == (True, True)
+
+
+def test_detach_without_grace_evicts_immediately():
+    async def scenario():
+        manager = SessionManager(idle_timeout=10)
+        robot = FakeRobot()
+        connection = manager.add("u1", robot)
+        await manager.detach("u1", connection)
+        return robot, manager
+
+    robot, manager = run(scenario())
+    assert robot.closed and len(manager) == 0
+
+
+def test_reconnect_within_grace_reuses_session():
+    async def scenario():
+        manager = SessionManager(idle_timeout=10, reconnect_grace=0.1)
+        manager.start()
+        robot = FakeRobot()
+        first = manager.add("u1", robot)
+        await manager.detach("u1", first)
+        assert robot.recorder.stopped and not robot.closed
+        second = manager.attach("u1", "ws2", None)
+        # 旧连接的断开晚于重连到达，不能释放新连接
+        await manager.detach("u1", first)
+        await asyncio.sleep(0.2)
+        result = (manager.get("u1") is robot, robot.websocket, robot.closed, second)
+        await manager.stop()
+        return result
+
+    assert run(scenario()) == (True, "ws2", False, 2)
+
+
+def test_session_evicted_after_grace():
+    async def scenario():
+        manager = SessionManager(idle_timeout=10, reconnect_grace=0.05)
+        manager.start()
+        robot = FakeRobot()
+        await manager.detach("u1", manager.add("u1", robot))
+        await asyncio.sleep(0.15)
+        result = (robot.closed, "u1" in manager)
+        await manager.stop()
+        return result
+
+    assert run(scenario()) == (True, False)
+
+
+def test_stop_closes_all_sessions():
+    async def scenario():
+        manager = SessionManager(idle_timeout=10)
+        manager.start()
+        robots = [FakeRobot() for _ in range(3)]
+        for i, robot in enumerate(robots):
+            manager.add(f"u{i}", robot)
+        await manager.stop()
+        return robots, manager
+
+    robots, manager = run(scenario())
+    assert all(r.closed for r in robots) and len(manager) == 0
@@ -0,0 +1,206 @@
+"""
+百聆 WebSocket 多会话压测工具
+
+同时打开 N 个 /ws?user_id=... 连接，按实时节奏发送预录的 16kHz 单声道 PCM，
+模拟前端回传 playback_status，统计每轮从用户说完到收到第一个音频字节的时延，
+以及服务端的丢弃计数、内存和 CPU。
+
+离线压测（LLM/TTS 使用本地替身），在仓库根目录运行：
+    python server.py --config_path config/config_loadtest.yaml
+    python -m tools.loadtest --url wss://127.0.0.1:8000/ws --wav test.wav -n 20 --turns 5 --insecure
+"""
+import argparse
+import asyncio
+import json
+import ssl
+import struct
+import time
+import wave
+
+import httpx
+import websockets
+
+from bailing.codec import PCM_CHUNK_HEADER, PCM_CHUNK_MAGIC, payload_duration
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 512
+FRAME_BYTES = FRAME_SAMPLES * 2
+FRAME_SECONDS = FRAME_SAMPLES / SAMPLE_RATE
+
+
+def load_pcm(wav_file):
+    with wave.open(wav_file, "rb") as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError("需要 16kHz 单声道 16bit 的 wav 文件")
+        return wf.readframes(wf.getnframes())
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def audio_duration(data):
+    """估算收到的一段音频的播放时长"""
+    if data[:4] == PCM_CHUNK_MAGIC:
+        _, _, _, sample_rate, _, codec = PCM_CHUNK_HEADER.unpack_from(data)
+        return payload_duration(codec, data[PCM_CHUNK_HEADER.size:], sample_rate)
+    if data[:4] == b"RIFF":
+        sample_rate, = struct.unpack_from("<I", data, 24)
+        channels, = struct.unpack_from("<H", data, 22)
+        return (len(data) - 44) / 2 / channels / sample_rate
+    return 0.0
+
+
+class Session:
+    def __init__(self, index, args, pcm):
+        self.index = index
+        self.args = args
+        self.pcm = pcm
+        self.latencies = []
+        self.missed = 0
+        self.audio_bytes = 0
+        self.first_audio_event = asyncio.Event()
+        self.first_audio_time = None
+        self.waiting = False
+        self.playback_end = 0.0
+
+    async def _send_realtime(self, ws, data):
+        """按实时节奏发送 PCM"""
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        for offset in range(0, len(data), FRAME_BYTES):
+            await ws.send(data[offset:offset + FRAME_BYTES])
+            next_time += FRAME_SECONDS
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+
+    async def _send_silence(self, ws, seconds):
+        await self._send_realtime(ws, b"\x00" * FRAME_BYTES * int(seconds / FRAME_SECONDS))
+
+    async def _receiver(self, ws):
+        async for message in ws:
+            if isinstance(message, str):
+                continue
+            now = time.time()
+            self.audio_bytes += len(message)
+            if self.waiting and self.first_audio_time is None:
+                self.first_audio_time = now
+                self.first_audio_event.set()
+            # 模拟前端播放：收到音频即播放，播放完回传 completed
+            self.playback_end = max(self.playback_end, now) + audio_duration(message)
+            await ws.send(json.dumps({"type": "playback_status", "status": "playing", "queue_size": 1}))
+            asyncio.get_running_loop().call_later(
+                max(0.0, self.playback_end - now), lambda: asyncio.ensure_future(self._playback_done(ws)))
+
+    async def _playback_done(self, ws):
+        if time.time() >= self.playback_end:
+            try:
+                await ws.send(json.dumps({"type": "playback_status", "status": "completed", "queue_size": 0}))
+            except Exception:
+                pass
+
+    async def run(self):
+        args = self.args
+        url = f"{args.url}?user_id={args.prefix}-{self.index}&stream={int(args.stream)}&codec=pcm"
+        ssl_context = None
+        if url.startswith("wss://"):
+            ssl_context = ssl.create_default_context()
+            if args.insecure:
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+        async with websockets.connect(url, ssl=ssl_context, max_size=None) as ws:
+            receiver = asyncio.create_task(self._receiver(ws))
+            try:
+                # 错开各会话的开始时间
+                await self._send_silence(ws, args.ramp * self.index / max(1, args.sessions))
+                for _ in range(args.turns):
+                    self.first_audio_time = None
+                    self.first_audio_event.clear()
+                    await self._send_realtime(ws, self.pcm)
+                    end_of_speech = time.time()
+                    self.waiting = True
+                    # 一边发送静音（前端麦克风一直在推流），一边等待第一个音频字节
+                    silence = asyncio.create_task(self._send_silence(ws, args.timeout))
+                    try:
+                        await asyncio.wait_for(self.first_audio_event.wait(), timeout=args.timeout)
+                        self.latencies.append(self.first_audio_time - end_of_speech)
+                    except asyncio.TimeoutError:
+                        self.missed += 1
+                    finally:
+                        self.waiting = False
+                        silence.cancel()
+                    # 等回复播完再开始下一轮
+                    await self._send_silence(ws, max(args.gap, self.playback_end - time.time()))
+            finally:
+                receiver.cancel()
+
+
+async def poll_server(args, samples, stop):
+    """定期采集服务端 /stats"""
+    base = args.url.replace("wss://", "https://").replace("ws://", "http://").rsplit("/ws", 1)[0]
+    async with httpx.AsyncClient(verify=not args.insecure, timeout=5) as client:
+        while not stop.is_set():
+            try:
+                resp = await client.get(f"{base}/stats")
+                samples.append((time.time(), resp.json()))
+            except Exception as e:
+                print(f"获取 /stats 失败: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=args.poll)
+            except asyncio.TimeoutError:
+                pass
+
+
+def total_drops(stats):
+    return sum(v for k, v in stats.get("metrics", {}).items() if k.startswith("queue.") and k.endswith(".drops"))
+
+
+async def main(args):
+    pcm = load_pcm(args.wav)
+    sessions = [Session(i, args, pcm) for i in range(args.sessions)]
+    samples, stop = [], asyncio.Event()
+    poller = asyncio.create_task(poll_server(args, samples, stop))
+    start = time.time()
+    results = await asyncio.gather(*(s.run() for s in sessions), return_exceptions=True)
+    elapsed = time.time() - start
+    stop.set()
+    await poller
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    latencies = [x for s in sessions for x in s.latencies]
+    missed = sum(s.missed for s in sessions)
+    print(f"\n会话数 {args.sessions}，每会话 {args.turns} 轮，耗时 {elapsed:.1f} 秒，连接失败 {len(errors)}")
+    for e in errors[:5]:
+        print(f"  连接错误: {e!r}")
+    print(f"完成轮次 {len(latencies)}，超时未收到音频 {missed}")
+    print(f"首包时延 p50 {percentile(latencies, 50) * 1000:.0f} ms，"
+          f"p95 {percentile(latencies, 95) * 1000:.0f} ms，p99 {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"下行音频 {sum(s.audio_bytes for s in sessions) * 8 / elapsed / 1000:.1f} kbit/s")
+    if len(samples) >= 2:
+        (t0, first), (t1, last) = samples[0], samples[-1]
+        cpu = (last.get("cpu_time", 0) - first.get("cpu_time", 0)) / (t1 - t0) * 100
+        print(f"服务端 RSS 峰值 {max(s['rss_mb'] for _, s in samples):.1f} MB，"
+              f"平均 CPU {cpu:.0f}%，队列丢弃 {total_drops(last) - total_drops(first)}")
+        # 开启 Resources 时各模型排队等待推理配额的时间
+        for name, value in sorted(last.get("metrics", {}).items()):
+            if name.startswith("resource.") and name.endswith(".wait") and value.get("count"):
+                print(f"  {name[len('resource.'):-len('.wait')]} 等待推理配额 p50 {value['p50_ms']:.1f} ms，"
+                      f"p95 {value['p95_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="百聆 WebSocket 压测工具")
+    parser.add_argument("--url", type=str, default="wss://127.0.0.1:8000/ws", help="WebSocket 地址")
+    parser.add_argument("--wav", type=str, required=True, help="16kHz 单声道 16bit 语音文件，一轮说一次")
+    parser.add_argument("-n", "--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话的对话轮数")
+    parser.add_argument("--timeout", type=float, default=15, help="等待首个音频的超时时间(秒)")
+    parser.add_argument("--gap", type=float, default=1.0, help="两轮之间至少间隔的静音(秒)")
+    parser.add_argument("--ramp", type=float, default=5.0, help="所有会话在多少秒内陆续开始")
+    parser.add_argument("--poll", type=float, default=1.0, help="采集 /stats 的间隔(秒)")
+    parser.add_argument("--prefix", type=str, default="loadtest", help="user_id 前缀")
+    parser.add_argument("--stream", action="store_true", help="使用流式 PCM 下行")
+    parser.add_argument("--insecure", action="store_true", help="不校验自签名证书")
+    asyncio.run(main(parser.parse_args()))